@@ -0,0 +1,129 @@
+# app/action_engine.py
+import copy
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from pydantic import ValidationError
+
+from app.models import EventTimeSlot, SuggestionCard
+
+# Card action -> resulting card status
+ACTION_STATUSES = {
+    "accept": "accepted",
+    "reject": "rejected",
+    "snooze": "snoozed",
+    "modify": "modified",
+}
+
+# Fields a "modify" action may change directly
+MODIFIABLE_FIELDS = {"type", "title", "description", "primary_action", "alternatives", "metadata"}
+
+class ActionError(ValueError):
+    """Raised when an action or its modifications are invalid"""
+
+class ActionEngine:
+    """Applies card actions locally; only free-form edits need the model"""
+
+    def __init__(self, default_snooze_minutes: Optional[int] = None):
+        self.default_snooze_minutes = default_snooze_minutes or int(os.getenv("ACTION_SNOOZE_MINUTES", "60"))
+
+    def apply(self, card: Dict, action: str, modifications: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Return the updated card and whether follow-up generation is needed"""
+        action = (action or "").strip().lower()
+        if action not in ACTION_STATUSES:
+            raise ActionError(f"Unknown action '{action}'")
+        modifications = modifications or {}
+        if not isinstance(modifications, dict):
+            raise ActionError("modifications must be an object")
+
+        updated = copy.deepcopy(card)
+        updated["status"] = ACTION_STATUSES[action]
+        metadata = dict(updated.get("metadata") or {})
+        needs_generation = False
+
+        if action == "snooze":
+            minutes = modifications.get("snooze_minutes", self.default_snooze_minutes)
+            if not isinstance(minutes, (int, float)) or isinstance(minutes, bool) or minutes <= 0:
+                raise ActionError("snooze_minutes must be a positive number")
+            metadata["snoozed_until"] = (datetime.utcnow() + timedelta(minutes=minutes)).isoformat()
+
+        elif action == "modify":
+            instructions = modifications.get("instructions")
+            if instructions is not None and not isinstance(instructions, str):
+                raise ActionError("instructions must be a string")
+            changes = {k: v for k, v in modifications.items() if k != "instructions"}
+            unknown = set(changes) - MODIFIABLE_FIELDS
+            if unknown:
+                raise ActionError(f"Cannot modify fields: {', '.join(sorted(unknown))}")
+            if not changes and not instructions:
+                raise ActionError("modify requires modifications")
+
+            if "primary_action" in changes:
+                primary_action = dict(updated.get("primary_action") or {})
+                primary_action.update(changes.pop("primary_action") or {})
+                changes["primary_action"] = primary_action
+            if "metadata" in changes:
+                metadata.update(changes.pop("metadata") or {})
+            updated.update(changes)
+            self._validate(updated)
+
+            # Free-form edits ("make it after lunch") need the model
+            needs_generation = bool(instructions and instructions.strip())
+
+        updated["metadata"] = metadata
+        return {
+            "card": updated,
+            "status": updated["status"],
+            "needs_generation": needs_generation,
+            "message": f"Action '{action}' completed"
+        }
+
+    @staticmethod
+    def _validate(card: Dict):
+        primary_action = card.get("primary_action") or {}
+        if not isinstance(primary_action, dict):
+            raise ActionError("primary_action must be an object")
+
+        try:
+            SuggestionCard(
+                card_id=card.get("card_id", ""),
+                type=card.get("type", ""),
+                title=card.get("title", ""),
+                description=card.get("description") or "",
+                primary_action=primary_action,
+                alternatives=card.get("alternatives") or [],
+                confidence=card.get("confidence", 0.0),
+                metadata=card.get("metadata") or {},
+                created_at=card.get("created_at") or "",
+                status=card.get("status", "pending")
+            )
+            if "start_time" in primary_action or "end_time" in primary_action:
+                slot = EventTimeSlot(
+                    start_time=primary_action.get("start_time", ""),
+                    end_time=primary_action.get("end_time", primary_action.get("start_time", ""))
+                )
+                _check_slot(slot)
+            for alternative in card.get("alternatives") or []:
+                if not isinstance(alternative, dict):
+                    raise ActionError("alternatives must be a list of time slots")
+                _check_slot(EventTimeSlot(**alternative))
+        except ValidationError as e:
+            raise ActionError(f"Invalid modifications: {e}")
+        if not str(card.get("title", "")).strip():
+            raise ActionError("title must not be empty")
+
+def _naive_utc(value: datetime) -> datetime:
+    """Naive timestamps are UTC already; aware ones are converted, so the two compare"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _check_slot(slot: EventTimeSlot):
+    try:
+        start = _naive_utc(datetime.fromisoformat(slot.start_time))
+        end = _naive_utc(datetime.fromisoformat(slot.end_time))
+    except ValueError:
+        raise ActionError("start_time and end_time must be ISO 8601 timestamps")
+    if end < start:
+        raise ActionError("end_time must not be before start_time")
@@ -0,0 +1,212 @@
+# app/admission.py
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from app.metrics import ADMISSION_DECISIONS, ADMISSION_WAIT
+
+# Lower runs first: captures a user is waiting on, then batches/jobs, then
+# card refinements and health checks
+INTERACTIVE = "interactive"
+BATCH = "batch"
+BACKGROUND = "background"
+PRIORITIES = {INTERACTIVE: 0, BATCH: 1, BACKGROUND: 2}
+
+def parse_timeouts(spec: str) -> Dict[str, float]:
+    """Parse "interactive=2,batch=10" (seconds per priority)"""
+    timeouts = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        priority, _, seconds = item.partition("=")
+        timeouts[priority.strip().lower()] = float(seconds)
+    return timeouts
+
+class AdmissionError(Exception):
+    """A request turned away; carries the HTTP status and a Retry-After hint"""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(self.retry_after)}
+
+class RateLimited(AdmissionError):
+    """The user's token bucket is empty"""
+
+    status_code = 429
+
+class Overloaded(AdmissionError):
+    """No LLM slot came free in time, or the queue for one is full"""
+
+class TokenBucket:
+    """`capacity` tokens refilled at `rate` per second
+
+    A charge larger than the capacity (a big batch) is admitted once the
+    bucket is full and leaves it in debt, so it still pays in full.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, cost: float) -> float:
+        """Seconds until `cost` tokens are available (0 if they are now)"""
+        needed = min(cost, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        if self.rate <= 0:
+            return math.inf
+        return (needed - self.tokens) / self.rate
+
+class PriorityLimiter:
+    """A concurrency limit whose waiters are served by priority, then arrival
+
+    Released slots pass straight to the next waiter, so a late arrival can
+    never overtake the queue.
+    """
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        # [priority, sequence, future]; entries of waiters that gave up stay
+        # until popped and are skipped then
+        self._waiters: List[List[Any]] = []
+        self._sequence = itertools.count()
+
+    async def acquire(self, priority: int, timeout: float) -> bool:
+        """Take a slot, waiting up to `timeout`; False if none came free or the queue is full"""
+        if self.active < self.limit and not self.queued:
+            self.active += 1
+            return True
+        if self.queued >= self.max_queue or timeout <= 0:
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._sequence), future])
+        self.queued += 1
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            # Granted just as we were cancelled: hand the slot on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            if not future.done() or future.cancelled():
+                self.queued -= 1
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.queued -= 1
+                future.set_result(None)
+                return
+        self.active -= 1
+
+class AdmissionController:
+    """Per-user token buckets in front of captures, and a priority-aware cap on LLM calls
+
+    Captures spend one token per item from their user's bucket and are
+    rejected with 429 when it is empty. Every LLM call then needs one of
+    ADMISSION_LLM_CONCURRENCY slots; a call that cannot get one within its
+    priority's queue timeout is shed, and captures degrade to rule-based
+    cards instead (ADMISSION_DEGRADE).
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: Optional[float] = None,
+        burst: Optional[float] = None,
+        llm_concurrency: Optional[int] = None
+    ):
+        self.enabled = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+        self.rate_per_second = (rate_per_minute or float(os.getenv("ADMISSION_RATE_PER_MINUTE", "30"))) / 60
+        self.burst = burst or float(os.getenv("ADMISSION_BURST", "10"))
+        self.max_users = int(os.getenv("ADMISSION_MAX_USERS", "100000"))
+        self.degrade = os.getenv("ADMISSION_DEGRADE", "true").lower() == "true"
+        self.queue_timeouts = {INTERACTIVE: 2.0, BATCH: 10.0, BACKGROUND: 1.0}
+        self.queue_timeouts.update(parse_timeouts(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "")))
+
+        self.limiter = PriorityLimiter(
+            llm_concurrency or int(os.getenv("ADMISSION_LLM_CONCURRENCY", "8")),
+            int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+        )
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def admit(self, costs: Dict[str, float], priority: str = INTERACTIVE):
+        """Charge each user's bucket, all or nothing; raises RateLimited"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        buckets = {user_id: self._bucket(user_id, now) for user_id in costs}
+        wait = max(buckets[user_id].wait_for(cost) for user_id, cost in costs.items())
+        if wait > 0:
+            ADMISSION_DECISIONS.inc(decision="rate_limited", priority=priority)
+            raise RateLimited("Too many captures, slow down", min(wait, 3600))
+        for user_id, cost in costs.items():
+            buckets[user_id].tokens -= cost
+        ADMISSION_DECISIONS.inc(decision="admitted", priority=priority)
+
+    @asynccontextmanager
+    async def llm_slot(self, priority: str = INTERACTIVE):
+        """Hold one LLM concurrency slot for the block; raises Overloaded"""
+        if not self.enabled:
+            yield
+            return
+        timeout = self.queue_timeouts.get(priority, self.queue_timeouts[INTERACTIVE])
+        started = time.perf_counter()
+        acquired = await self.limiter.acquire(PRIORITIES.get(priority, len(PRIORITIES)), timeout)
+        ADMISSION_WAIT.observe(time.perf_counter() - started, priority=priority)
+        if not acquired:
+            ADMISSION_DECISIONS.inc(decision="shed", priority=priority)
+            raise Overloaded("LLM capacity exhausted, try again shortly", timeout)
+        try:
+            yield
+        finally:
+            self.limiter.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.limiter.active,
+            "queued": self.limiter.queued,
+            "limit": self.limiter.limit,
+            "users": len(self._buckets)
+        }
+
+    def _bucket(self, user_id: str, now: float) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_per_second, self.burst, now)
+            self._buckets[user_id] = bucket
+            # Evicted buckets were idle longest; they would be nearly full anyway
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket.refill(now)
+        return bucket
@@ -0,0 +1,161 @@
+# app/audio.py
+import asyncio
+import codecs
+import importlib
+import logging
+import os
+import tempfile
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional
+
+from app.metrics import AUDIO_BYTES
+
+logger = logging.getLogger(__name__)
+
+class AudioError(ValueError):
+    """Raised when an upload breaks the protocol or its limits"""
+
+class AudioUpload:
+    """One recording arriving as binary WebSocket frames
+
+    Frames are written to a spool that stays in memory up to
+    AUDIO_SPOOL_MEMORY_BYTES and then moves to a temporary file, so memory
+    per upload is bounded however long the recording is. Reads reuse one
+    buffer and hand out memoryview slices of it, never copies.
+    """
+
+    def __init__(self, content_type: str = "audio/webm", upload_id: Optional[str] = None):
+        self.upload_id = upload_id or str(uuid.uuid4())
+        self.content_type = content_type
+        self.max_bytes = int(os.getenv("AUDIO_MAX_BYTES", str(25 * 1024 * 1024)))
+        self.chunk_bytes = int(os.getenv("AUDIO_CHUNK_BYTES", str(64 * 1024)))
+        self.size = 0
+        self._file = tempfile.SpooledTemporaryFile(
+            max_size=int(os.getenv("AUDIO_SPOOL_MEMORY_BYTES", str(1024 * 1024)))
+        )
+
+    def write(self, data: bytes):
+        if self.size + len(data) > self.max_bytes:
+            raise AudioError(f"Recording exceeds {self.max_bytes} bytes")
+        self._file.write(memoryview(data))
+        self.size += len(data)
+        AUDIO_BYTES.inc(len(data))
+
+    @property
+    def on_disk(self) -> bool:
+        return self._file._rolled
+
+    async def chunks(self) -> AsyncIterator[memoryview]:
+        """The recording from the start, as views into one reused buffer
+
+        Each view is only valid until the next one is requested.
+        """
+        self._file.seek(0)
+        buffer = bytearray(self.chunk_bytes)
+        view = memoryview(buffer)
+        try:
+            while True:
+                if self.on_disk:
+                    read = await asyncio.to_thread(self._file.readinto, buffer)
+                else:
+                    read = self._file.readinto(buffer)
+                if not read:
+                    return
+                yield view[:read]
+        finally:
+            view.release()
+
+    def file(self):
+        """The spool itself, rewound, for backends that upload file objects"""
+        self._file.seek(0)
+        return self._file
+
+    def close(self):
+        self._file.close()
+
+class Transcriber:
+    """Turns a finished upload into text"""
+
+    # Whether transcription spends LLM quota (and so needs an admission slot)
+    uses_llm = False
+
+    async def transcribe(self, upload: AudioUpload) -> str:
+        raise NotImplementedError
+
+class StubTranscriber(Transcriber):
+    """For tests and local development only: no speech recognition
+
+    text/* uploads are decoded as the transcript itself; anything else
+    yields AUDIO_STUB_TRANSCRIPT. Used only when AUDIO_TRANSCRIBER=stub.
+    """
+
+    def __init__(self):
+        self.transcript = os.getenv("AUDIO_STUB_TRANSCRIPT", "Remind me to review this recording")
+
+    async def transcribe(self, upload: AudioUpload) -> str:
+        if not upload.content_type.startswith("text/"):
+            async for _ in upload.chunks():
+                pass
+            return self.transcript
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        parts = [decoder.decode(chunk) async for chunk in upload.chunks()]
+        parts.append(decoder.decode(b"", final=True))
+        return "".join(parts).strip()
+
+class GeminiTranscriber(Transcriber):
+    """Uploads the spool through the Gemini File API and asks for a transcript"""
+
+    uses_llm = True
+
+    def __init__(self):
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable is required")
+        # Imported here: the SDK takes most of a second to import
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.genai = genai
+        self.model = genai.GenerativeModel(os.getenv("AUDIO_TRANSCRIBE_MODEL", "gemini-1.5-flash"))
+        self.timeout = float(os.getenv("AUDIO_TRANSCRIBE_TIMEOUT_SECONDS", "60"))
+
+    async def transcribe(self, upload: AudioUpload) -> str:
+        # Resumable uploads read the spool in chunks, never all at once
+        uploaded = await asyncio.to_thread(
+            self.genai.upload_file, upload.file(), mime_type=upload.content_type
+        )
+        try:
+            response = await asyncio.wait_for(
+                self.model.generate_content_async([
+                    "Transcribe this recording verbatim. Reply with the transcript only.",
+                    uploaded
+                ]),
+                timeout=self.timeout
+            )
+            return response.text.strip()
+        finally:
+            try:
+                await asyncio.to_thread(uploaded.delete)
+            except Exception as e:
+                logger.warning("Could not delete uploaded audio %s: %s", uploaded.name, e)
+
+# name -> "module:Class", as for LLM providers
+TRANSCRIBERS: Dict[str, str] = {
+    "stub": "app.audio:StubTranscriber",
+    "gemini": "app.audio:GeminiTranscriber",
+}
+
+def create_transcriber(name: Optional[str] = None) -> Any:
+    """Build the transcriber named by AUDIO_TRANSCRIBER
+
+    "auto" (the default) means gemini when an API key is set; without one
+    audio capture is unavailable rather than answered with made-up text.
+    """
+    name = (name or os.getenv("AUDIO_TRANSCRIBER", "auto")).lower()
+    if name == "auto":
+        if not os.getenv("GEMINI_API_KEY"):
+            raise AudioError("Audio capture is not configured")
+        name = "gemini"
+    if name not in TRANSCRIBERS:
+        raise ValueError(f"Unknown transcriber '{name}' (known: {', '.join(TRANSCRIBERS)})")
+    module_name, class_name = TRANSCRIBERS[name].split(":")
+    return getattr(importlib.import_module(module_name), class_name)()
@@ -0,0 +1,491 @@
+# app/benchmark.py
+"""End-to-end load and latency benchmark
+
+Runs the app in-process (ASGI transport) or under uvicorn against FakeLLMClient,
+drives captures, card actions, card listings and many WebSocket clients, and
+reports throughput, p50/p95/p99 per endpoint and WebSocket delivery lag.
+
+    python -m app.benchmark --captures 500 --concurrency 50 --sockets 200
+    python -m app.benchmark --mode uvicorn --output run.json
+    python -m app.benchmark --compare baseline.json --tolerance 0.15
+    python -m app.benchmark --import-time --captures 0 --actions 0 --lists 0
+    python -m app.benchmark --no-router
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.codec import loads
+
+TOPICS = [
+    "meeting with the design team", "schedule dentist appointment",
+    "remind me to call mom", "finish the quarterly report",
+    "book flights for the conference", "reminder to water the plants",
+    "schedule a 1:1 with alex", "review pull requests"
+]
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def summarize(latencies: List[float], errors: int, duration: float) -> Dict[str, Any]:
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / duration, 2) if duration else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2) if latencies else 0.0
+    }
+
+class InProcessWebSocket:
+    """Minimal ASGI WebSocket client for driving the app without a server"""
+
+    def __init__(self, app, path: str):
+        self.app = app
+        self.path = path
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": self.path,
+            "raw_path": self.path.encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"benchmark")],
+            "client": ("127.0.0.1", 0),
+            "server": ("benchmark", 80),
+            "subprotocols": []
+        }
+        self._task = asyncio.create_task(self.app(scope, self._outbox.get, self._inbox.put))
+        await self._outbox.put({"type": "websocket.connect"})
+        message = await self._inbox.get()
+        if message["type"] != "websocket.accept":
+            raise RuntimeError(f"WebSocket rejected: {message}")
+
+    async def recv(self) -> str:
+        message = await self._inbox.get()
+        if message["type"] == "websocket.close":
+            raise ConnectionError("WebSocket closed by server")
+        return message.get("text") or message.get("bytes", b"").decode("utf-8")
+
+    async def send(self, text: str):
+        await self._outbox.put({"type": "websocket.receive", "text": text})
+
+    async def close(self):
+        await self._outbox.put({"type": "websocket.disconnect", "code": 1000})
+        if self._task is not None:
+            with contextlib.suppress(Exception):
+                await asyncio.wait_for(self._task, 5)
+
+class RemoteWebSocket:
+    """WebSocket client over a real socket (uvicorn mode)"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self._ws = None
+
+    async def connect(self):
+        import websockets
+        self._ws = await websockets.connect(self.url, max_queue=None)
+
+    async def recv(self) -> str:
+        return await self._ws.recv()
+
+    async def send(self, text: str):
+        await self._ws.send(text)
+
+    async def close(self):
+        await self._ws.close()
+
+class Benchmark:
+    """One benchmark run against a base URL (or the ASGI app directly)"""
+
+    def __init__(self, args: argparse.Namespace, client: httpx.AsyncClient, open_socket):
+        self.args = args
+        self.client = client
+        self.open_socket = open_socket
+        self.random = random.Random(args.seed)
+        self.users = [f"bench_user_{i}" for i in range(max(args.sockets, args.users))]
+        self.watched_users = set(self.users[:args.sockets])
+
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.error_samples: List[str] = []
+        self.card_ids: List[str] = []
+
+        # session_id -> perf_counter timestamps
+        self.sent_at: Dict[str, float] = {}
+        self.expected: List[str] = []
+        self.answered_at: Dict[str, float] = {}
+        self.delivered_at: Dict[str, float] = {}
+        self.ws_messages = 0
+        self.ws_failures = 0
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except Exception as e:
+            self._error(endpoint, repr(e))
+            return None
+        elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            self._error(endpoint, f"{response.status_code} {response.text[:200]}")
+            return None
+        self.latencies[endpoint].append(elapsed)
+        return response
+
+    def _error(self, endpoint: str, detail: str):
+        self.errors[endpoint] += 1
+        if len(self.error_samples) < 10:
+            self.error_samples.append(f"{endpoint}: {detail}")
+
+    async def capture(self):
+        user_id = self.random.choice(self.users)
+        text = self.random.choice(TOPICS)
+        if self.random.random() >= self.args.duplicate_rate:
+            text = f"{text} #{self.random.randrange(10 ** 9)}"
+
+        started = time.perf_counter()
+        response = await self.request(
+            "POST /api/capture/text", "POST", "/api/capture/text",
+            json={"text": text, "user_id": user_id}
+        )
+        if response is None:
+            return
+        body = response.json()
+        self.sent_at[body["session_id"]] = started
+        self.answered_at[body["session_id"]] = time.perf_counter()
+        if user_id in self.watched_users:
+            self.expected.append(body["session_id"])
+        self.card_ids.extend(card["card_id"] for card in body["cards"])
+
+    async def act(self):
+        if not self.card_ids:
+            return await self.capture()
+        card_id = self.card_ids.pop(self.random.randrange(len(self.card_ids)))
+        action = self.random.choice(["accept", "reject", "snooze"])
+        await self.request(
+            "POST /api/cards/{card_id}/action", "POST", f"/api/cards/{card_id}/action",
+            json={"action": action}
+        )
+
+    async def list_cards(self):
+        user_id = self.random.choice(self.users)
+        await self.request(
+            "GET /api/user/{user_id}/cards", "GET", f"/api/user/{user_id}/cards",
+            params={"limit": self.args.page_size}
+        )
+
+    async def listen(self, user_id: str, ready: asyncio.Event, connected: List[int]):
+        try:
+            ws = self.open_socket(f"/ws/{user_id}")
+            await ws.connect()
+        except Exception as e:
+            self.ws_failures += 1
+            self._error("WS /ws/{user_id}", repr(e))
+            connected.append(0)
+            if len(connected) == self.args.sockets:
+                ready.set()
+            return
+        connected.append(1)
+        if len(connected) == self.args.sockets:
+            ready.set()
+        try:
+            while True:
+                message = loads(await ws.recv())
+                self.ws_messages += 1
+                if message.get("type") == "new_cards":
+                    self.delivered_at.setdefault(message["session_id"], time.perf_counter())
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            self.ws_failures += 1
+        finally:
+            with contextlib.suppress(Exception):
+                await ws.close()
+
+    async def run(self) -> Dict[str, Any]:
+        args = self.args
+        ready = asyncio.Event()
+        connected: List[int] = []
+        listeners = [
+            asyncio.create_task(self.listen(user_id, ready, connected))
+            for user_id in self.users[:args.sockets]
+        ]
+        if listeners:
+            await ready.wait()
+
+        # Weighted operation mix, driven by a fixed number of workers
+        operations = (
+            [self.capture] * args.captures
+            + [self.act] * args.actions
+            + [self.list_cards] * args.lists
+        )
+        self.random.shuffle(operations)
+        queue: asyncio.Queue = asyncio.Queue()
+        for operation in operations:
+            queue.put_nowait(operation)
+
+        async def worker():
+            while not queue.empty():
+                await queue.get_nowait()()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        duration = time.perf_counter() - started
+
+        # Give in-flight pushes a moment to land before tearing sockets down
+        await asyncio.sleep(args.drain_seconds)
+        for listener in listeners:
+            listener.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+
+        return self.report(duration, sum(connected))
+
+    def report(self, duration: float, sockets_connected: int) -> Dict[str, Any]:
+        endpoints = sorted(set(self.latencies) | set(self.errors))
+        results = {
+            endpoint: summarize(self.latencies[endpoint], self.errors[endpoint], duration)
+            for endpoint in endpoints
+        }
+
+        watched = [s for s in self.expected if s in self.delivered_at]
+        delivery = [(self.delivered_at[s] - self.sent_at[s]) * 1000 for s in watched]
+        after_response = [(self.delivered_at[s] - self.answered_at[s]) * 1000 for s in watched]
+        all_latencies = [value for values in self.latencies.values() for value in values]
+
+        return {
+            "duration_s": round(duration, 3),
+            "total": summarize(all_latencies, sum(self.errors.values()), duration),
+            "endpoints": results,
+            "websocket": {
+                "sockets": self.args.sockets,
+                "connected": sockets_connected,
+                "failures": self.ws_failures,
+                "messages": self.ws_messages,
+                "captures_pushed": len(watched),
+                "captures_expected": len(self.expected),
+                "delivery_p50_ms": round(percentile(delivery, 50), 2),
+                "delivery_p95_ms": round(percentile(delivery, 95), 2),
+                "delivery_p99_ms": round(percentile(delivery, 99), 2),
+                # Negative: the push beat the HTTP response back to the client
+                "lag_after_response_p50_ms": round(percentile(after_response, 50), 2),
+                "lag_after_response_p99_ms": round(percentile(after_response, 99), 2)
+            },
+            "error_samples": self.error_samples
+        }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """List the latency and throughput regressions of current against baseline"""
+    regressions = []
+
+    def check(name: str, now: Dict[str, Any], before: Dict[str, Any]):
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if before.get(key) and now.get(key, 0) > before[key] * (1 + tolerance):
+                regressions.append(f"{name} {key}: {before[key]} -> {now[key]}")
+        if before.get("throughput_rps") and now.get("throughput_rps", 0) < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name} throughput_rps: {before['throughput_rps']} -> {now['throughput_rps']}")
+        if now.get("errors", 0) > before.get("errors", 0):
+            regressions.append(f"{name} errors: {before.get('errors', 0)} -> {now['errors']}")
+
+    for endpoint, before in baseline.get("endpoints", {}).items():
+        check(endpoint, current["endpoints"].get(endpoint, {}), before)
+
+    ws_now, ws_before = current["websocket"], baseline.get("websocket", {})
+    for key in ("delivery_p95_ms", "delivery_p99_ms"):
+        if ws_before.get(key) and ws_now[key] > ws_before[key] * (1 + tolerance):
+            regressions.append(f"websocket {key}: {ws_before[key]} -> {ws_now[key]}")
+
+    startup_now, startup_before = current.get("startup", {}), baseline.get("startup", {})
+    for key in ("import_ms", "lifespan_ms"):
+        if startup_before.get(key) and startup_now.get(key, 0) > startup_before[key] * (1 + tolerance):
+            regressions.append(f"startup {key}: {startup_before[key]} -> {startup_now[key]}")
+    return regressions
+
+def stage_breakdown() -> Dict[str, Any]:
+    """Server-side time per stage/operation, from the in-process metrics"""
+    from app.metrics import STAGE_SECONDS
+
+    stages = {}
+    for (stage, operation), series in sorted(STAGE_SECONDS.values.items()):
+        total, count = series[-2], series[-1]
+        stages[f"{stage}:{operation}"] = {
+            "count": int(count),
+            "avg_ms": round(total / count * 1000, 3) if count else 0.0
+        }
+    return stages
+
+def measure_import(module: str = "app.main", top: int = 10) -> Dict[str, Any]:
+    """Cold import time of module in a fresh interpreter (python -X importtime)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env={**os.environ, "LOG_LEVEL": "WARNING"}
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(cumulative) / 1000))
+    total = next((ms for name, ms in imports if name == module), 0.0)
+    slowest = sorted((item for item in imports if item[0] != module), key=lambda item: -item[1])[:top]
+    return {
+        "module": module,
+        "import_ms": round(total, 1),
+        "slowest_imports": [{"module": name, "cumulative_ms": round(ms, 1)} for name, ms in slowest]
+    }
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    fake = None
+    if args.url:
+        # External server: its own LLM backend, nothing to inject
+        base_url = args.url.rstrip("/")
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+            ws_base = "ws" + base_url[len("http"):]
+            return await Benchmark(args, client, lambda path: RemoteWebSocket(ws_base + path)).run()
+
+    if not os.getenv("SERA_DB_PATH"):
+        os.environ["SERA_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="sera-bench-"), "bench.db")
+
+    if args.quiet:
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from app import main
+    from app.fake_llm import FakeLLMClient
+
+    fake = FakeLLMClient(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_mode=args.error_mode,
+        seed=args.seed
+    )
+    main.gemini = fake
+    main.intent_router.enabled = args.router
+    main.admission.enabled = args.admission
+
+    if args.mode == "uvicorn":
+        import uvicorn
+
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(
+            main.app, host="127.0.0.1", port=port, log_level="warning", ws_max_queue=10000
+        ))
+        started = time.perf_counter()
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        startup_ms = (time.perf_counter() - started) * 1000
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout, limits=limits) as client:
+                report = await Benchmark(
+                    args, client, lambda path: RemoteWebSocket(f"ws://127.0.0.1:{port}{path}")
+                ).run()
+        finally:
+            server.should_exit = True
+            await serving
+    else:
+        started = time.perf_counter()
+        async with main.app.router.lifespan_context(main.app):
+            startup_ms = (time.perf_counter() - started) * 1000
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=args.timeout) as client:
+                report = await Benchmark(
+                    args, client, lambda path: InProcessWebSocket(main.app, path)
+                ).run()
+
+    report["llm"] = {"calls": fake.calls, "injected_errors": fake.errors}
+    report["stages"] = stage_breakdown()
+    report["startup"] = {"lifespan_ms": round(startup_ms, 1)}
+    return report
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="SERA end-to-end load and latency benchmark")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--url", help="benchmark an already running server instead")
+    parser.add_argument("--captures", type=int, default=200)
+    parser.add_argument("--actions", type=int, default=100)
+    parser.add_argument("--lists", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--sockets", type=int, default=50)
+    parser.add_argument("--users", type=int, default=50, help="distinct users (at least --sockets)")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=800)
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-mode", choices=["fallback", "raise"], default="fallback")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="share of captures repeating a common text")
+    parser.add_argument("--drain-seconds", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="baseline JSON report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown")
+    parser.add_argument("--no-router", dest="router", action="store_false", help="send every capture to the LLM")
+    parser.add_argument("--no-admission", dest="admission", action="store_false", help="disable rate limits and the LLM concurrency cap")
+    parser.add_argument("--import-time", action="store_true", help="also measure cold import of app.main")
+    parser.add_argument("--verbose", dest="quiet", action="store_false", help="keep server logs")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    args.seed = args.seed if args.seed is not None else int(time.time())
+    report = asyncio.run(run(args))
+    if args.import_time:
+        report.setdefault("startup", {}).update(measure_import())
+    report["config"] = {
+        key: value for key, value in vars(args).items() if key not in ("output", "compare", "quiet")
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+        print(f"✅ Report written to {args.output}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("❌ Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("✅ No regressions against baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
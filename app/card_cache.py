@@ -0,0 +1,117 @@
+# app/card_cache.py
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from app.codec import dumps_bytes
+from app.metrics import CACHE_REQUESTS
+
+class CardCache:
+    """Bounded LRU/TTL card cache with database read-through and write-through
+
+    Each worker has its own copy, so entries can be stale; the TTL is short
+    and changes go through modify(), which works on the stored row.
+    """
+
+    def __init__(
+        self,
+        db,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None
+    ):
+        self.db = db
+        self.max_entries = max_entries or int(os.getenv("CARD_CACHE_MAX_ENTRIES", "10000"))
+        self.max_bytes = max_bytes or int(os.getenv("CARD_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("CARD_CACHE_TTL_SECONDS", "60"))
+
+        # card_id -> (expires_at, approximate size in bytes, card)
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict]]" = OrderedDict()
+        self.current_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, card_id: str) -> Optional[Dict]:
+        """Return a card from memory, falling back to the database"""
+        entry = self._entries.get(card_id)
+        if entry is not None:
+            expires_at, _, card = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(card_id)
+                self.hits += 1
+                CACHE_REQUESTS.inc(cache="card", result="hit")
+                return card
+            self._remove(card_id)
+            self.expirations += 1
+
+        self.misses += 1
+        CACHE_REQUESTS.inc(cache="card", result="miss")
+        card = await self.db.get_card(card_id)
+        if card is not None:
+            self.put(card)
+        return card
+
+    def put(self, card: Dict):
+        card_id = card["card_id"]
+        if card_id in self._entries:
+            self._remove(card_id)
+        size = len(dumps_bytes(card))
+        self._entries[card_id] = (time.monotonic() + self.ttl_seconds, size, card)
+        self.current_bytes += size
+        self._evict()
+
+    def put_many(self, cards: Iterable[Dict]):
+        for card in cards:
+            self.put(card)
+
+    async def update(self, card: Dict) -> bool:
+        """Write a changed card through to the database, then cache it"""
+        if not await self.db.update_card(card):
+            self.invalidate(card["card_id"])
+            return False
+        self.put(card)
+        return True
+
+    async def modify(self, card_id: str, change: Callable[[Dict], Dict]) -> Optional[Dict]:
+        """Apply change to the stored card, not a cached copy, and cache the result"""
+        try:
+            updated = await self.db.modify_card(card_id, change)
+        except BaseException:
+            self.invalidate(card_id)
+            raise
+        if updated is None:
+            self.invalidate(card_id)
+        else:
+            self.put(updated)
+        return updated
+
+    def invalidate(self, card_id: str):
+        if card_id in self._entries:
+            self._remove(card_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+    def _remove(self, card_id: str):
+        _, size, _ = self._entries.pop(card_id)
+        self.current_bytes -= size
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes
+        ):
+            card_id, (_, size, _) = self._entries.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
@@ -0,0 +1,54 @@
+# app/celery_worker.py
+import asyncio
+import os
+from typing import Any, Dict, Optional
+
+from celery import Celery
+
+broker_url = os.getenv("CELERY_BROKER_URL", os.getenv("REDIS_URL", "redis://localhost:6379"))
+celery_app = Celery(
+    "sera",
+    broker=broker_url,
+    backend=os.getenv("CELERY_RESULT_BACKEND", broker_url)
+)
+celery_app.conf.update(
+    task_track_started=True,
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+    result_expires=int(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+)
+
+MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", "2"))
+RETRY_BACKOFF_SECONDS = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "1"))
+
+# One long-lived loop per worker process, so pooled connections and
+# asyncio primitives are created once and reused across tasks
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+async def _startup():
+    from app import main
+    from app.llm_providers import create_llm_client, warm_up
+
+    if main.gemini is None:
+        main.llm_provider, main.gemini = create_llm_client()
+        await warm_up(main.gemini)
+    await main.db.connect()
+    await main.websocket_manager.start()
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+        _loop.run_until_complete(_startup())
+    return _loop
+
+@celery_app.task(bind=True, max_retries=MAX_RETRIES)
+def run_capture_job(self, job_id: str, payload: Dict[str, Any]):
+    from app import main
+
+    try:
+        return _get_loop().run_until_complete(
+            main.process_capture_job({"job_id": job_id, "payload": payload})
+        )
+    except Exception as e:
+        raise self.retry(exc=e, countdown=RETRY_BACKOFF_SECONDS * (2 ** self.request.retries))
@@ -0,0 +1,114 @@
+# app/codec.py
+import json
+from typing import Any, Dict, List, Type
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from app.models import GeneratedCard, GeneratedCards
+from app.stream_parser import CardStreamParser
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+# One encoder for HTTP bodies, WebSocket frames and DB JSON columns
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=str, option=_ORJSON_OPTIONS)
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj, default=str, option=_ORJSON_OPTIONS).decode("utf-8")
+
+    loads = orjson.loads
+else:
+    def dumps_bytes(obj: Any) -> bytes:
+        return json.dumps(obj, default=str, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def dumps(obj: Any) -> str:
+        return json.dumps(obj, default=str, ensure_ascii=False, separators=(",", ":"))
+
+    loads = json.loads
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the shared encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
+
+# Validators are built once; pydantic-core parses and validates in one pass
+_cards_adapter = TypeAdapter(GeneratedCards)
+_card_adapter = TypeAdapter(GeneratedCard)
+
+def decode_cards(text: str) -> List[Dict[str, Any]]:
+    """Decode an LLM reply into validated card dicts, salvaging what it can
+
+    Well-formed replies take the fast path. Otherwise (fences, prose, a
+    truncated reply, one bad card) every complete card object is recovered
+    and validated on its own. Raises ValueError when nothing usable remains.
+    """
+    try:
+        return [_dump(card) for card in _cards_adapter.validate_json(text).cards]
+    except ValidationError:
+        pass
+
+    parser = CardStreamParser()
+    cards = []
+    for event in parser.feed(text):
+        if event["event"] != "complete":
+            continue
+        try:
+            cards.append(_dump(_card_adapter.validate_python(event["card"])))
+        except ValidationError:
+            continue
+    if not cards:
+        raise ValueError("No valid cards in model response")
+    return cards
+
+def validate_card(card: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate one already-parsed card; raises ValueError if it does not fit"""
+    try:
+        return _dump(_card_adapter.validate_python(card))
+    except ValidationError as e:
+        raise ValueError(str(e))
+
+def _dump(card: GeneratedCard) -> Dict[str, Any]:
+    data = card.model_dump(exclude_none=True)
+    data["primary_action"] = card.primary_action.model_dump(exclude_none=True)
+    return data
+
+# Keys the Gemini Schema proto understands
+_GEMINI_SCHEMA_KEYS = ("type", "format", "description", "nullable", "enum")
+
+def gemini_response_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Translate a pydantic model into the OpenAPI subset Gemini accepts"""
+    schema = model.model_json_schema()
+    return _to_gemini(schema, schema.get("$defs", {}))
+
+def _to_gemini(node: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    if "$ref" in node:
+        return _to_gemini(defs[node["$ref"].split("/")[-1]], defs)
+
+    if "anyOf" in node:
+        # Optional[X] -> X marked nullable
+        options = [option for option in node["anyOf"] if option.get("type") != "null"]
+        result = _to_gemini(options[0], defs)
+        if len(options) < len(node["anyOf"]):
+            result["nullable"] = True
+        if node.get("description"):
+            result["description"] = node["description"]
+        return result
+
+    result = {key: node[key] for key in _GEMINI_SCHEMA_KEYS if node.get(key) is not None}
+    if "properties" in node:
+        result["properties"] = {
+            name: _to_gemini(child, defs) for name, child in node["properties"].items()
+        }
+        if node.get("required"):
+            result["required"] = list(node["required"])
+    if "items" in node:
+        result["items"] = _to_gemini(node["items"], defs)
+    return result
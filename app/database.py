@@ -1,21 +1,170 @@
 # app/database.py
 import aiosqlite
-import json
+import asyncio
+import logging
 import os
-from typing import List, Dict, Any
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from datetime import datetime
 
-class DatabaseManager:
-    def __init__(self):
-        self.db_path = "sera.db"
+from app.codec import dumps, loads
+from app.metrics import timed
+from app.storage import CARD_FIELDS, JSON_CARD_FIELDS, Storage, decode_cursor, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+# Applied to every pooled connection; SQLite PRAGMAs are per-connection state
+CONNECTION_PRAGMAS = (
+    # Must precede WAL to apply to a new file; existing ones need enable_incremental_vacuum()
+    "PRAGMA auto_vacuum = INCREMENTAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# Writes a card's editable fields; parameters from DatabaseManager._update_params
+UPDATE_CARD_SQL = '''
+    UPDATE cards
+    SET type = ?, title = ?, description = ?, primary_action = ?,
+        alternatives = ?, metadata = ?, status = ?
+    WHERE card_id = ?
+'''
+
+# Schema migrations in order; the 1-based position is the schema version
+MIGRATIONS = (
+    "_migrate_card_metadata",
+    "_migrate_card_indexes",
+    "_migrate_session_cards",
+)
+
+# SQLite maintenance on an aiosqlite connection, shared with the SQLAlchemy backend
+
+async def compact_sqlite(db: aiosqlite.Connection, vacuum_pages: int = 0, checkpoint: str = "PASSIVE") -> Dict[str, Any]:
+    checkpoint = checkpoint.upper()
+    if checkpoint not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"Invalid checkpoint mode '{checkpoint}'")
+
+    await db.commit()
+    async with db.execute("PRAGMA freelist_count") as cursor:
+        free_before = (await cursor.fetchone())[0]
+    if vacuum_pages > 0:
+        # Frees one page per step; executescript steps it to completion, execute would not
+        await db.executescript(f"PRAGMA incremental_vacuum({int(vacuum_pages)});")
+    async with db.execute("PRAGMA freelist_count") as cursor:
+        free_after = (await cursor.fetchone())[0]
+    async with db.execute(f"PRAGMA wal_checkpoint({checkpoint})") as cursor:
+        busy, wal_pages, checkpointed = await cursor.fetchone()
+
+    return {
+        "pages_freed": free_before - free_after,
+        "free_pages": free_after,
+        "wal_pages": wal_pages,
+        "checkpointed_pages": checkpointed,
+        "checkpoint_busy": bool(busy)
+    }
+
+async def sqlite_auto_vacuum_mode(db: aiosqlite.Connection) -> str:
+    async with db.execute("PRAGMA auto_vacuum") as cursor:
+        return ("none", "full", "incremental")[(await cursor.fetchone())[0]]
+
+async def enable_sqlite_incremental_vacuum(db: aiosqlite.Connection):
+    await db.commit()
+    await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    await db.execute("VACUUM")
+
+class DatabaseManager(Storage):
+    """aiosqlite storage: one writer connection and a pool of readers"""
+
+    def __init__(self, db_path: Optional[str] = None, readers: Optional[int] = None):
+        self.db_path = db_path or os.getenv("SERA_DB_PATH", "sera.db")
+        self.reader_count = readers or int(os.getenv("SERA_DB_READERS", "4"))
+        self.statement_cache_size = int(os.getenv("SERA_DB_STATEMENT_CACHE", "128"))
+
+        # One writer (SQLite allows a single writer) and a pool of readers
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._readers: Optional[asyncio.Queue] = None
+        self._reader_conns: List[aiosqlite.Connection] = []
+        self._open_lock = asyncio.Lock()
+
+    async def _open_connection(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(
+            self.db_path,
+            cached_statements=self.statement_cache_size
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    async def connect(self):
+        """Open the writer connection and the reader pool"""
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+            self._writer = await self._open_connection()
+            self._readers = asyncio.Queue()
+            for _ in range(self.reader_count):
+                conn = await self._open_connection()
+                conn.row_factory = aiosqlite.Row
+                self._reader_conns.append(conn)
+                self._readers.put_nowait(conn)
+
+    async def close(self):
+        """Close all pooled connections"""
+        async with self._open_lock:
+            connections = self._reader_conns + ([self._writer] if self._writer else [])
+            self._writer = None
+            self._readers = None
+            self._reader_conns = []
+            for conn in connections:
+                try:
+                    await conn.close()
+                except Exception as e:
+                    logger.error("Error closing database connection: %s", e)
+
+    @asynccontextmanager
+    async def _write(self, operation: str = "write"):
+        """Exclusive access to the writer connection, committed on success"""
+        if self._writer is None:
+            await self.connect()
+        # Timed including the wait for the lock: that is what callers feel
+        with timed("db", operation):
+            async with self._write_lock:
+                try:
+                    yield self._writer
+                    await self._writer.commit()
+                except BaseException:
+                    # Includes cancellation, so no half-written transaction lingers
+                    await self._writer.rollback()
+                    raise
+
+    @asynccontextmanager
+    async def _read(self, operation: str = "read"):
+        """Borrow a reader connection from the pool"""
+        if self._readers is None:
+            await self.connect()
+        readers = self._readers
+        with timed("db", operation):
+            conn = await readers.get()
+            try:
+                yield conn
+            finally:
+                readers.put_nowait(conn)
+
+    async def ping(self):
+        """Round-trip a trivial query on a pooled reader"""
+        async with self._read("ping") as db:
+            async with db.execute("SELECT 1") as cursor:
+                await cursor.fetchone()
     
     async def init_db(self):
         """Initialize SQLite database with tables"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Enable foreign keys and WAL mode for better performance
-            await db.execute("PRAGMA foreign_keys = ON")
-            await db.execute("PRAGMA journal_mode = WAL")
-            
+        async with self._write("init_db") as db:
             # Create cards table
             await db.execute('''
                 CREATE TABLE IF NOT EXISTS cards (
@@ -52,42 +201,163 @@ class DatabaseManager:
                 )
             ''')
             
-            await db.commit()
-            print("✅ SQLite database initialized")
+            # Create response_cache table (persisted generation results)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    cards TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+
+            await self._migrate(db)
+
+        logger.info("SQLite database initialized")
+
+    async def _migrate(self, db):
+        """Apply pending schema migrations, tracked in PRAGMA user_version"""
+        async with db.execute("PRAGMA user_version") as cursor:
+            version = (await cursor.fetchone())[0]
+        for target, migration in enumerate(MIGRATIONS, start=1):
+            if version < target:
+                await getattr(self, migration)(db)
+                await db.execute(f"PRAGMA user_version = {target}")
+                logger.info("Applied database migration %s: %s", target, migration)
+
+    async def _migrate_card_metadata(self, db):
+        await self._ensure_column(db, "cards", "metadata", "TEXT")
+
+    async def _migrate_card_indexes(self, db):
+        # Listing is by user, newest first; the rowid rides along in every index
+        await db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_cards_user_created
+            ON cards (user_id, created_at)
+        ''')
+        await db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_cards_user_status
+            ON cards (user_id, status, created_at)
+        ''')
+
+    async def _migrate_session_cards(self, db):
+        # Sessions reference their cards instead of holding a JSON copy of them
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS session_cards (
+                session_id TEXT NOT NULL,
+                card_id TEXT NOT NULL,
+                position INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (session_id, card_id)
+            ) WITHOUT ROWID
+        ''')
+        await db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_session_cards_card
+            ON session_cards (card_id)
+        ''')
+        await db.execute('''
+            INSERT OR IGNORE INTO session_cards (session_id, card_id, position)
+            SELECT s.session_id, json_extract(c.value, '$.card_id'), c.key
+            FROM user_sessions s, json_each(s.cards) c
+            WHERE s.cards IS NOT NULL AND json_valid(s.cards)
+            AND json_extract(c.value, '$.card_id') IS NOT NULL
+        ''')
+        # The old cards column is left as it was; nothing reads it any more
+
+        # Retention scans: by status and age, sessions by age
+        await db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_cards_status_created
+            ON cards (status, created_at)
+        ''')
+        await db.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sessions_created
+            ON user_sessions (created_at)
+        ''')
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS cards_archive (
+                card_id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                title TEXT NOT NULL,
+                description TEXT,
+                primary_action TEXT,
+                alternatives TEXT,
+                metadata TEXT,
+                status TEXT,
+                user_id TEXT,
+                created_at TIMESTAMP,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+    @staticmethod
+    async def _ensure_column(db, table: str, column: str, definition: str):
+        async with db.execute(f"PRAGMA table_info({table})") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if column not in columns:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
     
     async def store_card(self, card_data: Dict[str, Any]) -> bool:
         """Store card in SQLite database"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self._write("store_card") as db:
                 await db.execute('''
-                    INSERT OR REPLACE INTO cards 
-                    (card_id, type, title, description, primary_action, alternatives, status, user_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    INSERT OR REPLACE INTO cards
+                    (card_id, type, title, description, primary_action, alternatives, metadata, status, user_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (
                     card_data['card_id'],
                     card_data['type'],
                     card_data['title'],
                     card_data.get('description', ''),
-                    json.dumps(card_data.get('primary_action', {})),
-                    json.dumps(card_data.get('alternatives', [])),
+                    dumps(card_data.get('primary_action', {})),
+                    dumps(card_data.get('alternatives', [])),
+                    dumps(card_data.get('metadata', {})),
                     card_data.get('status', 'pending'),
                     card_data.get('user_id', 'default_user')
                 ))
-                await db.commit()
                 return True
         except Exception as e:
-            print(f"❌ Error storing card: {e}")
+            logger.error("Error storing card: %s", e)
+            return False
+
+    async def store_captures(self, captures: List[Tuple[str, str, List[Dict]]]) -> bool:
+        """Store several (session_id, user_id, cards) captures in a single transaction"""
+        try:
+            card_rows = [(
+                card['card_id'],
+                card['type'],
+                card['title'],
+                card.get('description', ''),
+                dumps(card.get('primary_action', {})),
+                dumps(card.get('alternatives', [])),
+                dumps(card.get('metadata', {})),
+                card.get('status', 'pending'),
+                card.get('user_id', user_id)
+            ) for _, user_id, cards in captures for card in cards]
+            session_rows = [(session_id, user_id) for session_id, user_id, _ in captures]
+            link_rows = [
+                (session_id, card['card_id'], position)
+                for session_id, _, cards in captures
+                for position, card in enumerate(cards)
+            ]
+
+            async with self._write("store_captures") as db:
+                await db.executemany('''
+                    INSERT OR REPLACE INTO cards
+                    (card_id, type, title, description, primary_action, alternatives, metadata, status, user_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', card_rows)
+                await self._write_sessions(db, session_rows, link_rows)
+                return True
+        except Exception as e:
+            logger.error("Error storing capture: %s", e)
             return False
     
     async def get_user_cards(self, user_id: str) -> List[Dict]:
         """Get all cards for a user"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                db.row_factory = aiosqlite.Row
+            async with self._read("get_user_cards") as db:
                 async with db.execute('''
-                    SELECT card_id, type, title, description, primary_action, alternatives, status, created_at
-                    FROM cards 
-                    WHERE user_id = ? 
+                    SELECT card_id, type, title, description, primary_action, alternatives, metadata, status, created_at
+                    FROM cards
+                    WHERE user_id = ?
                     ORDER BY created_at DESC
                 ''', (user_id,)) as cursor:
                     
@@ -96,41 +366,386 @@ class DatabaseManager:
                     for row in rows:
                         card = dict(row)
                         # Parse JSON fields
-                        card['primary_action'] = json.loads(card['primary_action']) if card['primary_action'] else {}
-                        card['alternatives'] = json.loads(card['alternatives']) if card['alternatives'] else []
+                        card['primary_action'] = loads(card['primary_action']) if card['primary_action'] else {}
+                        card['alternatives'] = loads(card['alternatives']) if card['alternatives'] else []
+                        card['metadata'] = loads(card['metadata']) if card['metadata'] else {}
                         cards.append(card)
                     
                     return cards
         except Exception as e:
-            print(f"❌ Error getting user cards: {e}")
+            logger.error("Error getting user cards: %s", e)
+            return []
+
+    async def get_card(self, card_id: str) -> Optional[Dict]:
+        """Get a single card by id"""
+        try:
+            async with self._read("get_card") as db:
+                async with db.execute('''
+                    SELECT card_id, type, title, description, primary_action, alternatives, metadata,
+                           status, user_id, created_at
+                    FROM cards
+                    WHERE card_id = ?
+                ''', (card_id,)) as cursor:
+                    row = await cursor.fetchone()
+                    if row is None:
+                        return None
+                    card = dict(row)
+                    for field, default in JSON_CARD_FIELDS.items():
+                        card[field] = loads(card[field]) if card[field] else default()
+                    return card
+        except Exception as e:
+            logger.error("Error getting card: %s", e)
+            return None
+
+    async def get_cards(self, card_ids: List[str]) -> List[Dict]:
+        """Get several cards by id in one query"""
+        if not card_ids:
+            return []
+        try:
+            async with self._read("get_cards") as db:
+                async with db.execute(f'''
+                    SELECT card_id, type, title, description, primary_action, alternatives, metadata,
+                           status, user_id, created_at
+                    FROM cards
+                    WHERE card_id IN ({", ".join("?" for _ in card_ids)})
+                ''', list(card_ids)) as cursor:
+                    cards = []
+                    for row in await cursor.fetchall():
+                        card = dict(row)
+                        for field, default in JSON_CARD_FIELDS.items():
+                            card[field] = loads(card[field]) if card[field] else default()
+                        cards.append(card)
+                    return cards
+        except Exception as e:
+            logger.error("Error getting cards: %s", e)
             return []
+
+    async def get_user_cards_page(
+        self,
+        user_id: str,
+        limit: int = 50,
+        before: Optional[str] = None,
+        statuses: Optional[List[str]] = None,
+        card_type: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Get one page of a user's cards, newest first, using keyset pagination"""
+        fields = [f for f in (fields or CARD_FIELDS) if f in CARD_FIELDS] or list(CARD_FIELDS)
+        columns = ", ".join(dict.fromkeys(fields + ["created_at"]))
+
+        query = f"SELECT id, {columns} FROM cards WHERE user_id = ?"
+        params: List[Any] = [user_id]
+        if statuses:
+            query += f" AND status IN ({', '.join('?' for _ in statuses)})"
+            params.extend(statuses)
+        if card_type:
+            query += " AND type = ?"
+            params.append(card_type)
+        if before:
+            created_at, row_id = decode_cursor(before)
+            query += " AND (created_at, id) < (?, ?)"
+            params.extend([created_at, row_id])
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        async with self._read("get_user_cards_page") as db:
+            async with db.execute(query, params) as cursor:
+                rows = await cursor.fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+
+        cards = []
+        for row in rows:
+            card = {}
+            for field in fields:
+                value = row[field]
+                if field in JSON_CARD_FIELDS:
+                    value = loads(value) if value else JSON_CARD_FIELDS[field]()
+                card[field] = value
+            cards.append(card)
+
+        return {"cards": cards, "next_cursor": next_cursor}
     
     async def store_session(self, session_id: str, user_id: str, cards: List[Dict]):
         """Store user session"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute('''
-                    INSERT OR REPLACE INTO user_sessions 
-                    (session_id, user_id, cards)
-                    VALUES (?, ?, ?)
-                ''', (
-                    session_id,
-                    user_id,
-                    json.dumps(cards)
-                ))
-                await db.commit()
+            async with self._write("store_session") as db:
+                await self._write_sessions(
+                    db,
+                    [(session_id, user_id)],
+                    [(session_id, card['card_id'], position) for position, card in enumerate(cards)]
+                )
         except Exception as e:
-            print(f"❌ Error storing session: {e}")
+            logger.error("Error storing session: %s", e)
+
+    @staticmethod
+    async def _write_sessions(db, session_rows: List[Tuple[str, str]], link_rows: List[Tuple[str, str, int]]):
+        """Upsert sessions and replace their card links (cards themselves live in cards)"""
+        await db.executemany('''
+            INSERT INTO user_sessions (session_id, user_id)
+            VALUES (?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET user_id = excluded.user_id
+        ''', session_rows)
+        await db.executemany(
+            "DELETE FROM session_cards WHERE session_id = ?",
+            [(session_id,) for session_id, _ in session_rows]
+        )
+        await db.executemany('''
+            INSERT OR REPLACE INTO session_cards (session_id, card_id, position)
+            VALUES (?, ?, ?)
+        ''', link_rows)
+
+    async def get_session_cards(self, session_id: str) -> List[Dict]:
+        """Cards of a session in capture order"""
+        try:
+            async with self._read("get_session_cards") as db:
+                async with db.execute('''
+                    SELECT c.card_id, c.type, c.title, c.description, c.primary_action,
+                           c.alternatives, c.metadata, c.status, c.created_at
+                    FROM session_cards l
+                    JOIN cards c ON c.card_id = l.card_id
+                    WHERE l.session_id = ?
+                    ORDER BY l.position
+                ''', (session_id,)) as cursor:
+                    cards = []
+                    for row in await cursor.fetchall():
+                        card = dict(row)
+                        for field, default in JSON_CARD_FIELDS.items():
+                            card[field] = loads(card[field]) if card[field] else default()
+                        cards.append(card)
+                    return cards
+        except Exception as e:
+            logger.error("Error getting session cards: %s", e)
+            return []
     
     async def update_card_status(self, card_id: str, status: str):
         """Update card status"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self._write("update_card_status") as db:
                 await db.execute('''
                     UPDATE cards SET status = ? WHERE card_id = ?
                 ''', (status, card_id))
-                await db.commit()
                 return True
         except Exception as e:
-            print(f"❌ Error updating card status: {e}")
-            return False
\ No newline at end of file
+            logger.error("Error updating card status: %s", e)
+            return False
+
+    async def update_card(self, card: Dict[str, Any]) -> bool:
+        """Persist a card's status and editable fields"""
+        return await self._update_cards([card], "update_card")
+
+    async def update_cards(self, cards: List[Dict[str, Any]]) -> bool:
+        """Persist several cards' status and editable fields in one transaction"""
+        return await self._update_cards(cards, "update_cards")
+
+    async def _update_cards(self, cards: List[Dict[str, Any]], operation: str) -> bool:
+        try:
+            async with self._write(operation) as db:
+                await db.executemany(UPDATE_CARD_SQL, [self._update_params(card) for card in cards])
+                return True
+        except Exception as e:
+            logger.error("Error updating card: %s", e)
+            return False
+
+    async def modify_card(self, card_id: str, change: Callable[[Dict], Dict]) -> Optional[Dict]:
+        """Read, change and write a card in one transaction (see Storage.modify_card)"""
+        async with self._write("modify_card") as db:
+            # Take the database write lock before reading, so other processes
+            # sharing the file cannot slip a write in between
+            await db.execute("BEGIN IMMEDIATE")
+            async with db.execute('''
+                SELECT card_id, type, title, description, primary_action, alternatives, metadata,
+                       status, user_id, created_at
+                FROM cards
+                WHERE card_id = ?
+            ''', (card_id,)) as cursor:
+                row = await cursor.fetchone()
+                columns = [column[0] for column in cursor.description]
+            if row is None:
+                return None
+            card = dict(zip(columns, row))
+            for field, default in JSON_CARD_FIELDS.items():
+                card[field] = loads(card[field]) if card[field] else default()
+            updated = change(card)
+            await db.execute(UPDATE_CARD_SQL, self._update_params(updated))
+            return updated
+
+    @staticmethod
+    def _update_params(card: Dict[str, Any]) -> Tuple:
+        return (
+            card['type'],
+            card['title'],
+            card.get('description', ''),
+            dumps(card.get('primary_action', {})),
+            dumps(card.get('alternatives', [])),
+            dumps(card.get('metadata', {})),
+            card.get('status', 'pending'),
+            card['card_id']
+        )
+
+    async def get_user_context(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get a user's stored preferences and model context"""
+        try:
+            async with self._read("get_user_context") as db:
+                async with db.execute('''
+                    SELECT preferences, gemini_context FROM user_preferences
+                    WHERE user_id = ?
+                ''', (user_id,)) as cursor:
+                    row = await cursor.fetchone()
+                    if row is None:
+                        return None
+                    return {
+                        "preferences": loads(row['preferences']) if row['preferences'] else {},
+                        "context": loads(row['gemini_context']) if row['gemini_context'] else {}
+                    }
+        except Exception as e:
+            logger.error("Error getting user context: %s", e)
+            return None
+
+    async def store_user_context(
+        self,
+        user_id: str,
+        preferences: Optional[Dict[str, Any]] = None,
+        context: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """Upsert a user's preferences and/or model context, keeping the other as is"""
+        try:
+            async with self._write("store_user_context") as db:
+                await db.execute('''
+                    INSERT INTO user_preferences (user_id, preferences, gemini_context, last_updated)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        preferences = COALESCE(excluded.preferences, preferences),
+                        gemini_context = COALESCE(excluded.gemini_context, gemini_context),
+                        last_updated = CURRENT_TIMESTAMP
+                ''', (
+                    user_id,
+                    dumps(preferences) if preferences is not None else None,
+                    dumps(context) if context is not None else None
+                ))
+                return True
+        except Exception as e:
+            logger.error("Error storing user context: %s", e)
+            return False
+
+    async def append_user_history(
+        self,
+        user_id: str,
+        decision: Dict[str, Any],
+        max_history: int
+    ) -> Optional[List[Dict]]:
+        """Append to the stored history in one transaction (see Storage.append_user_history)"""
+        try:
+            async with self._write("append_user_history") as db:
+                await db.execute("BEGIN IMMEDIATE")
+                async with db.execute('''
+                    SELECT gemini_context FROM user_preferences WHERE user_id = ?
+                ''', (user_id,)) as cursor:
+                    row = await cursor.fetchone()
+                context = loads(row[0]) if row and row[0] else {}
+                history = (context.get("history", []) + [decision])[-max_history:]
+                context["history"] = history
+                await db.execute('''
+                    INSERT INTO user_preferences (user_id, gemini_context, last_updated)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        gemini_context = excluded.gemini_context,
+                        last_updated = CURRENT_TIMESTAMP
+                ''', (user_id, dumps(context)))
+                return history
+        except Exception as e:
+            logger.error("Error appending user history: %s", e)
+            return None
+
+    async def get_cached_response(self, cache_key: str) -> Optional[Tuple[float, List[Dict]]]:
+        """Get an unexpired cached generation as (expires_at, cards)"""
+        try:
+            async with self._read("get_cached_response") as db:
+                async with db.execute('''
+                    SELECT cards, expires_at FROM response_cache
+                    WHERE cache_key = ? AND expires_at > ?
+                ''', (cache_key, time.time())) as cursor:
+                    row = await cursor.fetchone()
+                    if row is None:
+                        return None
+                    return row['expires_at'], loads(row['cards'])
+        except Exception as e:
+            logger.error("Error reading response cache: %s", e)
+            return None
+
+    async def store_cached_response(self, cache_key: str, cards: List[Dict], expires_at: float):
+        """Persist a generation result, pruning expired entries"""
+        try:
+            async with self._write("store_cached_response") as db:
+                await db.execute('''
+                    INSERT OR REPLACE INTO response_cache (cache_key, cards, expires_at)
+                    VALUES (?, ?, ?)
+                ''', (cache_key, dumps(cards), expires_at))
+                await db.execute('''
+                    DELETE FROM response_cache WHERE expires_at <= ?
+                ''', (time.time(),))
+        except Exception as e:
+            logger.error("Error storing response cache: %s", e)
+
+    # Maintenance: used by the retention job, errors are left to the caller
+
+    async def purge_cards(self, status: str, older_than_seconds: float, limit: int, archive: bool = False) -> int:
+        """Delete (or move to cards_archive) up to `limit` old cards with a status"""
+        async with self._write("purge_cards") as db:
+            async with db.execute('''
+                SELECT card_id FROM cards
+                WHERE status = ? AND created_at < datetime('now', ?)
+                ORDER BY created_at
+                LIMIT ?
+            ''', (status, f"{-int(older_than_seconds)} seconds", limit)) as cursor:
+                card_ids = [row[0] for row in await cursor.fetchall()]
+            if not card_ids:
+                return 0
+
+            placeholders = ",".join("?" * len(card_ids))
+            if archive:
+                await db.execute(f'''
+                    INSERT OR REPLACE INTO cards_archive
+                    (card_id, type, title, description, primary_action, alternatives, metadata, status, user_id, created_at)
+                    SELECT card_id, type, title, description, primary_action, alternatives, metadata, status, user_id, created_at
+                    FROM cards WHERE card_id IN ({placeholders})
+                ''', card_ids)
+            await db.execute(f"DELETE FROM session_cards WHERE card_id IN ({placeholders})", card_ids)
+            await db.execute(f"DELETE FROM cards WHERE card_id IN ({placeholders})", card_ids)
+            return len(card_ids)
+
+    async def purge_sessions(self, older_than_seconds: float, limit: int) -> int:
+        """Delete up to `limit` sessions that are old or no longer link any card"""
+        async with self._write("purge_sessions") as db:
+            async with db.execute('''
+                SELECT session_id FROM user_sessions s
+                WHERE s.created_at < datetime('now', ?)
+                OR NOT EXISTS (SELECT 1 FROM session_cards l WHERE l.session_id = s.session_id)
+                LIMIT ?
+            ''', (f"{-int(older_than_seconds)} seconds", limit)) as cursor:
+                session_ids = [row[0] for row in await cursor.fetchall()]
+            if not session_ids:
+                return 0
+
+            placeholders = ",".join("?" * len(session_ids))
+            await db.execute(f"DELETE FROM session_cards WHERE session_id IN ({placeholders})", session_ids)
+            await db.execute(f"DELETE FROM user_sessions WHERE session_id IN ({placeholders})", session_ids)
+            return len(session_ids)
+
+    async def compact(self, vacuum_pages: int = 0, checkpoint: str = "PASSIVE") -> Dict[str, Any]:
+        """Return free pages to the OS (incremental auto_vacuum) and checkpoint the WAL"""
+        async with self._write("compact") as db:
+            return await compact_sqlite(db, vacuum_pages, checkpoint)
+
+    async def auto_vacuum_mode(self) -> str:
+        # Asked on the writer: pooled readers can report a header from before a VACUUM
+        async with self._write("auto_vacuum_mode") as db:
+            return await sqlite_auto_vacuum_mode(db)
+
+    async def enable_incremental_vacuum(self):
+        """Switch an existing database to incremental auto_vacuum; rewrites the whole file"""
+        async with self._write("enable_incremental_vacuum") as db:
+            await enable_sqlite_incremental_vacuum(db)
@@ -0,0 +1,27 @@
+# app/emergency_client.py
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+class EmergencyClient:
+    """Last-resort client with no dependencies: one generic card per capture"""
+
+    async def process_user_query(self, user_text: str, user_id: str, context: str = "") -> List[Dict]:
+        return [{
+            "card_id": str(uuid.uuid4()),
+            "type": "schedule",
+            "title": "Emergency Card",
+            "description": f"Processing: {user_text}",
+            "primary_action": {"event_title": "Event"},
+            "alternatives": [],
+            "metadata": {"fallback": True},
+            "status": "pending",
+            "user_id": user_id,
+            "created_at": datetime.utcnow().isoformat()
+        }]
+
+    async def process_card_action(self, card_id: str, action: str, modifications: Optional[Dict] = None, card: Optional[Dict] = None) -> Dict:
+        return {"message": "Action processed"}
+
+    async def health_check(self) -> str:
+        return "emergency"
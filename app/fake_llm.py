@@ -0,0 +1,56 @@
+# app/fake_llm.py
+import asyncio
+import os
+import random
+from typing import Dict, List, Optional
+
+from app.metrics import LLM_FALLBACKS
+from app.simple_gemini import SimpleGeminiClient
+
+class FakeLLMClient(SimpleGeminiClient):
+    """SimpleGeminiClient with injected latency, jitter and failures (benchmarks)
+
+    Failures behave like GeminiClient's: after the latency the request yields
+    fallback cards (error_mode="fallback") or raises (error_mode="raise").
+    """
+
+    def __init__(
+        self,
+        latency_ms: Optional[float] = None,
+        jitter_ms: Optional[float] = None,
+        error_rate: Optional[float] = None,
+        error_mode: Optional[str] = None,
+        seed: Optional[int] = None
+    ):
+        # Arguments win; otherwise FAKE_LLM_* (for LLM_PROVIDER=fake servers)
+        self.latency_ms = latency_ms if latency_ms is not None else float(os.getenv("FAKE_LLM_LATENCY_MS", "800"))
+        self.jitter_ms = jitter_ms if jitter_ms is not None else float(os.getenv("FAKE_LLM_JITTER_MS", "200"))
+        self.error_rate = error_rate if error_rate is not None else float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+        self.error_mode = error_mode or os.getenv("FAKE_LLM_ERROR_MODE", "fallback")
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+
+    async def _delay(self):
+        jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        await asyncio.sleep(max(0.0, self.latency_ms + jitter) / 1000)
+
+    async def process_user_query(self, user_text: str, user_id: str, context: str = "") -> List[Dict]:
+        self.calls += 1
+        await self._delay()
+        cards = await super().process_user_query(user_text, user_id, context)
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            if self.error_mode == "raise":
+                raise RuntimeError("Injected LLM failure")
+            LLM_FALLBACKS.inc(reason="injected")
+            for card in cards:
+                card["metadata"]["fallback"] = True
+        return cards
+
+    async def process_card_action(self, card_id: str, action: str, modifications: Optional[Dict] = None, card: Optional[Dict] = None) -> Dict:
+        await self._delay()
+        return await super().process_card_action(card_id, action, modifications, card)
+
+    async def health_check(self) -> str:
+        return "healthy (fake)"
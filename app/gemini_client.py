@@ -2,22 +2,36 @@
 import os
 import json
 import uuid
+import asyncio
+import logging
+from contextlib import nullcontext
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
-import google.generativeai as genai
+from typing import AsyncContextManager, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Any, Tuple
 from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv(".env")
+from app.codec import decode_cards, gemini_response_schema, loads, validate_card
+from app.metrics import LLM_FALLBACKS, LLM_TOKENS
+from app.models import GeneratedCards
+from app.resilience import CircuitBreaker, CircuitOpenError, Hedger
+from app.stream_parser import CardStreamParser
+from app.user_context import estimate_tokens
+
+logger = logging.getLogger(__name__)
 
 class GeminiClient:
     def __init__(self):
+        # Load environment variables
+        load_dotenv(".env")
+        
         # Configure the Gemini API
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("GEMINI_API_KEY environment variable is required")
         
-        print(f"🔑 Initializing Gemini client with API key: {api_key[:10]}...")
+        logger.info("Initializing Gemini client with API key: %s...", api_key[:10])
+        
+        # Imported here: the SDK takes most of a second to import
+        import google.generativeai as genai
         
         # Configure the API - THIS IS THE CORRECT WAY
         genai.configure(api_key=api_key)
@@ -57,88 +71,370 @@ class GeminiClient:
             safety_settings=self.safety_settings
         )
         
-        # User context storage
-        self.user_profiles: Dict[str, Dict] = {}
-        print("✅ Gemini client initialized successfully")
+        # Card generation asks for JSON constrained to the GeneratedCards schema
+        self.cards_config = {
+            "response_mime_type": "application/json",
+            "response_schema": gemini_response_schema(GeneratedCards),
+        }
+        
+        # Bound concurrent upstream calls and give each one a deadline
+        self.max_in_flight = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "8"))
+        self.request_timeout = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        
+        # Fail fast to fallback cards while Gemini is down or slow, and
+        # optionally hedge calls that outlive the usual latency
+        self.breaker = CircuitBreaker("gemini")
+        self.hedger = Hedger()
+        
+        # Packing limits for batch captures
+        self.batch_token_budget = int(os.getenv("GEMINI_BATCH_TOKEN_BUDGET", "2000"))
+        self.batch_max_items = int(os.getenv("GEMINI_BATCH_MAX_ITEMS", "10"))
+        self.batch_max_output_tokens = int(os.getenv("GEMINI_BATCH_MAX_OUTPUT_TOKENS", "8192"))
+        logger.info("Gemini client initialized successfully")
+    
+    async def _generate(self, prompt: str, timeout: Optional[float] = None, generation_config: Optional[Dict] = None):
+        """Call the model without blocking the event loop, through the circuit breaker"""
+        permit = self.breaker.allow()
+        if permit is None:
+            raise CircuitOpenError("Gemini circuit is open")
+        
+        async def attempt(remaining: float):
+            async with self._in_flight:
+                return await asyncio.wait_for(
+                    self.model.generate_content_async(prompt, generation_config=generation_config),
+                    timeout=remaining
+                )
+        
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            response = await self.hedger.run(attempt, timeout or self.request_timeout)
+        except asyncio.CancelledError:
+            # The caller gave up; says nothing about Gemini
+            self.breaker.release(permit)
+            raise
+        except Exception:
+            self.breaker.record(permit, False, loop.time() - started)
+            raise
+        self.breaker.record(permit, True, loop.time() - started)
+        return response
+    
+    @staticmethod
+    def _parse_json_response(response_text: str) -> Any:
+        """Strip Markdown fences and decode the model's JSON"""
+        response_text = response_text.strip()
+        if response_text.startswith("```json"):
+            response_text = response_text[7:]
+        if response_text.endswith("```"):
+            response_text = response_text[:-3]
+        return loads(response_text.strip())
     
-    async def process_user_query(self, user_text: str, user_id: str) -> List[Dict]:
+    @staticmethod
+    def _build_card_prompt(user_text: str, context: str = "") -> str:
+        return f"""
+        {context}
+        Create scheduling cards for this request: "{user_text}"
+        
+        Return JSON format:
+        {{
+            "cards": [
+                {{
+                    "card_id": "unique_id",
+                    "type": "schedule",
+                    "title": "Meeting Title", 
+                    "description": "Description here",
+                    "primary_action": {{
+                        "event_title": "Meeting Name",
+                        "start_time": "2024-01-15T14:00:00",
+                        "end_time": "2024-01-15T15:00:00",
+                        "duration_minutes": 60
+                    }},
+                    "confidence": 0.9
+                }}
+            ]
+        }}
+        """
+    
+    async def process_user_query(self, user_text: str, user_id: str, context: str = "") -> List[Dict]:
         """Process user query and generate suggestion cards using Gemini"""
         try:
-            print(f"🤖 Processing user query: {user_text}")
-            
-            prompt = f"""
-            Create scheduling cards for this request: "{user_text}"
+            logger.info("Processing user query: %s", user_text)
             
-            Return JSON format:
-            {{
-                "cards": [
-                    {{
-                        "card_id": "unique_id",
-                        "type": "schedule",
-                        "title": "Meeting Title", 
-                        "description": "Description here",
-                        "primary_action": {{
-                            "event_title": "Meeting Name",
-                            "start_time": "2024-01-15T14:00:00",
-                            "end_time": "2024-01-15T15:00:00",
-                            "duration_minutes": 60
-                        }},
-                        "confidence": 0.9
-                    }}
-                ]
-            }}
-            """
+            prompt = self._build_card_prompt(user_text, context)
             
-            # CORRECT API CALL
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
+            response = await self._generate(prompt, generation_config=self.cards_config)
+            self._record_usage(response, context)
             
-            # Clean the response
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-            response_text = response_text.strip()
-            
-            # Parse the JSON response
-            result = json.loads(response_text)
-            cards = result.get("cards", [])
+            # Validate (and if needed salvage) the JSON response
+            cards = decode_cards(response.text)
             
             # Add metadata to each card
             for card in cards:
-                card["card_id"] = str(uuid.uuid4())
-                card["created_at"] = datetime.utcnow().isoformat()
-                card["status"] = "pending"
-                card["user_id"] = user_id
+                self._stamp_card(card, user_id)
             
-            print(f"✅ Generated {len(cards)} cards")
+            logger.info("Generated %s cards", len(cards))
             return cards
             
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON parsing error: {e}")
-            return self._generate_fallback_cards(user_text, user_id)
+        except CircuitOpenError:
+            return self._generate_fallback_cards(user_text, user_id, reason="circuit_open")
+        except ValueError as e:
+            logger.error("Response parsing error: %s", e)
+            return self._generate_fallback_cards(user_text, user_id, reason="invalid_response")
+        except asyncio.TimeoutError:
+            logger.error("Gemini API timed out after %ss", self.request_timeout)
+            return self._generate_fallback_cards(user_text, user_id, reason="timeout")
+        except Exception as e:
+            logger.error("Gemini API error: %s", e)
+            return self._generate_fallback_cards(user_text, user_id, reason="error")
+    
+    async def process_batch(
+        self,
+        items: List[Dict[str, str]],
+        slot: Optional[Callable[[], AsyncContextManager]] = None,
+        generate_one: Optional[Callable[[Dict[str, str]], Awaitable[List[Dict]]]] = None
+    ) -> List[List[Dict]]:
+        """Generate cards for many captures, packing several into each request
+
+        Each packed request is made inside its own slot() when one is given;
+        a pack refused a slot, like any capture the packed replies miss, is
+        passed to generate_one (process_user_query by default).
+        """
+        slot = slot or nullcontext
+        if generate_one is None:
+            generate_one = lambda item: self.process_user_query(item["text"], item["user_id"], item.get("context", ""))
+        
+        if not self.breaker.available:
+            return [
+                self._generate_fallback_cards(item["text"], item["user_id"], reason="circuit_open")
+                for item in items
+            ]
+        
+        results: List[Optional[List[Dict]]] = [None] * len(items)
+        packs = self._pack_batch(items)
+        logger.info("Processing batch of %s captures in %s requests", len(items), len(packs))
+        
+        async def run_pack(pack: List[int]):
+            if len(pack) == 1:
+                return
+            try:
+                async with slot():
+                    cards_by_index = await self._generate_pack(pack, items)
+            except Exception as e:
+                logger.warning("Batch request of %s captures not sent: %s", len(pack), e)
+                return
+            for index in pack:
+                if cards_by_index.get(index):
+                    results[index] = cards_by_index[index]
+        
+        await asyncio.gather(*(run_pack(pack) for pack in packs))
+        
+        # Anything the packed replies did not cover is generated on its own;
+        # the in-flight limit bounds how many of these run at once
+        missing = [index for index, cards in enumerate(results) if cards is None]
+        if missing:
+            logger.warning("Falling back to individual requests for %s captures", len(missing))
+            individual = await asyncio.gather(*(generate_one(items[index]) for index in missing))
+            for index, cards in zip(missing, individual):
+                results[index] = cards
+        return results
+    
+    def _pack_batch(self, items: List[Dict[str, str]]) -> List[List[int]]:
+        """Group item indexes so each prompt stays within the token budget
+
+        Only captures with the same user context share a prompt, which then
+        carries that context once.
+        """
+        packs: List[List[int]] = []
+        # context -> (indexes, tokens) of the pack still being filled
+        open_packs: Dict[str, Tuple[List[int], int]] = {}
+        for index, item in enumerate(items):
+            context = item.get("context", "")
+            current, current_tokens = open_packs.get(context, ([], len(context) // 4))
+            # Rough estimate: ~4 characters per token plus per-item framing
+            tokens = len(item["text"]) // 4 + 10
+            if current and (current_tokens + tokens > self.batch_token_budget or len(current) >= self.batch_max_items):
+                packs.append(current)
+                current, current_tokens = [], len(context) // 4
+            current.append(index)
+            open_packs[context] = (current, current_tokens + tokens)
+        packs.extend(current for current, _ in open_packs.values())
+        return sorted(packs)
+    
+    async def _generate_pack(self, pack: List[int], items: List[Dict[str, str]]) -> Dict[int, List[Dict]]:
+        """One request for several captures; returns cards keyed by input index"""
+        if len(pack) == 1:
+            return {}
+        requests = "\n".join(f'{index}: "{items[index]["text"]}"' for index in pack)
+        context = items[pack[0]].get("context", "")
+        prompt = f"""
+        {context}
+        Create scheduling cards for each of these numbered requests:
+        {requests}
+        
+        Every card must include "input_index", the number of the request it belongs to.
+        Return JSON format:
+        {{
+            "cards": [
+                {{
+                    "input_index": 0,
+                    "type": "schedule",
+                    "title": "Meeting Title",
+                    "description": "Description here",
+                    "primary_action": {{
+                        "event_title": "Meeting Name",
+                        "start_time": "2024-01-15T14:00:00",
+                        "end_time": "2024-01-15T15:00:00",
+                        "duration_minutes": 60
+                    }},
+                    "confidence": 0.9
+                }}
+            ]
+        }}
+        """
+        try:
+            response = await self._generate(
+                prompt,
+                generation_config={**self.cards_config, "max_output_tokens": self.batch_max_output_tokens}
+            )
+            self._record_usage(response, context)
+            cards = decode_cards(response.text)
+        except CircuitOpenError:
+            return {}
+        except Exception as e:
+            logger.error("Batch generation failed: %s", e)
+            return {}
+        
+        cards_by_index: Dict[int, List[Dict]] = {}
+        for card in cards:
+            index = card.pop("input_index", None)
+            if isinstance(index, int) and index in pack:
+                cards_by_index.setdefault(index, []).append(
+                    self._stamp_card(card, items[index]["user_id"])
+                )
+        return cards_by_index
+    
+    async def stream_user_query(self, user_text: str, user_id: str, context: str = "") -> AsyncIterator[Dict]:
+        """Stream generation, yielding partial/complete card events as they parse"""
+        parser = CardStreamParser()
+        streamed = 0
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.request_timeout
+        # Streams are not hedged: a second attempt could not take back events already sent
+        permit = self.breaker.allow()
+        failed = False
+        try:
+            if permit is None:
+                raise CircuitOpenError("Gemini circuit is open")
+            logger.info("Streaming user query: %s", user_text)
+            async with self._in_flight:
+                response = await asyncio.wait_for(
+                    self.model.generate_content_async(
+                        self._build_card_prompt(user_text, context),
+                        generation_config=self.cards_config,
+                        stream=True
+                    ),
+                    timeout=self.request_timeout
+                )
+                chunks = response.__aiter__()
+                last_chunk = None
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    if getattr(chunk, "usage_metadata", None) is not None:
+                        last_chunk = chunk
+                    for event in parser.feed(chunk.text):
+                        if event["event"] == "complete":
+                            try:
+                                card = validate_card(event["card"])
+                            except ValueError as e:
+                                logger.warning("Skipping invalid streamed card: %s", e)
+                                continue
+                            event["card"] = self._stamp_card(card, user_id)
+                            event["index"] = streamed
+                            streamed += 1
+                            yield event
+                        elif event["event"] == "partial":
+                            yield event
+            if last_chunk is not None:
+                # Usage totals arrive with the final chunks
+                self._record_usage(last_chunk, context)
+        except CircuitOpenError:
+            pass
+        except (asyncio.CancelledError, GeneratorExit):
+            # Abandoned by the consumer; says nothing about Gemini
+            if permit is not None:
+                self.breaker.release(permit)
+            raise
+        except asyncio.TimeoutError:
+            failed = True
+            logger.error("Gemini stream timed out after %ss", self.request_timeout)
         except Exception as e:
-            print(f"❌ Gemini API error: {e}")
-            return self._generate_fallback_cards(user_text, user_id)
+            failed = True
+            logger.error("Gemini stream error: %s", e)
+        if permit is not None:
+            self.breaker.record(permit, not failed, loop.time() - started)
+
+        if streamed == 0:
+            # Nothing usable arrived: fall back exactly like the batch path
+            reason = "stream" if permit is not None else "circuit_open"
+            for index, card in enumerate(self._generate_fallback_cards(user_text, user_id, reason=reason)):
+                yield {"event": "complete", "index": index, "card": card}
+        else:
+            logger.info("Streamed %s cards", streamed)
+    
+    @staticmethod
+    def _record_usage(response: Any, context: str = "") -> Dict[str, int]:
+        """Count and log the tokens the model reports for one call"""
+        usage = getattr(response, "usage_metadata", None)
+        tokens = {
+            "prompt": getattr(usage, "prompt_token_count", 0) or 0,
+            "output": getattr(usage, "candidates_token_count", 0) or 0,
+            # Estimated share of the prompt taken by user context
+            "context": estimate_tokens(context)
+        }
+        for kind, count in tokens.items():
+            if count:
+                LLM_TOKENS.inc(count, kind=kind)
+        logger.info("Model call used %s prompt tokens (%s context) and %s output tokens",
+                    tokens["prompt"], tokens["context"], tokens["output"])
+        return tokens
+    
+    @staticmethod
+    def _stamp_card(card: Dict, user_id: str) -> Dict:
+        card["card_id"] = str(uuid.uuid4())
+        card["created_at"] = datetime.utcnow().isoformat()
+        card["status"] = "pending"
+        card["user_id"] = user_id
+        return card
     
-    async def process_card_action(self, card_id: str, action: str, modifications: Optional[Dict] = None) -> Dict:
-        """Process user actions on cards"""
+    async def process_card_action(self, card_id: str, action: str, modifications: Optional[Dict] = None, card: Optional[Dict] = None) -> Dict:
+        """Process user actions on cards
+
+        With the card given, the reply may carry "changes": the card fields
+        the requested edits alter, for the caller to validate and apply.
+        """
         try:
-            prompt = f"User action: {action} on card {card_id}. Return JSON with confirmation message."
-            
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            # Clean response
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
+            prompt = (
+                f"User action: {action} on card {card_id}. "
+                f"Requested changes: {json.dumps(modifications or {})}. "
+                "Return JSON with confirmation message."
+            )
+            if card:
+                current = {field: card.get(field) for field in ("type", "title", "description", "primary_action", "alternatives")}
+                prompt += (
+                    f" The card is: {json.dumps(current)}. Also return \"changes\": an object with only "
+                    "the fields above that the requested changes alter, in the same shape."
+                )
             
-            return json.loads(response_text)
+            response = await self._generate(prompt, generation_config={"response_mime_type": "application/json"})
+            return self._parse_json_response(response.text)
             
         except Exception as e:
-            print(f"❌ Card action processing error: {e}")
+            logger.error("Card action processing error: %s", e)
             return {
                 "message": f"Action '{action}' completed",
                 "next_steps": [],
@@ -147,16 +443,19 @@ class GeminiClient:
             }
     
     async def health_check(self) -> str:
-        """Health check"""
+        """Health check (token count round trip, spends no generation quota)"""
         try:
-            response = self.model.generate_content("Say 'OK'")
-            return "healthy" if response.text else "unhealthy"
+            response = await asyncio.wait_for(self.model.count_tokens_async("OK"), timeout=10)
+            if self.breaker.state != "closed":
+                return f"unhealthy (circuit {self.breaker.state})"
+            return "healthy" if response.total_tokens else "unhealthy"
         except Exception as e:
-            print(f"❌ Health check failed: {e}")
+            logger.error("Health check failed: %s", e)
             return "unhealthy"
     
-    def _generate_fallback_cards(self, user_text: str, user_id: str) -> List[Dict]:
+    def _generate_fallback_cards(self, user_text: str, user_id: str, reason: str = "error") -> List[Dict]:
         """Generate fallback cards when Gemini fails"""
+        LLM_FALLBACKS.inc(reason=reason)
         return [
             {
                 "card_id": str(uuid.uuid4()),
@@ -174,7 +473,8 @@ class GeminiClient:
                 "confidence": 0.7,
                 "metadata": {
                     "urgency": "medium",
-                    "flexibility": "flexible"
+                    "flexibility": "flexible",
+                    "fallback": True
                 },
                 "created_at": datetime.utcnow().isoformat(),
                 "status": "pending",
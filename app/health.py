@@ -0,0 +1,102 @@
+# app/health.py
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class HealthMonitor:
+    """Probes dependencies in the background and serves the latest results"""
+
+    def __init__(self, interval_seconds: Optional[float] = None, timeout_seconds: Optional[float] = None):
+        self.interval_seconds = interval_seconds or float(os.getenv("HEALTH_PROBE_INTERVAL_SECONDS", "30"))
+        self.timeout_seconds = timeout_seconds or float(os.getenv("HEALTH_PROBE_TIMEOUT_SECONDS", "5"))
+
+        self._probes: Dict[str, Callable[[], Awaitable[Any]]] = {}
+        self._critical: Set[str] = set()
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.started_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, probe: Callable[[], Awaitable[Any]], critical: bool = True):
+        """Add a probe; it returns details when healthy and raises when not"""
+        self._probes[name] = probe
+        if critical:
+            self._critical.add(name)
+
+    async def start(self):
+        self.started_at = time.time()
+        await self.probe_all()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def probe_all(self):
+        await asyncio.gather(*(
+            self._probe(name, probe) for name, probe in self._probes.items()
+        ))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.probe_all()
+            except Exception as e:
+                logger.error("Health probe loop error: %s", e)
+
+    async def _probe(self, name: str, probe: Callable[[], Awaitable[Any]]):
+        started = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(probe(), timeout=self.timeout_seconds)
+            healthy, error = True, None
+        except asyncio.TimeoutError:
+            detail, healthy, error = None, False, f"timed out after {self.timeout_seconds}s"
+        except Exception as e:
+            detail, healthy, error = None, False, str(e)
+
+        self.results[name] = {
+            "healthy": healthy,
+            "detail": detail,
+            "error": error,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+            "checked_at": datetime.utcnow().isoformat()
+        }
+
+    def is_live(self) -> bool:
+        """The process is serving and the probe loop has not died"""
+        return self._task is not None and not self._task.done()
+
+    def is_ready(self) -> bool:
+        """Every critical dependency passed its most recent probe"""
+        return all(
+            self.results.get(name, {}).get("healthy", False) for name in self._critical
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        if not self.results:
+            status = "starting"
+        elif all(result["healthy"] for result in self.results.values()):
+            status = "healthy"
+        elif self.is_ready():
+            status = "degraded"
+        else:
+            status = "unhealthy"
+
+        return {
+            "status": status,
+            "live": self.is_live(),
+            "ready": self.is_ready(),
+            "checks": dict(self.results),
+            "uptime_seconds": round(time.time() - self.started_at, 1) if self.started_at else 0,
+            "timestamp": datetime.utcnow().isoformat()
+        }
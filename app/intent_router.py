@@ -0,0 +1,433 @@
+# app/intent_router.py
+import json
+import logging
+import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.metrics import INTENT_CONFIDENCE, INTENT_ROUTES
+
+logger = logging.getLogger(__name__)
+
+# intent -> {phrase: weight}; a weight is how strongly the phrase alone implies
+# the intent. Intents starting with "_" are modifiers: "_complex" phrases lower
+# the confidence (chained, recurring or conditional requests need the LLM).
+DEFAULT_LEXICON: Dict[str, Dict[str, float]] = {
+    "reminder": {
+        "remind me": 0.7, "remind": 0.6, "reminder": 0.65, "don't forget": 0.6,
+        "dont forget": 0.6, "remember to": 0.55,
+    },
+    "schedule": {
+        "meeting": 0.6, "meet with": 0.6, "appointment": 0.65, "schedule": 0.55,
+        "lunch with": 0.6, "dinner with": 0.6, "coffee with": 0.6, "call with": 0.55,
+        "sync with": 0.55, "1:1": 0.6, "one on one": 0.6, "standup": 0.55,
+        "interview": 0.5, "book": 0.4,
+    },
+    "task": {
+        "todo": 0.65, "to-do": 0.65, "need to": 0.5, "have to": 0.45, "finish": 0.5,
+        "submit": 0.5, "buy": 0.5, "pay": 0.45, "pick up": 0.45, "review": 0.45,
+        "fix": 0.45, "send": 0.4, "email": 0.4, "write": 0.4, "clean": 0.4, "call": 0.35,
+    },
+    "reschedule": {
+        "reschedule": 0.65, "postpone": 0.6, "push back": 0.55, "move my": 0.5, "move the": 0.45,
+    },
+    "cancel": {
+        "cancel": 0.65, "call off": 0.6,
+    },
+    "_complex": {
+        "and then": 0.3, "then": 0.25, "also": 0.2, "and": 0.15, "every": 0.4, "daily": 0.4,
+        "weekly": 0.4, "monthly": 0.4, "each": 0.3, "if": 0.35, "unless": 0.35, "until": 0.2,
+        "before": 0.2, "after": 0.2, "instead": 0.3, "or": 0.2, "between": 0.25,
+    },
+}
+
+# Only these can be answered without an LLM; cancel/reschedule need to find existing events
+LOCAL_INTENTS = ("reminder", "schedule", "task")
+
+# Verbs that usually sit inside other intents ("remind me to call ...") and do not compete
+WEAK_INTENTS = ("task",)
+
+DEFAULT_DURATIONS = {"schedule": 60, "reminder": 0, "task": 30}
+DEFAULT_TITLES = {"schedule": "Meeting", "reminder": "Reminder", "task": "Task"}
+
+def load_lexicon(path: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """DEFAULT_LEXICON, extended or overridden per phrase by a JSON file of the same shape"""
+    lexicon = {intent: dict(phrases) for intent, phrases in DEFAULT_LEXICON.items()}
+    if path:
+        with open(path) as f:
+            for intent, phrases in json.load(f).items():
+                lexicon.setdefault(intent, {}).update({p.lower(): float(w) for p, w in phrases.items()})
+    return lexicon
+
+class PhraseMatcher:
+    """Aho-Corasick automaton: every phrase occurrence in one pass over the text
+
+    Matches are reported only on word boundaries, so "schedule" does not
+    fire inside "reschedule".
+    """
+
+    def __init__(self, phrases: Dict[str, Any]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+        for phrase, value in phrases.items():
+            self._add(phrase, value)
+        self._build()
+
+    def _add(self, phrase: str, value: Any):
+        node = 0
+        for ch in phrase:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(phrase), value))
+
+    def _build(self):
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        """(start, end, value) for each whole-word match, in order of end position"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for index, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, value in out[state]:
+                start, end = index + 1 - length, index + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    yield start, end, value
+
+# Date, time and duration extraction
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+PARTS_OF_DAY = {"morning": 9, "afternoon": 14, "evening": 18, "tonight": 20, "noon": 12, "midnight": 0}
+UNIT_MINUTES = {"m": 1, "min": 1, "mins": 1, "minute": 1, "minutes": 1, "h": 60, "hr": 60, "hrs": 60,
+                "hour": 60, "hours": 60, "day": 1440, "days": 1440, "week": 10080, "weeks": 10080}
+
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+_AMOUNT = r"(\d+(?:\.\d+)?|an?|half an?)"
+_UNIT = r"(minutes?|mins?|m|hours?|hrs?|h|days?|weeks?)"
+
+RELATIVE_RE = re.compile(rf"\bin\s+{_AMOUNT}\s*{_UNIT}\b")
+DURATION_RE = re.compile(rf"\b(?:for\s+{_AMOUNT}\s*{_UNIT}|(\d+(?:\.\d+)?)[\s-]*(minutes?|mins?|hours?|hrs?)(?:\s+long)?)\b")
+DAY_RE = re.compile(r"\b(?:(day after tomorrow)|(today)|(tomorrow)|(?:(next|this|on|by)\s+)?(monday|tuesday|wednesday|thursday|friday|saturday|sunday))\b")
+MONTH_DAY_RE = re.compile(rf"\b(?:{_MONTH}\s+(\d{{1,2}})(?:st|nd|rd|th)?|(\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?{_MONTH})\b")
+CLOCK_RE = re.compile(r"\b(?:at\s+)?(\d{1,2})(?::([0-5]\d))?\s*(am|pm|a\.m\.|p\.m\.)(?![a-z])|\b(?:at\s+)?([01]?\d|2[0-3]):([0-5]\d)\b")
+PART_RE = re.compile(r"\b(?:at\s+|in the\s+|this\s+)?(morning|afternoon|evening|tonight|noon|midnight)\b")
+
+def _amount(value: str) -> float:
+    if value in ("a", "an"):
+        return 1
+    if value.startswith("half"):
+        return 0.5
+    return float(value)
+
+def extract_when(text: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Find a start time, date and duration in lower-cased text
+
+    Returns {"start", "has_date", "has_time", "relative", "duration_minutes",
+    "spans"}; start is None when nothing was found, and relative is true
+    when it is an offset from now ("in 2 hours") rather than a wall-clock
+    date or time.
+    """
+    now = now or datetime.utcnow()
+    spans: List[Tuple[int, int]] = []
+
+    def claim(match) -> bool:
+        start, end = match.span()
+        if any(start < e and s < end for s, e in spans):
+            return False
+        spans.append((start, end))
+        return True
+
+    day: Optional[datetime] = None
+    clock: Optional[Tuple[int, int]] = None
+    start: Optional[datetime] = None
+    duration: Optional[int] = None
+    relative = False
+
+    for match in RELATIVE_RE.finditer(text):
+        if claim(match):
+            start = now + timedelta(minutes=_amount(match.group(1)) * UNIT_MINUTES[match.group(2)])
+            relative = True
+            break
+
+    for match in DURATION_RE.finditer(text):
+        if claim(match):
+            amount, unit = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+            duration = int(_amount(amount) * UNIT_MINUTES[unit])
+            break
+
+    for match in DAY_RE.finditer(text):
+        if not claim(match):
+            continue
+        after_tomorrow, today, tomorrow, _, weekday = match.groups()
+        if today:
+            day = now
+        elif tomorrow:
+            day = now + timedelta(days=1)
+        elif after_tomorrow:
+            day = now + timedelta(days=2)
+        else:
+            ahead = (WEEKDAYS.index(weekday) - now.weekday()) % 7 or 7
+            day = now + timedelta(days=ahead)
+        break
+
+    if day is None:
+        for match in MONTH_DAY_RE.finditer(text):
+            month = match.group(1) or match.group(4)
+            number = int(match.group(2) or match.group(3))
+            try:
+                candidate = now.replace(month=MONTHS.index(month[:3]) + 1, day=number)
+            except ValueError:
+                continue
+            if claim(match):
+                day = candidate if candidate.date() >= now.date() else candidate.replace(year=now.year + 1)
+                break
+
+    for match in CLOCK_RE.finditer(text):
+        if not claim(match):
+            continue
+        if match.group(3):
+            hour, minute = int(match.group(1)) % 12, int(match.group(2) or 0)
+            if match.group(3).startswith("p"):
+                hour += 12
+        else:
+            hour, minute = int(match.group(4)), int(match.group(5))
+        if hour < 24:
+            clock = (hour, minute)
+        break
+
+    if clock is None:
+        for match in PART_RE.finditer(text):
+            if claim(match):
+                clock = (PARTS_OF_DAY[match.group(1)], 0)
+                if match.group(1) == "tonight" and day is None:
+                    day = now
+                break
+
+    if start is None and (day is not None or clock is not None):
+        hour, minute = clock if clock is not None else (9, 0)
+        start = (day or now).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if day is None and start <= now:
+            start += timedelta(days=1)
+
+    return {
+        "start": start,
+        "has_date": day is not None or (start is not None and clock is None),
+        "has_time": clock is not None or (start is not None and day is None),
+        "relative": relative,
+        "duration_minutes": duration,
+        "spans": sorted(spans)
+    }
+
+# Leading filler dropped from titles once the date/time words are cut out
+TITLE_PREFIX_RE = re.compile(
+    r"^(?:please\s+)?(?:remind me(?:\s+to|\s+about)?|reminder(?:\s+to)?|don'?t forget(?:\s+to)?|"
+    r"remember to|schedule(?:\s+an?)?|set up(?:\s+an?)?|book(?:\s+an?)?|i need to|need to|i have to|"
+    r"have to|todo:?|to-do:?|add(?:\s+a)?\s+task(?:\s+to)?)\s+"
+)
+TITLE_EDGE_RE = re.compile(r"^(?:to|about|that|a|an|the|on|at|for|by)\s+|\s+(?:on|at|for|by|from|to|in)$")
+
+class IntentRouter:
+    """Tiered router in front of card generation
+
+    Scores the capture against the intent lexicon and the extracted date/time;
+    simple, confident reminders, meetings and tasks become cards locally and
+    everything else falls through to the LLM. Every decision carries its
+    confidence.
+    """
+
+    def __init__(
+        self,
+        lexicon: Optional[Dict[str, Dict[str, float]]] = None,
+        threshold: Optional[float] = None
+    ):
+        self.enabled = os.getenv("INTENT_ROUTER", "true").lower() == "true"
+        self.threshold = threshold or float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.75"))
+        self.max_words = int(os.getenv("INTENT_ROUTER_MAX_WORDS", "20"))
+        self.lexicon = lexicon or load_lexicon(os.getenv("INTENT_LEXICON_PATH"))
+
+        # One phrase may signal several intents; the automaton maps it to all of them
+        entries: Dict[str, List[Tuple[str, float]]] = {}
+        for intent, phrases in self.lexicon.items():
+            for phrase, weight in phrases.items():
+                entries.setdefault(phrase.lower(), []).append((intent, weight))
+        self.matcher = PhraseMatcher(entries)
+
+    def route(self, text: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Decide local vs LLM: {"route", "intent", "confidence", "reasons", "when"}"""
+        normalized = text.lower().replace("’", "'").strip()
+        words = len(normalized.split())
+        reasons: List[str] = []
+
+        # Longest match wins where phrases overlap ("remind me" over "remind")
+        matches = sorted(self.matcher.find(normalized), key=lambda m: (m[0], m[0] - m[1]))
+        kept: List[Tuple[int, int, List[Tuple[str, float]]]] = []
+        for match in matches:
+            if not kept or match[0] >= kept[-1][1]:
+                kept.append(match)
+
+        # Noisy-OR of the phrase weights per intent
+        misses: Dict[str, float] = {}
+        for _, _, signals in kept:
+            for intent, weight in signals:
+                misses[intent] = misses.get(intent, 1.0) * (1 - weight)
+        scores = {intent: 1 - miss for intent, miss in misses.items() if not intent.startswith("_")}
+        complexity = 1 - misses.get("_complex", 1.0)
+
+        when = extract_when(normalized, now)
+        if not scores or words == 0:
+            return self._decision("llm", None, 0.0, ["no intent phrase"], when)
+
+        strong = {i: s for i, s in scores.items() if i not in WEAK_INTENTS}
+        intent = max(strong or scores, key=lambda i: (strong or scores)[i])
+        confidence = scores[intent]
+
+        if when["has_time"]:
+            confidence += 0.2
+        if when["has_date"]:
+            confidence += 0.1
+        if when["duration_minutes"]:
+            confidence += 0.05
+        if words <= 8:
+            confidence += 0.1
+        if words > self.max_words:
+            confidence -= 0.2
+            reasons.append("long text")
+        if complexity:
+            confidence -= complexity
+            reasons.append("chained, recurring or conditional")
+        if normalized.endswith("?"):
+            confidence -= 0.3
+            reasons.append("question")
+        competing = [s for i, s in strong.items() if i != intent]
+        if competing:
+            confidence -= 0.6 * max(competing)
+            reasons.append("several intents")
+        if intent == "schedule" and not when["has_time"]:
+            confidence -= 0.25
+            reasons.append("no time for an event")
+        if intent == "reminder" and when["start"] is None:
+            confidence -= 0.1
+            reasons.append("no time for a reminder")
+
+        confidence = round(max(0.0, min(0.99, confidence)), 3)
+        if intent not in LOCAL_INTENTS:
+            reasons.append(f"{intent} needs existing events")
+            return self._decision("llm", intent, confidence, reasons, when)
+        if confidence < self.threshold:
+            reasons.append("below threshold")
+            return self._decision("llm", intent, confidence, reasons, when)
+        return self._decision("local", intent, confidence, reasons, when)
+
+    @staticmethod
+    def _decision(route: str, intent: Optional[str], confidence: float, reasons: List[str], when: Dict[str, Any]) -> Dict[str, Any]:
+        return {"route": route, "intent": intent, "confidence": confidence, "reasons": reasons, "when": when}
+
+    def build_cards(
+        self,
+        decision: Dict[str, Any],
+        text: str,
+        user_id: str,
+        now: Optional[datetime] = None,
+        tz: Optional[tzinfo] = None
+    ) -> List[Dict]:
+        """The card for a locally routed capture, shaped like the LLM clients' cards
+
+        The decision's times are wall-clock times in tz (UTC when None); the
+        card carries them as naive UTC like every other card.
+        """
+        now = now or datetime.utcnow()
+        intent, when = decision["intent"], decision["when"]
+        duration = when["duration_minutes"] if when["duration_minutes"] is not None else DEFAULT_DURATIONS[intent]
+        start = when["start"]
+        if start is not None and tz is not None:
+            start = start.replace(tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)
+        start = start or (now + timedelta(hours=1)).replace(second=0, microsecond=0)
+        title = self.title(text, when["spans"]) or DEFAULT_TITLES[intent]
+
+        return [{
+            "card_id": str(uuid.uuid4()),
+            "type": intent,
+            "title": title,
+            "description": text.strip(),
+            "primary_action": {
+                "event_title": title,
+                "start_time": start.isoformat(),
+                "end_time": (start + timedelta(minutes=duration)).isoformat(),
+                "duration_minutes": duration,
+                "notes": text.strip()
+            },
+            "alternatives": [],
+            "confidence": decision["confidence"],
+            "metadata": {
+                "urgency": "medium",
+                "flexibility": "flexible",
+                "priority": "medium",
+                "source": "intent_router"
+            },
+            "created_at": now.isoformat(),
+            "status": "pending",
+            "user_id": user_id
+        }]
+
+    @staticmethod
+    def title(text: str, spans: List[Tuple[int, int]]) -> str:
+        """The capture without its date/time words and leading filler"""
+        normalized = text.replace("’", "'").strip()
+        kept, last = [], 0
+        for start, end in spans:
+            kept.append(normalized[last:start])
+            last = end
+        kept.append(normalized[last:])
+        title = " ".join(" ".join(kept).split()).strip(" ,.;:!-")
+
+        previous = None
+        while previous != title:
+            previous = title
+            title = TITLE_PREFIX_RE.sub("", title, count=1)
+            title = TITLE_EDGE_RE.sub("", title).strip(" ,.;:!-")
+        return title[:1].upper() + title[1:80]
+
+    def cards_for(self, text: str, user_id: str, tz: Optional[tzinfo] = None) -> Optional[List[Dict]]:
+        """Local cards when the router is confident, else None (use the LLM)
+
+        Dates and clock times are read in tz, the user's timezone. Without
+        one they are left to the LLM rather than resolved against UTC.
+        """
+        if not self.enabled:
+            return None
+        decision = self.route(text, datetime.now(tz).replace(tzinfo=None) if tz is not None else None)
+        when = decision["when"]
+        if decision["route"] == "local" and tz is None and when["start"] is not None and not when["relative"]:
+            decision = self._decision(
+                "llm", decision["intent"], decision["confidence"],
+                decision["reasons"] + ["no timezone for a date or time"], when
+            )
+        INTENT_ROUTES.inc(route=decision["route"], intent=decision["intent"] or "none")
+        INTENT_CONFIDENCE.observe(decision["confidence"], route=decision["route"])
+        logger.debug(
+            "Routed %s: %s %.2f %s", decision["route"], decision["intent"],
+            decision["confidence"], ", ".join(decision["reasons"])
+        )
+        if decision["route"] != "local":
+            return None
+        return self.build_cards(decision, text, user_id, tz=tz)
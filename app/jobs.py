@@ -0,0 +1,287 @@
+# app/jobs.py
+import asyncio
+import itertools
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# handler(job) runs the work and returns the job result
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+class JobQueue:
+    """Background execution of capture jobs"""
+
+    async def start(self):
+        raise NotImplementedError
+
+    async def stop(self):
+        raise NotImplementedError
+
+    async def submit(self, payload: Dict[str, Any], dedup_key: Optional[str] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+class InProcessJobQueue(JobQueue):
+    """asyncio worker pool inside the web process (single worker and tests)"""
+
+    def __init__(
+        self,
+        handler: JobHandler,
+        workers: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        retry_backoff_seconds: Optional[float] = None,
+        max_jobs: Optional[int] = None
+    ):
+        self.handler = handler
+        self.worker_count = workers or int(os.getenv("JOB_WORKERS", "4"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("JOB_MAX_RETRIES", "2"))
+        self.retry_backoff_seconds = retry_backoff_seconds or float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "1"))
+        self.max_jobs = max_jobs or int(os.getenv("JOB_HISTORY_SIZE", "10000"))
+
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._dedup: Dict[str, str] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list = []
+        self._retry_handles: set = set()
+
+        self.running = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.deduplicated = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for handle in self._retry_handles:
+            handle.cancel()
+        self._retry_handles.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, payload: Dict[str, Any], dedup_key: Optional[str] = None) -> Dict[str, Any]:
+        if dedup_key is not None:
+            existing = self.jobs.get(self._dedup.get(dedup_key, ""))
+            if existing is not None and existing["status"] not in TERMINAL_STATUSES:
+                self.deduplicated += 1
+                return {**self._view(existing), "deduplicated": True}
+
+        now = datetime.utcnow().isoformat()
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "status": "queued",
+            "payload": payload,
+            "dedup_key": dedup_key,
+            "attempts": 0,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now
+        }
+        self.jobs[job["job_id"]] = job
+        if dedup_key is not None:
+            self._dedup[dedup_key] = job["job_id"]
+        self._prune()
+        self._queue.put_nowait(job)
+        return {**self._view(job), "deduplicated": False}
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        return self._view(job) if job is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "inprocess",
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "running": self.running,
+            "workers": self.worker_count,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "deduplicated": self.deduplicated
+        }
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            job["status"] = "running"
+            job["attempts"] += 1
+            job["updated_at"] = datetime.utcnow().isoformat()
+            self.running += 1
+            try:
+                job["result"] = await self.handler(job)
+                job["error"] = None
+                job["status"] = "succeeded"
+                self.succeeded += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job["error"] = str(e)
+                if job["attempts"] <= self.max_retries:
+                    job["status"] = "retrying"
+                    self.retried += 1
+                    self._schedule_retry(job)
+                else:
+                    job["status"] = "failed"
+                    self.failed += 1
+                    logger.error("Job %s failed after %s attempts: %s", job['job_id'], job['attempts'], e)
+            finally:
+                self.running -= 1
+                job["updated_at"] = datetime.utcnow().isoformat()
+                if job["status"] in TERMINAL_STATUSES and job["dedup_key"] is not None:
+                    if self._dedup.get(job["dedup_key"]) == job["job_id"]:
+                        del self._dedup[job["dedup_key"]]
+
+    def _schedule_retry(self, job: Dict[str, Any]):
+        # Exponential backoff without holding a worker
+        delay = self.retry_backoff_seconds * (2 ** (job["attempts"] - 1))
+
+        def requeue():
+            self._retry_handles.discard(handle)
+            job["status"] = "queued"
+            self._queue.put_nowait(job)
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retry_handles.add(handle)
+
+    def _prune(self):
+        # Oldest finished jobs go first; unfinished ones are kept wherever they are
+        excess = len(self.jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        finished = (job_id for job_id, job in self.jobs.items() if job["status"] in TERMINAL_STATUSES)
+        for job_id in list(itertools.islice(finished, excess)):
+            del self.jobs[job_id]
+
+    @staticmethod
+    def _view(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in job.items() if k not in ("payload", "dedup_key")}
+
+class CeleryJobQueue(JobQueue):
+    """Celery-backed queue; jobs run in `celery -A app.celery_worker worker` processes
+
+    Dedup keys are claimed in Redis with SET NX, so every web process sees
+    them, and expire with the job results (JOB_RESULT_TTL_SECONDS).
+    """
+
+    # Drops a dedup claim only if it still names the given job
+    _RELEASE_SCRIPT = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, dedup_prefix: str = "sera:jobs:dedup:"):
+        from app.celery_worker import celery_app, run_capture_job
+
+        self.celery_app = celery_app
+        self.task = run_capture_job
+        self.redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.dedup_prefix = dedup_prefix
+        self.dedup_ttl_seconds = int(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+        self._redis = None
+        self.submitted = 0
+        self.deduplicated = 0
+
+    async def start(self):
+        import redis.asyncio as redis
+
+        if self._redis is None:
+            self._redis = redis.from_url(self.redis_url)
+
+    async def stop(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def submit(self, payload: Dict[str, Any], dedup_key: Optional[str] = None) -> Dict[str, Any]:
+        job_id = str(uuid.uuid4())
+        if dedup_key is not None:
+            await self.start()
+            key = self.dedup_prefix + dedup_key
+            existing = await self._claim(key, job_id)
+            if existing is not None:
+                self.deduplicated += 1
+                return {**existing, "deduplicated": True}
+
+        try:
+            await asyncio.to_thread(self.task.apply_async, args=[job_id, payload], task_id=job_id)
+        except Exception:
+            if dedup_key is not None:
+                # A retry must not be deduplicated onto a job that was never queued
+                await self._release(key, job_id)
+            raise
+        self.submitted += 1
+        return {"job_id": job_id, "status": "queued", "deduplicated": False}
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        result = self.celery_app.AsyncResult(job_id)
+        state = await asyncio.to_thread(lambda: result.state)
+        status = {
+            "PENDING": "queued",
+            "RECEIVED": "queued",
+            "STARTED": "running",
+            "RETRY": "retrying",
+            "SUCCESS": "succeeded",
+            "FAILURE": "failed"
+        }.get(state, state.lower())
+        job = {"job_id": job_id, "status": status, "result": None, "error": None}
+        if status == "succeeded":
+            job["result"] = result.result
+        elif status == "failed":
+            job["error"] = str(result.result)
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "celery",
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated
+        }
+
+    async def _claim(self, key: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """Claim key for job_id, or return the unfinished job that holds it"""
+        while not await self._redis.set(key, job_id, nx=True, ex=self.dedup_ttl_seconds):
+            holder = await self._redis.get(key)
+            if holder is None:
+                # Expired between the two calls
+                continue
+            holder = holder.decode("utf-8")
+            existing = await self.get(holder)
+            if existing is not None and existing["status"] not in TERMINAL_STATUSES:
+                return existing
+            # Finished: free the key, unless another process already took it over
+            await self._release(key, holder)
+        return None
+
+    async def _release(self, key: str, job_id: str):
+        await self._redis.eval(self._RELEASE_SCRIPT, 1, key, job_id)
+
+def create_job_queue(handler: JobHandler) -> JobQueue:
+    """Pick the job backend from JOB_BACKEND (inprocess or celery)"""
+    backend = os.getenv("JOB_BACKEND", "inprocess").lower()
+    if backend == "celery":
+        # Workers push results to sockets held by the web processes
+        if os.getenv("MESSAGE_BUS", "loopback").lower() != "redis":
+            raise ValueError("JOB_BACKEND=celery requires MESSAGE_BUS=redis")
+        return CeleryJobQueue()
+    if backend == "inprocess":
+        return InProcessJobQueue(handler)
+    raise ValueError(f"Unknown JOB_BACKEND '{backend}'")
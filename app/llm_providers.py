@@ -0,0 +1,71 @@
+# app/llm_providers.py
+import asyncio
+import importlib
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# name -> "module:Class"; modules are imported only when the provider is built
+PROVIDERS: Dict[str, str] = {
+    "gemini": "app.gemini_client:GeminiClient",
+    "simple": "app.simple_gemini:SimpleGeminiClient",
+    "emergency": "app.emergency_client:EmergencyClient",
+    "fake": "app.fake_llm:FakeLLMClient",
+}
+
+def register_provider(name: str, target: str):
+    """Add or replace a provider given as "module:Class" """
+    PROVIDERS[name] = target
+
+def build_provider(name: str) -> Any:
+    """Import and construct one provider; raises if it is unknown or fails to build"""
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider '{name}' (known: {', '.join(PROVIDERS)})")
+    module_name, class_name = PROVIDERS[name].split(":")
+    started = time.perf_counter()
+    client = getattr(importlib.import_module(module_name), class_name)()
+    logger.info("LLM provider %s ready in %.0f ms", name, (time.perf_counter() - started) * 1000)
+    return client
+
+def provider_chain(preferred: Optional[str] = None) -> List[str]:
+    """Providers to try in order: LLM_PROVIDER, then LLM_FALLBACK_PROVIDERS
+
+    LLM_PROVIDER=auto (the default) means gemini when an API key is set,
+    otherwise the simple rule-based client.
+    """
+    preferred = (preferred or os.getenv("LLM_PROVIDER", "auto")).lower()
+    if preferred == "auto":
+        preferred = "gemini" if os.getenv("GEMINI_API_KEY") else "simple"
+    fallbacks = os.getenv("LLM_FALLBACK_PROVIDERS", "simple,emergency")
+    chain = [preferred] + [name.strip().lower() for name in fallbacks.split(",") if name.strip()]
+    return list(dict.fromkeys(chain))
+
+def create_llm_client(preferred: Optional[str] = None) -> Tuple[str, Any]:
+    """Build the first provider in the chain that constructs; returns (name, client)"""
+    chain = provider_chain(preferred)
+    for name in chain:
+        try:
+            return name, build_provider(name)
+        except Exception as e:
+            logger.error("LLM provider %s failed: %s", name, e)
+    raise RuntimeError(f"No LLM provider could be built (tried {', '.join(chain)})")
+
+async def warm_up(client: Any, timeout: Optional[float] = None) -> Optional[str]:
+    """Make one cheap upstream call so the first capture skips connection setup
+
+    Runs only when LLM_WARMUP is true; failures are logged, never raised.
+    """
+    if os.getenv("LLM_WARMUP", "false").lower() != "true":
+        return None
+    timeout = timeout or float(os.getenv("LLM_WARMUP_TIMEOUT_SECONDS", "10"))
+    started = time.perf_counter()
+    try:
+        status = await asyncio.wait_for(client.health_check(), timeout=timeout)
+    except Exception as e:
+        logger.warning("LLM warm-up failed: %s", e)
+        return None
+    logger.info("LLM warm-up %s in %.0f ms", status, (time.perf_counter() - started) * 1000)
+    return status
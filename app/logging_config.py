@@ -0,0 +1,84 @@
+# app/logging_config.py
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.codec import dumps
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRIBUTES}
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message and extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_fields(record)
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return dumps(entry)
+
+class TextFormatter(logging.Formatter):
+    """Human-readable line with extra fields appended as key=value"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None):
+    """Route the app's loggers through a queue so handlers never block the event loop
+
+    Records are enqueued by the caller and written to stdout by a listener
+    thread. LOG_LEVEL sets the level, LOG_FORMAT picks text or json.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "text")).lower()
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    logger = logging.getLogger("app")
+    logger.setLevel(level)
+    _queue_handler = logging.handlers.QueueHandler(records)
+    logger.addHandler(_queue_handler)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        logging.getLogger("app").removeHandler(_queue_handler)
+        _listener.stop()
+        _listener = None
+        _queue_handler = None
@@ -1,77 +1,87 @@
 # app/main.py
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
-import json
+import asyncio
+import hashlib
+import logging
 import uuid
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Set, Union
 import os
 from dotenv import load_dotenv
 
 # Load environment variables FIRST - before any other imports
 load_dotenv(".env")
 
-print("🔧 Environment check:")
-print(f"   GEMINI_API_KEY present: {bool(os.getenv('GEMINI_API_KEY'))}")
-print(f"   Working directory: {os.getcwd()}")
-
-# Now import components with proper error handling
-try:
-    # Try to import the real Gemini client first
-    from app.gemini_client import GeminiClient
-    gemini = GeminiClient()
-    GEMINI_AVAILABLE = True
-    print("✅ Real Gemini client loaded successfully")
-except Exception as e:
-    print(f"❌ Real Gemini client failed: {e}")
-    print("🔧 Falling back to simple test client...")
-    try:
-        # Fallback to simple client
-        from app.simple_gemini import SimpleGeminiClient
-        gemini = SimpleGeminiClient()
-        GEMINI_AVAILABLE = False
-        print("✅ Simple test client loaded successfully")
-    except Exception as fallback_error:
-        print(f"❌ Even fallback client failed: {fallback_error}")
-        print("🔄 Creating emergency fallback...")
-        # Emergency fallback
-        class EmergencyClient:
-            async def process_user_query(self, text, user_id):
-                return [{
-                    "card_id": str(uuid.uuid4()),
-                    "type": "schedule", 
-                    "title": "Emergency Card",
-                    "description": f"Processing: {text}",
-                    "primary_action": {"event_title": "Event"},
-                    "status": "pending",
-                    "user_id": user_id,
-                    "created_at": datetime.utcnow().isoformat()
-                }]
-            async def health_check(self): return "emergency"
-            async def process_card_action(self, *args, **kwargs): 
-                return {"message": "Action processed"}
-        gemini = EmergencyClient()
-        GEMINI_AVAILABLE = False
+from app.logging_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
 
 from app.websocket_manager import ConnectionManager
-from app.database import DatabaseManager
+from app.message_bus import create_message_bus
+from app.storage import create_storage
+from app.response_cache import ResponseCache
+from app.health import HealthMonitor
+from app.retention import RetentionJob
+from app.action_engine import ActionEngine, ActionError
+from app.card_cache import CardCache
+from app.user_context import UserContextStore, user_timezone
+from app.intent_router import IntentRouter
+from app.scheduler import SchedulingEngine
+from app.admission import AdmissionController, AdmissionError, Overloaded, INTERACTIVE, BATCH, BACKGROUND
+from app.audio import AudioError, AudioUpload, create_transcriber
+from app.models import UserPreference
+from app.jobs import create_job_queue
+from app.codec import FastJSONResponse, loads
+from app.metrics import REGISTRY, ADMISSION_DECISIONS, AUDIO_UPLOADS, LLM_FALLBACKS, InstrumentationMiddleware, timed
+from app.llm_providers import build_provider, create_llm_client, warm_up
+
+# The LLM client is built in lifespan from LLM_PROVIDER (see app/llm_providers.py);
+# a client assigned here beforehand (tests, benchmarks) is kept
+gemini = None
+llm_provider: Optional[str] = None
+# Rule-based client captures degrade to when the LLM is saturated; built on first use
+degraded_llm = None
+# Speech-to-text for WebSocket audio (AUDIO_TRANSCRIBER); built on first use
+transcriber = None
+# Audio uploads being transcribed and captured after their socket moved on
+audio_tasks: Set[asyncio.Task] = set()
 
 # Lifespan events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global gemini, llm_provider
     # Startup
+    if gemini is None:
+        llm_provider, gemini = create_llm_client()
+    elif llm_provider is None:
+        llm_provider = type(gemini).__name__
+    await warm_up(gemini)
+    await db.connect()
     await db.init_db()
-    print("🚀 SERA Backend starting up...")
-    print(f"🔧 Gemini API: {'Available' if GEMINI_AVAILABLE else 'Test Mode'}")
+    await websocket_manager.start()
+    await job_queue.start()
+    await health_monitor.start()
+    await retention_job.start()
+    logger.info("SERA Backend starting up...")
+    logger.info("LLM provider: %s", llm_provider)
     yield
     # Shutdown
-    print("🛑 SERA Backend shutting down...")
+    logger.info("SERA Backend shutting down...")
+    for task in list(audio_tasks):
+        task.cancel()
+    await retention_job.stop()
+    await health_monitor.stop()
+    await job_queue.stop()
+    await websocket_manager.stop()
+    await db.close()
 
 app = FastAPI(
     title="SERA Backend", 
     version="1.0.0", 
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # CORS
@@ -81,41 +91,408 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After"],
 )
 
+# Per-request latency and per-stage Server-Timing
+app.add_middleware(InstrumentationMiddleware)
+
 # Initialize components
-websocket_manager = ConnectionManager()
-db = DatabaseManager()
+websocket_manager = ConnectionManager(create_message_bus())
+# Backend and DSN from STORAGE_BACKEND / DATABASE_URL (see app/storage.py)
+db = create_storage()
+response_cache = ResponseCache(db)
+
+# Recently generated/used cards, read through from the database on a miss
+card_cache = CardCache(db)
+
+# Preferences and recent decisions, injected into prompts
+user_contexts = UserContextStore(db)
+
+# Expires old rejected/stale cards and sessions, then compacts the database
+retention_job = RetentionJob(db)
+
+# Simple, confident captures become cards locally, without an LLM call
+intent_router = IntentRouter()
+
+# Per-user free/busy index: conflict checks, free slots and card alternatives
+scheduler = SchedulingEngine(db, user_contexts)
+
+# Per-user rate limits on captures and a priority-aware cap on concurrent LLM calls
+admission = AdmissionController()
+
+health_monitor = HealthMonitor()
+action_engine = ActionEngine()
+
+async def probe_llm():
+    try:
+        async with admission.llm_slot(BACKGROUND):
+            status = await gemini.health_check()
+    except Overloaded:
+        # Saturated by real traffic, which says nothing about the provider's health
+        return "busy"
+    if not status.startswith("healthy"):
+        raise RuntimeError(status)
+    return status
+
+async def probe_database():
+    await db.ping()
+    return "ok"
+
+async def probe_websockets():
+    return websocket_manager.stats()
+
+async def probe_caches():
+    return {
+        "cards": card_cache.stats(),
+        "responses": response_cache.stats(),
+        "user_contexts": user_contexts.stats(),
+        "schedules": scheduler.stats()
+    }
+
+async def probe_jobs():
+    return job_queue.stats()
+
+async def probe_retention():
+    return retention_job.stats()
+
+async def probe_admission():
+    return admission.stats()
+
+# The LLM is not critical for readiness: captures degrade to fallback cards
+health_monitor.register("llm", probe_llm, critical=False)
+health_monitor.register("database", probe_database)
+health_monitor.register("websockets", probe_websockets)
+health_monitor.register("caches", probe_caches, critical=False)
+health_monitor.register("jobs", probe_jobs, critical=False)
+health_monitor.register("retention", probe_retention, critical=False)
+health_monitor.register("admission", probe_admission, critical=False)
+
+# Point-in-time values read when /metrics is scraped
+REGISTRY.gauge("sera_ws_connections", "Open WebSocket connections", lambda: len(websocket_manager.active_connections))
+REGISTRY.gauge("sera_ws_queued_messages", "Messages waiting in socket send queues", lambda: websocket_manager.stats()["queued_messages"])
+REGISTRY.gauge("sera_jobs_queue_depth", "Capture jobs waiting for a worker", lambda: job_queue.stats().get("queue_depth", 0))
+REGISTRY.gauge("sera_llm_in_flight", "LLM calls holding an admission slot", lambda: admission.limiter.active)
+REGISTRY.gauge("sera_llm_queued", "LLM calls waiting for an admission slot", lambda: admission.limiter.queued)
+REGISTRY.gauge(
+    "sera_cache_entries", "Entries held in memory per cache",
+    lambda: {"card": card_cache.stats()["entries"], "response": response_cache.stats()["entries"]},
+    ("cache",)
+)
+
+# Card listing page sizes
+CARDS_PAGE_DEFAULT = int(os.getenv("CARDS_PAGE_DEFAULT", "100"))
+CARDS_PAGE_MAX = int(os.getenv("CARDS_PAGE_MAX", "500"))
+
+# Batch capture limits
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+# How often a long-running handler checks whether its HTTP client went away
+DISCONNECT_POLL_SECONDS = 0.25
+
+async def run_while_connected(http_request: Request, coro):
+    """Await coro, cancelling it if the HTTP client disconnects first"""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.warning("Client disconnected, cancelling request")
+                raise HTTPException(499, "Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+async def route_locally(user_text: str, user_id: str) -> Optional[List[Dict]]:
+    """Cards from the intent router, or None when the capture needs the LLM"""
+    tz = user_timezone((await user_contexts.get(user_id))["preferences"])
+    with timed("router", "route"):
+        return intent_router.cards_for(user_text, user_id, tz)
+
+async def degraded_cards(user_text: str, user_id: str, overloaded: Overloaded, priority: str) -> List[Dict]:
+    """Rule-based cards for a capture shed by admission control (never cached)"""
+    global degraded_llm
+    if not admission.degrade:
+        raise overloaded
+    if degraded_llm is None:
+        degraded_llm = build_provider("simple")
+    ADMISSION_DECISIONS.inc(decision="degraded", priority=priority)
+    LLM_FALLBACKS.inc(reason="overload")
+    cards = await degraded_llm.process_user_query(user_text, user_id)
+    for card in cards:
+        card["metadata"] = {**(card.get("metadata") or {}), "fallback": True, "degraded": True}
+    return cards
+
+async def generate_cards(user_text: str, user_id: str, priority: str = INTERACTIVE) -> List[Dict]:
+    """Route locally, else process with Gemini or fallback, reusing recent identical captures"""
+    local = await route_locally(user_text, user_id)
+    if local is not None:
+        return local
+    
+    context = await user_contexts.prompt_context(user_id)
+    
+    async def generate() -> List[Dict]:
+        try:
+            async with admission.llm_slot(priority):
+                with timed("llm", "process_user_query"):
+                    return await gemini.process_user_query(user_text, user_id, context=context["text"])
+        except Overloaded as e:
+            return await degraded_cards(user_text, user_id, e, priority)
+    
+    return await response_cache.get_or_generate(
+        user_text, user_id, generate, context=context["fingerprint"]
+    )
 
-# Storage
-active_cards: Dict[str, Dict] = {}
+def observe_cards(user_id: str, cards: List[Dict]):
+    """Add stored cards to the user's schedule"""
+    for card in cards:
+        scheduler.observe({**card, "user_id": card.get("user_id") or user_id})
+
+async def store_and_push(session_id: str, user_id: str, cards: List[Dict]) -> List[Dict]:
+    """Plan and persist a capture, push its cards to the user's sockets and return them"""
+    cards = await scheduler.plan(user_id, cards)
+    
+    # Store cards and session in one transaction
+    if not await db.store_capture(session_id, user_id, cards):
+        raise HTTPException(500, "Failed to store capture")
+    card_cache.put_many(cards)
+    observe_cards(user_id, cards)
+    
+    # Send via WebSocket
+    await websocket_manager.send_personal_message({
+        "type": "new_cards",
+        "session_id": session_id,
+        "cards": cards
+    }, user_id)
+    return cards
+
+async def process_capture_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Job handler: the same capture pipeline, run off the request path"""
+    payload = job["payload"]
+    # The session is named after the job, so a retry finds what an earlier
+    # attempt stored instead of storing the capture twice
+    session_id = job["job_id"]
+    user_id = payload.get("user_id", "default_user")
+    
+    cards = await db.get_session_cards(session_id)
+    if not cards:
+        cards = await generate_cards(payload.get("text", ""), user_id, priority=BATCH)
+        cards = await store_and_push(session_id, user_id, cards)
+    await websocket_manager.send_personal_message({
+        "type": "job_complete",
+        "job_id": job["job_id"],
+        "session_id": session_id
+    }, user_id)
+    return {"session_id": session_id, "cards": cards}
+
+job_queue = create_job_queue(process_capture_job)
 
 @app.post("/api/capture/text")
-async def capture_text(request: dict):
-    """Process text and generate cards"""
+async def capture_text(request: dict, http_request: Request, mode: str = "sync"):
+    """Process text and generate cards (mode=async queues a job and returns 202)"""
+    try:
+        session_id = str(uuid.uuid4())
+        user_text = request.get("text", "")
+        user_id = request.get("user_id", "default_user")
+        admission.admit({user_id: 1}, BATCH if mode == "async" else INTERACTIVE)
+        
+        if mode == "async":
+            dedup_key = request.get("idempotency_key") or hashlib.sha256(
+                f"{user_id}\x00{ResponseCache.normalize(user_text)}".encode("utf-8")
+            ).hexdigest()
+            job = await job_queue.submit({"text": user_text, "user_id": user_id}, dedup_key=dedup_key)
+            return FastJSONResponse(
+                job,
+                status_code=202,
+                headers={"Location": f"/api/jobs/{job['job_id']}"}
+            )
+        
+        logger.info("Processing: %s", user_text)
+        
+        cards = await run_while_connected(http_request, generate_cards(user_text, user_id))
+        cards = await store_and_push(session_id, user_id, cards)
+        
+        return {
+            "session_id": session_id,
+            "cards": cards,
+            "status": "success"
+        }
+    except AdmissionError as e:
+        raise HTTPException(e.status_code, str(e), headers=e.headers())
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"Processing failed: {str(e)}")
+
+@app.post("/api/capture/batch")
+async def capture_batch(request: Union[List[Dict[str, Any]], Dict[str, Any]], http_request: Request):
+    """Process many captures, packing them into as few LLM requests as possible"""
+    try:
+        raw_items = request.get("items", []) if isinstance(request, dict) else request
+        if not raw_items:
+            raise HTTPException(400, "No items to capture")
+        if not isinstance(raw_items, list):
+            raise HTTPException(422, "items must be a list")
+        if len(raw_items) > BATCH_MAX_ITEMS:
+            raise HTTPException(413, f"At most {BATCH_MAX_ITEMS} items per batch")
+        for index, item in enumerate(raw_items):
+            if not isinstance(item, dict):
+                raise HTTPException(422, f"Item {index} must be an object")
+            if not isinstance(item.get("user_id", ""), str):
+                raise HTTPException(422, f"Item {index}: user_id must be a string")
+        items = [{
+            "text": str(item.get("text", "")),
+            "user_id": item.get("user_id", "default_user")
+        } for item in raw_items]
+        costs: Dict[str, int] = {}
+        for item in items:
+            costs[item["user_id"]] = costs.get(item["user_id"], 0) + 1
+        admission.admit(costs, BATCH)
+        results: List[Optional[List[Dict]]] = [await route_locally(item["text"], item["user_id"]) for item in items]
+        contexts = {
+            user_id: await user_contexts.prompt_context(user_id)
+            for user_id in {item["user_id"] for item, cards in zip(items, results) if cards is None}
+        }
+        for item, cards in zip(items, results):
+            if cards is None:
+                item["context"] = contexts[item["user_id"]]["text"]
+                item["context_key"] = contexts[item["user_id"]]["fingerprint"]
+        
+        logger.info("Processing batch of %s captures", len(items))
+        
+        async def generate() -> List[List[Dict]]:
+            for index, item in enumerate(items):
+                if results[index] is None:
+                    results[index] = await response_cache.peek(item["text"], item["user_id"], item["context_key"])
+            misses = [index for index, cards in enumerate(results) if cards is None]
+            if misses:
+                generated = await generate_batch([items[index] for index in misses])
+                for index, cards in zip(misses, generated):
+                    results[index] = cards
+                    await response_cache.store(items[index]["text"], cards, items[index]["context_key"])
+            return results
+        
+        results = await run_while_connected(http_request, generate())
+        
+        # All captures in one transaction; a user's later captures avoid the
+        # earlier ones, which are not in the schedule until stored
+        captures = []
+        planned_by_user: Dict[str, List[Dict]] = {}
+        for item, cards in zip(items, results):
+            planned_by_user.setdefault(item["user_id"], [])
+            cards = await scheduler.plan(item["user_id"], cards, earlier=planned_by_user[item["user_id"]])
+            planned_by_user[item["user_id"]].extend(cards)
+            captures.append((str(uuid.uuid4()), item["user_id"], cards))
+        if not await db.store_captures(captures):
+            raise HTTPException(500, "Failed to store captures")
+        
+        for session_id, user_id, cards in captures:
+            card_cache.put_many(cards)
+            observe_cards(user_id, cards)
+            await websocket_manager.send_personal_message({
+                "type": "new_cards",
+                "session_id": session_id,
+                "cards": cards
+            }, user_id)
+        
+        return {
+            "results": [{
+                "index": index,
+                "session_id": session_id,
+                "user_id": user_id,
+                "cards": cards
+            } for index, (session_id, user_id, cards) in enumerate(captures)],
+            "count": len(captures),
+            "status": "success"
+        }
+    except AdmissionError as e:
+        raise HTTPException(e.status_code, str(e), headers=e.headers())
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"Batch processing failed: {str(e)}")
+
+async def generate_batch(items: List[Dict[str, str]]) -> List[List[Dict]]:
+    """Packed generation when the client supports it, else bounded individual calls
+
+    Every LLM request, packed or not, holds its own BATCH admission slot.
+    """
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def generate_one(item: Dict[str, str]) -> List[Dict]:
+        async with limit:
+            try:
+                async with admission.llm_slot(BATCH):
+                    return await gemini.process_user_query(item["text"], item["user_id"], context=item["context"])
+            except Overloaded as e:
+                return await degraded_cards(item["text"], item["user_id"], e, BATCH)
+    
+    with timed("llm", "process_batch"):
+        if hasattr(gemini, "process_batch"):
+            return await gemini.process_batch(
+                items, slot=lambda: admission.llm_slot(BATCH), generate_one=generate_one
+            )
+        return await asyncio.gather(*(generate_one(item) for item in items))
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get the status (and result, once finished) of a capture job"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job
+
+@app.post("/api/capture/stream")
+async def capture_text_stream(request: dict, http_request: Request):
+    """Generate cards, pushing each over WebSocket as soon as it parses"""
     try:
         session_id = str(uuid.uuid4())
         user_text = request.get("text", "")
         user_id = request.get("user_id", "default_user")
         
-        print(f"📝 Processing: {user_text}")
+        admission.admit({user_id: 1})
         
-        # Process with Gemini or fallback
-        cards = await gemini.process_user_query(user_text, user_id)
+        logger.info("Streaming: %s", user_text)
         
-        # Store cards
-        for card in cards:
-            await db.store_card(card)
-            active_cards[card["card_id"]] = card
+        local = await route_locally(user_text, user_id)
+        context = await user_contexts.prompt_context(user_id) if local is None else None
         
-        # Store session
-        await db.store_session(session_id, user_id, cards)
+        async def generate() -> List[Dict]:
+            if local is not None:
+                return await push_card_events(session_id, user_id, completed_events(local))
+            cached = await response_cache.peek(user_text, user_id, context["fingerprint"])
+            if cached is not None:
+                return await push_card_events(session_id, user_id, completed_events(cached))
+            try:
+                async with admission.llm_slot(INTERACTIVE):
+                    if hasattr(gemini, "stream_user_query"):
+                        events = gemini.stream_user_query(user_text, user_id, context=context["text"])
+                    else:
+                        with timed("llm", "process_user_query"):
+                            generated = await gemini.process_user_query(user_text, user_id, context=context["text"])
+                        events = completed_events(generated)
+                    cards = await push_card_events(session_id, user_id, events)
+            except Overloaded as e:
+                degraded = await degraded_cards(user_text, user_id, e, INTERACTIVE)
+                return await push_card_events(session_id, user_id, completed_events(degraded))
+            await response_cache.store(user_text, cards, context["fingerprint"])
+            return cards
+        
+        cards = await run_while_connected(http_request, generate())
+        
+        # Store cards and session in one transaction
+        if not await db.store_capture(session_id, user_id, cards):
+            raise HTTPException(500, "Failed to store capture")
+        card_cache.put_many(cards)
+        observe_cards(user_id, cards)
         
-        # Send via WebSocket
         await websocket_manager.send_personal_message({
-            "type": "new_cards",
+            "type": "capture_complete",
             "session_id": session_id,
-            "cards": cards
+            "count": len(cards)
         }, user_id)
         
         return {
@@ -123,87 +500,413 @@ async def capture_text(request: dict):
             "cards": cards,
             "status": "success"
         }
+    except AdmissionError as e:
+        raise HTTPException(e.status_code, str(e), headers=e.headers())
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Processing failed: {str(e)}")
 
-@app.post("/api/cards/{card_id}/action")
-async def handle_card_action(card_id: str, action: dict):
-    """Handle card actions"""
+async def completed_events(cards: List[Dict]):
+    """Present already generated cards as a stream of complete events"""
+    for index, card in enumerate(cards):
+        yield {"event": "complete", "index": index, "card": card}
+
+async def push_card_events(session_id: str, user_id: str, events) -> List[Dict]:
+    """Forward card_partial/card_complete events to the user's sockets"""
+    cards = []
+    async for event in events:
+        if event["event"] == "complete":
+            card = (await scheduler.plan(user_id, [event["card"]], earlier=cards))[0]
+            cards.append(card)
+            await websocket_manager.send_personal_message({
+                "type": "card_complete",
+                "session_id": session_id,
+                "index": event["index"],
+                "card": card
+            }, user_id)
+        elif event["event"] == "partial":
+            await websocket_manager.send_personal_message({
+                "type": "card_partial",
+                "session_id": session_id,
+                "index": event["index"],
+                "received": event["received"]
+            }, user_id)
+    return cards
+
+async def refine_card(card_id: str, action_type: str, modifications: Optional[Dict], user_id: str):
+    """Ask the model to apply free-form edits after the action has been answered"""
     try:
-        card = active_cards.get(card_id)
+        card = await card_cache.get(card_id)
         if not card:
-            raise HTTPException(404, "Card not found")
+            return
+        async with admission.llm_slot(BACKGROUND):
+            with timed("llm", "process_card_action"):
+                result = await gemini.process_card_action(card_id, action_type, modifications, card)
         
+        # The model's edits are checked like the user's own and applied to
+        # the stored card, not the copy the model saw
+        changes = result.pop("changes", None)
+        updated = None
+        if isinstance(changes, dict) and changes:
+            try:
+                updated = await card_cache.modify(
+                    card_id, lambda current: action_engine.apply(current, "modify", changes)["card"]
+                )
+            except ActionError as e:
+                logger.warning("Discarding refinement of card %s: %s", card_id, e)
+                return
+            if updated is None:
+                return
+            scheduler.observe(updated)
+        
+        message = {
+            "type": "card_updated",
+            "card_id": card_id,
+            "action": action_type,
+            "result": result
+        }
+        if updated is not None:
+            message["card"] = updated
+        await websocket_manager.send_personal_message(message, user_id)
+    except Exception as e:
+        logger.error("Card refinement failed: %s", e)
+
+@app.post("/api/cards/{card_id}/action")
+async def handle_card_action(card_id: str, action: dict, background_tasks: BackgroundTasks):
+    """Handle card actions"""
+    try:
         action_type = action.get("action", "")
         user_id = action.get("user_id", "default_user")
+        modifications = action.get("modifications")
+        result: Dict[str, Any] = {}
         
-        # Process action
-        result = await gemini.process_card_action(card_id, action_type, action.get("modifications"))
+        def apply(card: Dict) -> Dict:
+            result.update(action_engine.apply(card, action_type, modifications))
+            return result["card"]
         
-        # Update card
-        await db.update_card_status(card_id, action_type)
-        card["status"] = action_type
+        # Apply the action locally to the stored card, in the same transaction
+        # as the write, so a change saved by another worker is never lost
+        try:
+            updated = await card_cache.modify(card_id, apply)
+        except ActionError as e:
+            raise HTTPException(400, str(e))
+        if updated is None:
+            raise HTTPException(404, "Card not found")
         
-        # Notify clients
-        await websocket_manager.broadcast({
+        # Notify the card owner's sockets
+        owner_id = updated.get("user_id") or user_id
+        scheduler.observe({**updated, "user_id": owner_id})
+        await websocket_manager.send_personal_message({
             "type": "card_updated",
             "card_id": card_id,
-            "action": action_type
-        })
+            "action": action_type,
+            "result": {"status": result["status"], "message": result["message"]}
+        }, owner_id)
+        
+        # Accepts/rejects feed the user's prompt context, off the response path
+        background_tasks.add_task(user_contexts.record_action, {**updated, "user_id": owner_id}, result["status"])
+        
+        # Free-form edits are refined by the model after we respond
+        if result["needs_generation"]:
+            background_tasks.add_task(refine_card, card_id, action_type, modifications, owner_id)
         
         return {
             "card_id": card_id,
-            "status": action_type,
+            "status": result["status"],
+            "card": updated,
+            "pending_refinement": result["needs_generation"],
             "success": True
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Action failed: {str(e)}")
 
 @app.get("/api/user/{user_id}/cards")
-async def get_user_cards(user_id: str):
-    """Get user cards"""
+async def get_user_cards(
+    user_id: str,
+    limit: int = Query(CARDS_PAGE_DEFAULT, ge=1, le=CARDS_PAGE_MAX),
+    before: Optional[str] = None,
+    status: Optional[str] = None,
+    card_type: Optional[str] = Query(None, alias="type"),
+    fields: Optional[str] = None
+):
+    """Get a page of user cards, newest first"""
     try:
-        cards = await db.get_user_cards(user_id)
+        page = await db.get_user_cards_page(
+            user_id,
+            limit=limit,
+            before=before,
+            statuses=status.split(",") if status else None,
+            card_type=card_type,
+            fields=fields.split(",") if fields else None
+        )
         return {
             "user_id": user_id,
-            "cards": cards,
-            "count": len(cards)
+            "cards": page["cards"],
+            "count": len(page["cards"]),
+            "next_cursor": page["next_cursor"]
         }
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     except Exception as e:
         raise HTTPException(500, f"Failed to get cards: {str(e)}")
 
+@app.get("/api/user/{user_id}/schedule/free")
+async def get_free_slots(
+    user_id: str,
+    duration: int = Query(30, ge=5, le=24 * 60),
+    count: int = Query(5, ge=1, le=50),
+    after: Optional[str] = None
+):
+    """Next free slots of `duration` minutes within the user's working hours
+
+    Working hours are read in the user's timezone preference (UTC without
+    one); `after` and the slots returned are naive UTC ISO timestamps.
+    """
+    try:
+        slots = await scheduler.free_slots(user_id, duration, count, after)
+        return {"user_id": user_id, "duration_minutes": duration, "slots": slots}
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except Exception as e:
+        raise HTTPException(500, f"Failed to find free slots: {str(e)}")
+
+@app.get("/api/user/{user_id}/schedule/conflicts")
+async def get_conflicts(user_id: str, start: str, end: str, exclude: Optional[str] = None):
+    """Events overlapping [start, end)"""
+    try:
+        conflicts = await scheduler.conflicts(user_id, start, end, exclude)
+        return {"user_id": user_id, "conflicts": conflicts, "count": len(conflicts)}
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except Exception as e:
+        raise HTTPException(500, f"Failed to check conflicts: {str(e)}")
+
+@app.get("/api/user/{user_id}/preferences")
+async def get_user_preferences(user_id: str):
+    """Get the scheduling preferences used to personalise cards"""
+    return await user_contexts.get_preferences(user_id)
+
+@app.put("/api/user/{user_id}/preferences")
+async def set_user_preferences(user_id: str, preferences: UserPreference):
+    """Replace a user's scheduling preferences"""
+    preferences.user_id = user_id
+    if not await user_contexts.set_preferences(preferences):
+        raise HTTPException(500, "Failed to store preferences")
+    return preferences
+
+def audio_transcriber():
+    """The configured transcriber, built on first use; raises AudioError when there is none"""
+    global transcriber
+    if transcriber is None:
+        try:
+            transcriber = create_transcriber()
+        except AudioError:
+            raise
+        except Exception as e:
+            logger.error("Transcriber failed to build: %s", e)
+            raise AudioError("Audio capture is unavailable")
+    return transcriber
+
+async def process_audio_upload(upload: AudioUpload, user_id: str):
+    """Transcribe a finished recording and run the transcript through the capture pipeline"""
+    try:
+        transcriber = audio_transcriber()
+        if transcriber.uses_llm:
+            async with admission.llm_slot(INTERACTIVE):
+                with timed("audio", "transcribe"):
+                    text = await transcriber.transcribe(upload)
+        else:
+            with timed("audio", "transcribe"):
+                text = await transcriber.transcribe(upload)
+        if not text:
+            raise AudioError("No speech recognised")
+        await websocket_manager.send_personal_message({
+            "type": "audio_transcript",
+            "upload_id": upload.upload_id,
+            "text": text
+        }, user_id)
+        
+        session_id = str(uuid.uuid4())
+        cards = await generate_cards(text, user_id)
+        cards = await store_and_push(session_id, user_id, cards)
+        await websocket_manager.send_personal_message({
+            "type": "audio_complete",
+            "upload_id": upload.upload_id,
+            "session_id": session_id,
+            "count": len(cards)
+        }, user_id)
+        AUDIO_UPLOADS.inc(outcome="processed")
+    except AdmissionError as e:
+        AUDIO_UPLOADS.inc(outcome="rejected")
+        await websocket_manager.send_personal_message({
+            "type": "audio_error",
+            "upload_id": upload.upload_id,
+            "error": str(e),
+            "retry_after": e.retry_after
+        }, user_id)
+    except Exception as e:
+        logger.error("Audio capture %s failed: %s", upload.upload_id, e)
+        AUDIO_UPLOADS.inc(outcome="failed")
+        await websocket_manager.send_personal_message({
+            "type": "audio_error",
+            "upload_id": upload.upload_id,
+            "error": str(e)
+        }, user_id)
+    finally:
+        upload.close()
+
 @app.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
-    """WebSocket connection"""
+    """WebSocket connection
+
+    Audio is sent as {"type": "audio_start", "content_type": ...}, then the
+    recording as binary frames, then {"type": "audio_end"} (or
+    "audio_cancel"). One recording at a time per socket.
+    """
     await websocket_manager.connect(websocket, user_id)
+    upload: Optional[AudioUpload] = None
     try:
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            
+            if frame.get("bytes") is not None:
+                if upload is None:
+                    await websocket_manager.reply(websocket, {
+                        "type": "audio_error",
+                        "error": "Send audio_start before audio frames"
+                    })
+                    continue
+                try:
+                    upload.write(frame["bytes"])
+                except AudioError as e:
+                    AUDIO_UPLOADS.inc(outcome="too_large")
+                    await websocket_manager.reply(websocket, {
+                        "type": "audio_error",
+                        "upload_id": upload.upload_id,
+                        "error": str(e)
+                    })
+                    upload.close()
+                    upload = None
+                continue
+            
+            try:
+                message = loads(frame["text"] or "")
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                await websocket_manager.reply(websocket, {"type": "error", "error": "Expected a JSON object"})
+                continue
+            message_type = message.get("type")
+            
+            if message_type == "ping":
+                await websocket_manager.reply(websocket, {"type": "pong"})
             
-            if message.get("type") == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
+            elif message_type == "audio_start":
+                if upload is not None:
+                    AUDIO_UPLOADS.inc(outcome="abandoned")
+                    upload.close()
+                    upload = None
+                try:
+                    audio_transcriber()
+                except AudioError as e:
+                    AUDIO_UPLOADS.inc(outcome="unavailable")
+                    await websocket_manager.reply(websocket, {
+                        "type": "audio_error",
+                        "upload_id": message.get("upload_id"),
+                        "error": str(e)
+                    })
+                    continue
+                try:
+                    admission.admit({user_id: 1})
+                except AdmissionError as e:
+                    AUDIO_UPLOADS.inc(outcome="rejected")
+                    await websocket_manager.reply(websocket, {
+                        "type": "audio_error",
+                        "upload_id": message.get("upload_id"),
+                        "error": str(e),
+                        "retry_after": e.retry_after
+                    })
+                    continue
+                upload = AudioUpload(
+                    str(message.get("content_type") or "audio/webm"),
+                    str(message["upload_id"])[:64] if message.get("upload_id") else None
+                )
+                await websocket_manager.reply(websocket, {"type": "audio_ready", "upload_id": upload.upload_id})
+            
+            elif message_type == "audio_end":
+                if upload is None:
+                    await websocket_manager.reply(websocket, {"type": "audio_error", "error": "No recording in progress"})
+                    continue
+                await websocket_manager.reply(websocket, {
+                    "type": "audio_received",
+                    "upload_id": upload.upload_id,
+                    "bytes": upload.size
+                })
+                # Transcription and generation run on, so the socket keeps serving pings
+                task = asyncio.create_task(process_audio_upload(upload, user_id))
+                audio_tasks.add(task)
+                task.add_done_callback(audio_tasks.discard)
+                upload = None
+            
+            elif message_type == "audio_cancel" and upload is not None:
+                AUDIO_UPLOADS.inc(outcome="cancelled")
+                upload.close()
+                upload = None
                 
     except WebSocketDisconnect:
-        websocket_manager.disconnect(user_id)
+        pass
+    finally:
+        # Also on unexpected errors, so the connection, its drain task and
+        # its bus subscription never outlive the socket
+        websocket_manager.disconnect(user_id, websocket)
+        if upload is not None:
+            AUDIO_UPLOADS.inc(outcome="abandoned")
+            upload.close()
 
 @app.get("/api/health")
 async def health_check():
-    """Health check"""
-    gemini_health = await gemini.health_check()
-    return {
-        "status": "healthy",
-        "gemini": gemini_health,
-        "mode": "normal" if GEMINI_AVAILABLE else "test/fallback",
-        "timestamp": datetime.utcnow().isoformat()
-    }
+    """Health check from the latest background probes"""
+    snapshot = health_monitor.snapshot()
+    llm = snapshot["checks"].get("llm", {})
+    snapshot["gemini"] = llm.get("detail") or llm.get("error") or "unknown"
+    snapshot["mode"] = "normal" if llm_provider == "gemini" else "test/fallback"
+    snapshot["llm_provider"] = llm_provider
+    return snapshot
+
+@app.get("/api/health/live")
+async def liveness_check():
+    """Liveness probe: the process is up and the probe loop is running"""
+    live = health_monitor.is_live()
+    return FastJSONResponse(
+        {"status": "alive" if live else "dead"},
+        status_code=200 if live else 503
+    )
+
+@app.get("/api/health/ready")
+async def readiness_check():
+    """Readiness probe: critical dependencies passed their last check"""
+    ready = health_monitor.is_ready()
+    return FastJSONResponse(
+        {"status": "ready" if ready else "not_ready", "checks": health_monitor.results},
+        status_code=200 if ready else 503
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 async def root():
     return {
         "message": "SERA Backend API", 
         "status": "running",
-        "mode": "normal" if GEMINI_AVAILABLE else "test/fallback"
+        "mode": "normal" if llm_provider == "gemini" else "test/fallback"
     }
 
 if __name__ == "__main__":
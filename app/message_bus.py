@@ -0,0 +1,145 @@
+# app/message_bus.py
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# handler(channel, payload) called for every message on a subscribed channel
+MessageHandler = Callable[[str, str], Awaitable[None]]
+
+BROADCAST_CHANNEL = "broadcast"
+
+def user_channel(user_id: str) -> str:
+    return f"user:{user_id}"
+
+class MessageBus:
+    """Pub/sub transport that carries WebSocket pushes between workers"""
+
+    async def start(self, handler: MessageHandler):
+        raise NotImplementedError
+
+    async def stop(self):
+        raise NotImplementedError
+
+    async def publish(self, channel: str, payload: str):
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str):
+        raise NotImplementedError
+
+    async def unsubscribe(self, channel: str):
+        raise NotImplementedError
+
+class LoopbackHub:
+    """In-process stand-in for a broker; share one between buses to simulate workers"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set["LoopbackBus"]] = {}
+
+class LoopbackBus(MessageBus):
+    """Delivers within the process (single worker and tests)"""
+
+    def __init__(self, hub: Optional[LoopbackHub] = None):
+        self.hub = hub or LoopbackHub()
+        self._handler: Optional[MessageHandler] = None
+        self.channels: Set[str] = set()
+
+    async def start(self, handler: MessageHandler):
+        self._handler = handler
+
+    async def stop(self):
+        for channel in list(self.channels):
+            await self.unsubscribe(channel)
+        self._handler = None
+
+    async def publish(self, channel: str, payload: str):
+        for bus in list(self.hub.subscribers.get(channel, ())):
+            if bus._handler is not None:
+                await bus._handler(channel, payload)
+
+    async def subscribe(self, channel: str):
+        self.channels.add(channel)
+        self.hub.subscribers.setdefault(channel, set()).add(self)
+
+    async def unsubscribe(self, channel: str):
+        self.channels.discard(channel)
+        subscribers = self.hub.subscribers.get(channel)
+        if subscribers is not None:
+            subscribers.discard(self)
+            if not subscribers:
+                del self.hub.subscribers[channel]
+
+class RedisBus(MessageBus):
+    """Redis pub/sub; each worker subscribes only to channels of users it holds"""
+
+    def __init__(self, url: str, prefix: str = "sera:ws:"):
+        self.url = url
+        self.prefix = prefix
+        self._redis = None
+        self._pubsub = None
+        self._handler: Optional[MessageHandler] = None
+        self._task: Optional[asyncio.Task] = None
+        self.channels: Set[str] = set()
+
+    async def start(self, handler: MessageHandler):
+        import redis.asyncio as redis
+
+        self._handler = handler
+        self._redis = redis.from_url(self.url)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        if self._redis is not None:
+            await self._redis.aclose()
+        self.channels.clear()
+
+    async def publish(self, channel: str, payload: str):
+        await self._redis.publish(self.prefix + channel, payload)
+
+    async def subscribe(self, channel: str):
+        if channel not in self.channels:
+            self.channels.add(channel)
+            await self._pubsub.subscribe(self.prefix + channel)
+
+    async def unsubscribe(self, channel: str):
+        if channel in self.channels:
+            self.channels.discard(channel)
+            await self._pubsub.unsubscribe(self.prefix + channel)
+
+    async def _listen(self):
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    await asyncio.sleep(0.1)
+                    continue
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                channel = message["channel"].decode("utf-8")[len(self.prefix):]
+                await self._handler(channel, message["data"].decode("utf-8"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Message bus error: %s", e)
+                await asyncio.sleep(1)
+
+def create_message_bus() -> MessageBus:
+    """Pick the bus from MESSAGE_BUS (loopback or redis)"""
+    backend = os.getenv("MESSAGE_BUS", "loopback").lower()
+    if backend == "redis":
+        return RedisBus(os.getenv("REDIS_URL", "redis://localhost:6379"))
+    if backend == "loopback":
+        return LoopbackBus()
+    raise ValueError(f"Unknown MESSAGE_BUS '{backend}'")
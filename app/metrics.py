@@ -0,0 +1,249 @@
+# app/metrics.py
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Seconds; covers sub-millisecond SQLite reads up to slow model calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Monotonic counter with optional labels (name should end in _total)"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self.values.items():
+            yield f"{self.name}{_labels(self.labelnames, key)} {value}"
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., sum, count]
+        self.values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = [0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self) -> Iterator[str]:
+        for key, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _labels(self.labelnames, key, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _labels(self.labelnames, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {series[-2]}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}"
+
+class Gauge:
+    """Value read at scrape time from a callback returning a number or {labels: number}"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, read: Callable, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+        self.labelnames = labelnames
+
+    def samples(self) -> Iterator[str]:
+        value = self.read()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for key, number in value.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield f"{self.name}{_labels(self.labelnames, key)} {number}"
+
+class MetricsRegistry:
+    """Process-wide metrics rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), **kwargs) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, **kwargs))
+
+    def gauge(self, name: str, help_text: str, read: Callable, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        # Re-registering replaces the callback (e.g. a new app instance)
+        gauge = Gauge(name, help_text, read, labelnames)
+        self.metrics[name] = gauge
+        return gauge
+
+    def _add(self, metric):
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.samples())
+            except Exception:
+                # A failing gauge callback must not break the whole scrape
+                continue
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "sera_stage_duration_seconds", "Time spent per pipeline stage", ("stage", "operation")
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "sera_http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+)
+LLM_FALLBACKS = REGISTRY.counter(
+    "sera_llm_fallbacks_total", "Captures answered with fallback cards", ("reason",)
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "sera_cache_requests_total", "Cache lookups by outcome", ("cache", "result")
+)
+LLM_TOKENS = REGISTRY.counter(
+    "sera_llm_tokens_total", "Tokens sent to and received from the model", ("kind",)
+)
+CONTEXT_TOKENS = REGISTRY.histogram(
+    "sera_user_context_tokens", "Estimated tokens of user context added to a prompt",
+    buckets=(0, 25, 50, 100, 200, 400, 800, 1600)
+)
+WS_DROPPED = REGISTRY.counter(
+    "sera_ws_dropped_total", "WebSocket messages and sockets dropped", ("reason",)
+)
+INTENT_ROUTES = REGISTRY.counter(
+    "sera_intent_routes_total", "Captures routed locally or to the LLM", ("route", "intent")
+)
+INTENT_CONFIDENCE = REGISTRY.histogram(
+    "sera_intent_confidence", "Intent router confidence per decision", ("route",),
+    buckets=(0.25, 0.5, 0.6, 0.7, 0.75, 0.8, 0.9, 1.0)
+)
+RETENTION_ROWS = REGISTRY.counter(
+    "sera_retention_rows_total", "Rows removed by the retention job", ("table", "action")
+)
+ADMISSION_DECISIONS = REGISTRY.counter(
+    "sera_admission_total", "Admission decisions for captures and LLM calls", ("decision", "priority")
+)
+ADMISSION_WAIT = REGISTRY.histogram(
+    "sera_admission_wait_seconds", "Time spent queued for an LLM slot", ("priority",)
+)
+CIRCUIT_TRANSITIONS = REGISTRY.counter(
+    "sera_circuit_transitions_total", "Circuit breaker state changes", ("circuit", "state")
+)
+LLM_HEDGES = REGISTRY.counter(
+    "sera_llm_hedges_total", "Hedged LLM attempts by outcome", ("outcome",)
+)
+AUDIO_UPLOADS = REGISTRY.counter(
+    "sera_audio_uploads_total", "Audio uploads over WebSocket by outcome", ("outcome",)
+)
+AUDIO_BYTES = REGISTRY.counter(
+    "sera_audio_bytes_total", "Audio bytes received over WebSocket"
+)
+
+# Per-request stage totals for the Server-Timing header; shared with child tasks
+_server_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("server_timings", default=None)
+
+@contextmanager
+def timed(stage: str, operation: str = ""):
+    """Time a block as a pipeline stage (histogram and Server-Timing)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage, operation=operation)
+        timings = _server_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+def server_timing_header(timings: Dict[str, float], total: float) -> str:
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+class InstrumentationMiddleware:
+    """ASGI middleware: request latency histogram and a Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        token = _server_timings.set(timings)
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                header = server_timing_header(timings, time.perf_counter() - started)
+                message = {
+                    **message,
+                    "headers": list(message.get("headers", [])) + [(b"server-timing", header.encode("latin-1"))]
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _server_timings.reset(token)
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status["code"])
+            )
@@ -1,7 +1,9 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import Dict, List, Optional, Any
 from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
+# Legacy shape; recordings now stream as binary frames over /ws/{user_id} (app/audio.py)
 class AudioCaptureRequest(BaseModel):
     user_id: str
     audio_data: Optional[str] = None  # Base64 encoded audio
@@ -12,6 +14,17 @@ class UserPreference(BaseModel):
     preferred_meeting_times: List[str] = Field(default_factory=list)
     energy_patterns: Dict[str, Any] = Field(default_factory=dict)
     scheduling_rules: Dict[str, Any] = Field(default_factory=dict)
+    timezone: Optional[str] = None  # IANA name, e.g. "Europe/Berlin"; UTC when unset
+
+    @field_validator("timezone")
+    @classmethod
+    def known_timezone(cls, value: Optional[str]) -> Optional[str]:
+        if value:
+            try:
+                ZoneInfo(value)
+            except (ZoneInfoNotFoundError, ValueError):
+                raise ValueError(f"Unknown timezone '{value}'")
+        return value or None
 
 class CardActionRequest(BaseModel):
     action: str  # accept, reject, modify, snooze
@@ -44,4 +57,26 @@ class GeminiParseResponse(BaseModel):
     intent: str
     entities: Dict[str, Any]
     confidence: float
-    suggested_cards: List[SuggestionCard]
\ No newline at end of file
+    suggested_cards: List[SuggestionCard]
+
+class CardAction(BaseModel):
+    event_title: str
+    start_time: Optional[str] = None  # ISO format
+    end_time: Optional[str] = None    # ISO format
+    duration_minutes: Optional[int] = None
+    location: Optional[str] = None
+    participants: List[str] = Field(default_factory=list)
+    notes: Optional[str] = None
+
+class GeneratedCard(BaseModel):
+    """SuggestionCard as the LLM produces it, before server-assigned fields"""
+    type: str  # schedule, reschedule, cancel, reminder, task
+    title: str
+    description: str = ""
+    primary_action: CardAction
+    alternatives: List[EventTimeSlot] = Field(default_factory=list)
+    confidence: float = Field(default=0.7, ge=0.0, le=1.0)
+    input_index: Optional[int] = None  # batch captures only
+
+class GeneratedCards(BaseModel):
+    cards: List[GeneratedCard]
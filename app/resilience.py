@@ -0,0 +1,246 @@
+# app/resilience.py
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from app.metrics import CIRCUIT_TRANSITIONS, LLM_HEDGES, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# name -> breaker, for the state gauge
+BREAKERS: Dict[str, "CircuitBreaker"] = {}
+
+# (state, epoch) a call was admitted under; see CircuitBreaker.allow
+Permit = Tuple[str, int]
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker over a rolling window of call outcomes
+
+    Trips when, over the last CIRCUIT_WINDOW_SECONDS and at least
+    CIRCUIT_MIN_CALLS calls, the error rate reaches CIRCUIT_ERROR_RATE or
+    the share of calls slower than CIRCUIT_SLOW_SECONDS reaches
+    CIRCUIT_SLOW_RATE. After CIRCUIT_OPEN_SECONDS a few trial calls are let
+    through; one clean success closes it again, any failure reopens it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.window_seconds = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "30"))
+        self.min_calls = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+        self.error_rate = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+        self.slow_seconds = float(os.getenv("CIRCUIT_SLOW_SECONDS", "10"))
+        self.slow_rate = float(os.getenv("CIRCUIT_SLOW_RATE", "0.8"))
+        self.open_seconds = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+        self.half_open_calls = int(os.getenv("CIRCUIT_HALF_OPEN_CALLS", "1"))
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trials = 0
+        # Bumped on every transition, so permits from an earlier state are told apart
+        self.epoch = 0
+        # (finished_at, failed, slow)
+        self._outcomes: Deque[Tuple[float, bool, bool]] = deque()
+        self._failures = 0
+        self._slow = 0
+        BREAKERS[name] = self
+
+    def allow(self) -> Optional[Permit]:
+        """A permit for the call to go ahead, or None; in half-open, permits are trials
+
+        Pass the permit to record() or release(): an outcome only counts
+        towards the state it was admitted under, so a call that started
+        closed and ends in half-open is not taken for a trial.
+        """
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                return None
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self.trials >= self.half_open_calls:
+                return None
+            self.trials += 1
+        return (self.state, self.epoch)
+
+    @property
+    def available(self) -> bool:
+        """Whether a call would be allowed now, without taking a trial permit"""
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= self.open_seconds
+        return self.state == CLOSED or self.trials < self.half_open_calls
+
+    def release(self, permit: Permit):
+        """Give back the permit of a call that ended without an outcome (e.g. cancelled)"""
+        if permit == (HALF_OPEN, self.epoch):
+            self.trials = max(0, self.trials - 1)
+
+    def record(self, permit: Permit, ok: bool, seconds: float):
+        if permit != (self.state, self.epoch):
+            # Admitted under an earlier state; says nothing about this one
+            return
+        slow = seconds >= self.slow_seconds
+        if self.state == HALF_OPEN:
+            self.trials = max(0, self.trials - 1)
+            if ok and not slow:
+                self._transition(CLOSED)
+            else:
+                self._trip()
+            return
+
+        now = time.monotonic()
+        self._outcomes.append((now, not ok, slow))
+        self._failures += not ok
+        self._slow += slow
+        self._expire(now)
+        calls = len(self._outcomes)
+        if calls >= self.min_calls and (
+            self._failures / calls >= self.error_rate or self._slow / calls >= self.slow_rate
+        ):
+            self._trip()
+
+    def stats(self) -> Dict[str, Any]:
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "calls": calls,
+            "error_rate": round(self._failures / calls, 3) if calls else 0.0,
+            "slow_rate": round(self._slow / calls, 3) if calls else 0.0
+        }
+
+    def _expire(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            _, failed, slow = self._outcomes.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    def _trip(self):
+        self.opened_at = time.monotonic()
+        self._transition(OPEN)
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        logger.warning("Circuit %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        self.epoch += 1
+        self.trials = 0
+        if state != HALF_OPEN:
+            self._outcomes.clear()
+            self._failures = self._slow = 0
+        CIRCUIT_TRANSITIONS.inc(circuit=self.name, state=state)
+
+REGISTRY.gauge(
+    "sera_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+    lambda: {name: STATE_VALUES[breaker.state] for name, breaker in BREAKERS.items()},
+    ("circuit",)
+)
+
+class LatencyTracker:
+    """Latencies of the most recent successful calls, for percentile estimates"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1)]
+
+class Hedger:
+    """Sends a second attempt when the first outlives a latency percentile
+
+    Off unless LLM_HEDGE is true. The delay is the LLM_HEDGE_PERCENTILE of
+    recent attempt latencies (never below LLM_HEDGE_MIN_SECONDS), and at most
+    LLM_HEDGE_MAX_RATIO of calls are hedged, so a slow provider is not hit
+    with double the traffic.
+
+    A hedge runs inside the admission slot its call already holds and is
+    not counted against ADMISSION_LLM_CONCURRENCY; upstream it is bounded
+    only by GEMINI_MAX_IN_FLIGHT, like every other attempt.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("LLM_HEDGE", "false").lower() == "true"
+        self.percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+        self.min_delay = float(os.getenv("LLM_HEDGE_MIN_SECONDS", "1"))
+        self.max_ratio = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))
+        self.min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        self.latencies = LatencyTracker()
+        self.calls = 0
+        self.hedges = 0
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging this call, or None to not hedge it"""
+        if not self.enabled or len(self.latencies) < self.min_samples:
+            return None
+        if self.hedges >= self.max_ratio * self.calls:
+            return None
+        return max(self.min_delay, self.latencies.percentile(self.percentile))
+
+    async def run(self, attempt: Callable[[float], Awaitable[Any]], timeout: float) -> Any:
+        """Run attempt(timeout), racing a second attempt if the first is slow
+
+        The second attempt gets what is left of the timeout. The first
+        success wins and the other attempt is cancelled; if both fail, the
+        first attempt's error is raised.
+        """
+        self.calls += 1
+        delay = self.delay()
+        first = asyncio.ensure_future(self._timed(attempt, timeout))
+        if delay is None or delay >= timeout:
+            return await first
+
+        attempts = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                return first.result()
+
+            self.hedges += 1
+            LLM_HEDGES.inc(outcome="sent")
+            attempts.append(asyncio.ensure_future(self._timed(attempt, timeout - delay)))
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None:
+                        LLM_HEDGES.inc(outcome="won" if task is attempts[1] else "lost")
+                        return task.result()
+            return first.result()
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+
+    async def _timed(self, attempt: Callable[[float], Awaitable[Any]], timeout: float) -> Any:
+        started = time.perf_counter()
+        result = await attempt(timeout)
+        self.latencies.add(time.perf_counter() - started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        p = self.latencies.percentile(self.percentile)
+        return {
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "delay_seconds": round(max(self.min_delay, p), 3) if p is not None else None
+        }
@@ -0,0 +1,166 @@
+# app/response_cache.py
+import asyncio
+import copy
+import hashlib
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.metrics import CACHE_REQUESTS
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s.!?,;:]+$")
+
+class ResponseCache:
+    """LRU + TTL cache of generated cards with single-flight deduplication"""
+
+    def __init__(self, db=None, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.db = db
+        self.max_entries = max_entries or int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "600"))
+        self.persist = db is not None and os.getenv("RESPONSE_CACHE_PERSIST", "true").lower() == "true"
+
+        # cache_key -> (expires_at, cards)
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict]]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Fold case, whitespace and trailing punctuation so resubmissions match"""
+        text = _WHITESPACE.sub(" ", text.strip().lower())
+        return _TRAILING_PUNCTUATION.sub("", text)
+
+    def make_key(self, text: str, context: str = "") -> str:
+        raw = f"{self.normalize(text)}\x00{context}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get_or_generate(
+        self,
+        text: str,
+        user_id: str,
+        generate: Callable[[], Awaitable[List[Dict]]],
+        context: str = ""
+    ) -> List[Dict]:
+        """Return cached cards for text, or generate them once for all concurrent callers"""
+        key = self.make_key(text, context)
+
+        cards = await self._lookup(key)
+        if cards is not None:
+            self.hits += 1
+            CACHE_REQUESTS.inc(cache="response", result="hit")
+            return self._fresh(cards, user_id)
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.shared += 1
+            CACHE_REQUESTS.inc(cache="response", result="shared")
+            try:
+                cards = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The leader was cancelled (its client went away); generate ourselves
+                if not pending.cancelled():
+                    raise
+                return await self.get_or_generate(text, user_id, generate, context)
+            return self._fresh(cards, user_id)
+
+        self.misses += 1
+        CACHE_REQUESTS.inc(cache="response", result="miss")
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            cards = await generate()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+        future.set_result(cards)
+        if self._cacheable(cards):
+            await self._store(key, cards)
+        return cards
+
+    async def peek(self, text: str, user_id: str, context: str = "") -> Optional[List[Dict]]:
+        """Return fresh copies of cached cards without generating on a miss"""
+        cards = await self._lookup(self.make_key(text, context))
+        if cards is None:
+            return None
+        self.hits += 1
+        CACHE_REQUESTS.inc(cache="response", result="hit")
+        return self._fresh(cards, user_id)
+
+    async def store(self, text: str, cards: List[Dict], context: str = ""):
+        """Cache cards produced outside get_or_generate (e.g. by streaming)"""
+        if self._cacheable(cards):
+            await self._store(self.make_key(text, context), cards)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared
+        }
+
+    async def _lookup(self, key: str) -> Optional[List[Dict]]:
+        entry = self._entries.get(key)
+        now = time.time()
+        if entry is not None:
+            expires_at, cards = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                return cards
+            del self._entries[key]
+
+        if self.persist:
+            stored = await self.db.get_cached_response(key)
+            if stored is not None:
+                expires_at, cards = stored
+                self._remember(key, expires_at, cards)
+                return cards
+        return None
+
+    async def _store(self, key: str, cards: List[Dict]):
+        expires_at = time.time() + self.ttl_seconds
+        cards = copy.deepcopy(cards)
+        self._remember(key, expires_at, cards)
+        if self.persist:
+            await self.db.store_cached_response(key, cards, expires_at)
+
+    def _remember(self, key: str, expires_at: float, cards: List[Dict]):
+        self._entries[key] = (expires_at, cards)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _cacheable(cards: List[Dict]) -> bool:
+        # Never cache the generic cards produced when the model failed
+        return bool(cards) and not any(
+            (card.get("metadata") or {}).get("fallback") for card in cards
+        )
+
+    @staticmethod
+    def _fresh(cards: List[Dict], user_id: str) -> List[Dict]:
+        """Copy cached cards with new identities so each capture owns its cards"""
+        fresh = copy.deepcopy(cards)
+        now = datetime.utcnow().isoformat()
+        for card in fresh:
+            card["card_id"] = str(uuid.uuid4())
+            card["created_at"] = now
+            card["status"] = "pending"
+            card["user_id"] = user_id
+        return fresh
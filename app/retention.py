@@ -0,0 +1,135 @@
+# app/retention.py
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from app.metrics import RETENTION_ROWS
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 86400
+
+def parse_ttls(spec: str) -> Dict[str, float]:
+    """Parse "rejected=30,pending=90" (days per card status) into seconds"""
+    ttls = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        status, _, days = item.partition("=")
+        ttls[status.strip().lower()] = float(days) * DAY_SECONDS
+    return ttls
+
+class RetentionJob:
+    """Removes old cards and sessions in small batches, then compacts the database
+
+    Each batch is its own short write transaction with a pause in between, so
+    captures waiting on the single writer are never held up for long.
+
+    Off unless RETENTION_ENABLED=true. RETENTION_CARD_TTL_DAYS gives days
+    per card status ("rejected=30" by default); cards of other statuses,
+    pending and snoozed included, are never removed. RETENTION_SESSION_TTL_DAYS
+    (30) applies to sessions left without cards, and RETENTION_MODE=archive
+    moves cards to cards_archive instead of deleting them.
+    """
+
+    def __init__(
+        self,
+        db,
+        interval_seconds: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        card_ttls: Optional[Dict[str, float]] = None,
+        session_ttl_seconds: Optional[float] = None
+    ):
+        self.db = db
+        self.enabled = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+        self.interval_seconds = interval_seconds or float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+        self.batch_size = batch_size or int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+        self.max_batches = int(os.getenv("RETENTION_MAX_BATCHES", "100"))
+        self.batch_pause_seconds = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "0.05"))
+        # Only statuses listed here expire; cards still awaiting the user do not
+        self.card_ttls = card_ttls if card_ttls is not None else parse_ttls(
+            os.getenv("RETENTION_CARD_TTL_DAYS", "rejected=30")
+        )
+        self.session_ttl_seconds = session_ttl_seconds or (
+            float(os.getenv("RETENTION_SESSION_TTL_DAYS", "30")) * DAY_SECONDS
+        )
+        self.archive = os.getenv("RETENTION_MODE", "delete").lower() == "archive"
+        self.vacuum_pages = int(os.getenv("RETENTION_VACUUM_PAGES", "1000"))
+        self.checkpoint = os.getenv("RETENTION_CHECKPOINT_MODE", "PASSIVE")
+        self.convert_auto_vacuum = os.getenv("RETENTION_ENABLE_AUTO_VACUUM", "false").lower() == "true"
+
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if not self.enabled:
+            return
+        # Only SQLite files created before incremental auto_vacuum report "none"
+        if self.convert_auto_vacuum and await self.db.auto_vacuum_mode() == "none":
+            logger.info("Converting database to incremental auto_vacuum")
+            await self.db.enable_incremental_vacuum()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error("Retention run failed: %s", e)
+
+    async def run_once(self) -> Dict[str, Any]:
+        """One full pass: cards per status, then sessions, then compaction"""
+        started = time.perf_counter()
+        action = "archived" if self.archive else "deleted"
+        cards: Dict[str, int] = {}
+        for status, ttl in self.card_ttls.items():
+            cards[status] = await self._drain(
+                "cards", action,
+                lambda status=status, ttl=ttl: self.db.purge_cards(status, ttl, self.batch_size, self.archive)
+            )
+        sessions = await self._drain(
+            "sessions", "deleted",
+            lambda: self.db.purge_sessions(self.session_ttl_seconds, self.batch_size)
+        )
+        compaction = await self.db.compact(self.vacuum_pages, self.checkpoint)
+
+        self.last_run = {
+            "cards": cards,
+            "sessions": sessions,
+            "compaction": compaction,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "finished_at": time.time()
+        }
+        if sessions or any(cards.values()):
+            logger.info("Retention %s cards %s, deleted %s sessions", action, cards, sessions)
+        return self.last_run
+
+    async def _drain(self, table: str, action: str, purge) -> int:
+        total = 0
+        for _ in range(self.max_batches):
+            removed = await purge()
+            total += removed
+            RETENTION_ROWS.inc(removed, table=table, action=action)
+            if removed < self.batch_size:
+                break
+            await asyncio.sleep(self.batch_pause_seconds)
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "mode": "archive" if self.archive else "delete",
+            "last_run": self.last_run
+        }
@@ -0,0 +1,453 @@
+# app/scheduler.py
+import asyncio
+import os
+import re
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.metrics import CACHE_REQUESTS, timed
+from app.user_context import user_timezone
+
+# Cards that hold time on the user's calendar; rejected and snoozed ones free it
+BUSY_STATUSES = ("accepted", "pending", "modified")
+EPOCH = datetime(1970, 1, 1)
+DAY_SECONDS = 86400
+WEEKDAY_KEYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+def to_seconds(value: Any) -> Optional[float]:
+    """Seconds since the epoch for an ISO timestamp (naive means UTC), or None"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH).total_seconds()
+
+def to_iso(seconds: float) -> str:
+    return (EPOCH + timedelta(seconds=seconds)).isoformat()
+
+def event_span(card: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    """(start, end) of a card that blocks time, or None"""
+    if card.get("status", "pending") not in BUSY_STATUSES or card.get("type") == "cancel":
+        return None
+    action = card.get("primary_action") or {}
+    start, end = to_seconds(action.get("start_time")), to_seconds(action.get("end_time"))
+    if start is None or end is None or end <= start:
+        return None
+    return start, end
+
+class IntervalIndex:
+    """One user's busy intervals, sorted by start
+
+    Parallel start/end/id lists kept in order with bisect; an overlap query
+    only scans intervals starting in [start - longest, end), so lookups stay
+    O(log n + k) however many events the user has.
+    """
+
+    def __init__(self):
+        self._starts: List[float] = []
+        self._ends: List[float] = []
+        self._ids: List[str] = []
+        self._spans: Dict[str, Tuple[float, float]] = {}
+        self.longest = 0.0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, event_id: str) -> bool:
+        return event_id in self._spans
+
+    def add(self, event_id: str, start: float, end: float):
+        if event_id in self._spans:
+            self.remove(event_id)
+        position = bisect_left(self._starts, start)
+        self._starts.insert(position, start)
+        self._ends.insert(position, end)
+        self._ids.insert(position, event_id)
+        self._spans[event_id] = (start, end)
+        # Never shrinks on removal: a stale bound only widens the scan a little
+        self.longest = max(self.longest, end - start)
+
+    def remove(self, event_id: str):
+        span = self._spans.pop(event_id, None)
+        if span is None:
+            return
+        position = bisect_left(self._starts, span[0])
+        while self._ids[position] != event_id:
+            position += 1
+        del self._starts[position], self._ends[position], self._ids[position]
+
+    def overlapping(self, start: float, end: float, exclude: Optional[str] = None) -> List[Tuple[str, float, float]]:
+        """(id, start, end) of every interval intersecting [start, end)"""
+        first = bisect_left(self._starts, start - self.longest)
+        last = bisect_left(self._starts, end)
+        return [
+            (self._ids[i], self._starts[i], self._ends[i])
+            for i in range(first, last)
+            if self._ends[i] > start and self._ids[i] != exclude
+        ]
+
+    def busy_until(self, start: float, end: float, exclude: Optional[str] = None) -> Optional[float]:
+        """Latest end among intervals intersecting [start, end), None if it is free"""
+        latest = None
+        for i in range(bisect_left(self._starts, start - self.longest), bisect_left(self._starts, end)):
+            if self._ends[i] > start and self._ids[i] != exclude and (latest is None or self._ends[i] > latest):
+                latest = self._ends[i]
+        return latest
+
+    def prune(self, before: float):
+        """Drop intervals that ended before a point in time"""
+        for event_id, (_, end) in list(self._spans.items()):
+            if end < before:
+                self.remove(event_id)
+
+_CLOCK_RE = re.compile(r"^\s*(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\s*$")
+
+def _minutes(text: str) -> Optional[int]:
+    match = _CLOCK_RE.match(text.lower())
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2) or 0)
+    if match.group(3) == "pm" and hour < 12:
+        hour += 12
+    elif match.group(3) == "am" and hour == 12:
+        hour = 0
+    return hour * 60 + minute if hour <= 24 else None
+
+def parse_hours(value: Any) -> Optional[Tuple[int, int]]:
+    """(start, end) minutes of day from "9-17", "09:00-17:30", "9am-5pm" or {"start", "end"}"""
+    if isinstance(value, dict):
+        start, end = _minutes(str(value.get("start", ""))), _minutes(str(value.get("end", "")))
+    elif isinstance(value, str) and "-" in value:
+        first, _, second = value.partition("-")
+        start, end = _minutes(first), _minutes(second)
+    else:
+        return None
+    if start is None or end is None:
+        return None
+    if end <= start and end < 12 * 60:
+        # "9-5" means 9am to 5pm
+        end += 12 * 60
+    return (start, min(end, 24 * 60)) if end > start else None
+
+class WorkingHours:
+    """Per-weekday working windows, from a user's working_hours preference
+
+    Windows are wall-clock times in the user's timezone preference, or in
+    UTC when there is none; window() still answers in naive UTC seconds.
+    """
+
+    def __init__(self, windows: Dict[int, Tuple[int, int]], tz: Optional[tzinfo] = None):
+        self.windows = windows
+        self.tz = tz
+
+    @classmethod
+    def default(cls) -> "WorkingHours":
+        hours = parse_hours(os.getenv("SCHEDULER_WORKING_HOURS", "09:00-18:00")) or (540, 1080)
+        days = [d.strip()[:3].lower() for d in os.getenv("SCHEDULER_WORKING_DAYS", "mon,tue,wed,thu,fri").split(",")]
+        return cls({WEEKDAY_KEYS.index(d): hours for d in days if d in WEEKDAY_KEYS})
+
+    @classmethod
+    def from_preferences(cls, preferences: Dict[str, Any]) -> "WorkingHours":
+        """Accepts {"mon": "9-17", ...}, {"start": "9:00", "end": "17:00", "days": [...]} or nothing"""
+        working_hours = preferences.get("working_hours") or {}
+        tz = user_timezone(preferences)
+        default = cls.default()
+        if not isinstance(working_hours, dict) or not working_hours:
+            return cls(default.windows, tz)
+
+        windows: Dict[int, Tuple[int, int]] = {}
+        for key, value in working_hours.items():
+            day = str(key).strip()[:3].lower()
+            if day in WEEKDAY_KEYS and parse_hours(value):
+                windows[WEEKDAY_KEYS.index(day)] = parse_hours(value)
+        if windows:
+            return cls(windows, tz)
+
+        hours = parse_hours(working_hours)
+        if hours is None:
+            return cls(default.windows, tz)
+        days = working_hours.get("days") or [WEEKDAY_KEYS[d] for d in default.windows]
+        return cls({WEEKDAY_KEYS.index(str(d)[:3].lower()): hours for d in days if str(d)[:3].lower() in WEEKDAY_KEYS}, tz)
+
+    def window(self, at: float) -> Optional[Tuple[float, float]]:
+        """This day's working window (epoch seconds) for a point in time, if it is a working day"""
+        if self.tz is None:
+            day_start = at - at % DAY_SECONDS
+            hours = self.windows.get((EPOCH + timedelta(seconds=day_start)).weekday())
+            if hours is None:
+                return None
+            return day_start + hours[0] * 60, day_start + hours[1] * 60
+        # Wall-clock arithmetic, so a DST change moves the window with the clock
+        midnight = self._local_midnight(at)
+        hours = self.windows.get(midnight.weekday())
+        if hours is None:
+            return None
+        return (
+            to_seconds(midnight + timedelta(minutes=hours[0])),
+            to_seconds(midnight + timedelta(minutes=hours[1]))
+        )
+
+    def next_day(self, at: float) -> float:
+        """Start of the day after the one a point in time falls on"""
+        if self.tz is None:
+            return at - at % DAY_SECONDS + DAY_SECONDS
+        return to_seconds(self._local_midnight(at) + timedelta(days=1))
+
+    def _local_midnight(self, at: float) -> datetime:
+        local = (EPOCH + timedelta(seconds=at)).replace(tzinfo=timezone.utc).astimezone(self.tz)
+        return local.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def find_free_slots(
+    index: IntervalIndex,
+    hours: WorkingHours,
+    duration: float,
+    count: int,
+    after: float,
+    horizon: float,
+    step: float,
+    exclude: Optional[str] = None
+) -> List[Tuple[float, float]]:
+    """First `count` free [start, end) slots of `duration` seconds in working hours
+
+    Starts are aligned to `step`; each busy interval met moves the search
+    straight past it, so the cost is proportional to slots and obstacles,
+    not to the size of the calendar.
+    """
+    slots: List[Tuple[float, float]] = []
+    t = -(-after // step) * step
+    while len(slots) < count and t < horizon:
+        window = hours.window(t)
+        next_day = hours.next_day(t)
+        if window is None or t + duration > window[1]:
+            t = next_day
+            continue
+        if t < window[0]:
+            t = window[0]
+            continue
+        busy_until = index.busy_until(t, t + duration, exclude)
+        if busy_until is not None:
+            t = -(-busy_until // step) * step
+            continue
+        slots.append((t, t + duration))
+        t = -(-(t + duration) // step) * step
+    return slots
+
+class SchedulingEngine:
+    """Per-user free/busy indexes: conflict checks, free slots and card alternatives
+
+    Indexes are loaded lazily from the user's accepted/pending cards, kept in
+    an LRU and updated as cards are created and acted on. Times are naive UTC,
+    like the rest of the card pipeline.
+    """
+
+    def __init__(self, db, user_contexts, max_users: Optional[int] = None):
+        self.db = db
+        self.user_contexts = user_contexts
+        self.max_users = max_users or int(os.getenv("SCHEDULER_MAX_USERS", "10000"))
+        self.alternatives = int(os.getenv("SCHEDULER_ALTERNATIVES", "3"))
+        self.step_seconds = int(os.getenv("SCHEDULER_SLOT_MINUTES", "15")) * 60
+        self.horizon_seconds = float(os.getenv("SCHEDULER_HORIZON_DAYS", "14")) * DAY_SECONDS
+
+        self._indexes: "OrderedDict[str, IntervalIndex]" = OrderedDict()
+        # Concurrent first requests for a user share one load
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    async def index_for(self, user_id: str) -> IntervalIndex:
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._indexes.move_to_end(user_id)
+            CACHE_REQUESTS.inc(cache="schedule", result="hit")
+            return index
+
+        pending = self._loading.get(user_id)
+        if pending is not None:
+            CACHE_REQUESTS.inc(cache="schedule", result="shared")
+            return await asyncio.shield(pending)
+
+        CACHE_REQUESTS.inc(cache="schedule", result="miss")
+        future = asyncio.get_running_loop().create_future()
+        self._loading[user_id] = future
+        try:
+            with timed("scheduler", "load"):
+                index = await self._load(user_id)
+            self._remember(user_id, index)
+            future.set_result(index)
+            return index
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so a load nobody else waited on does not log a warning
+            future.exception()
+            raise
+        finally:
+            self._loading.pop(user_id, None)
+
+    async def _load(self, user_id: str) -> IntervalIndex:
+        index = IntervalIndex()
+        now = to_seconds(datetime.utcnow())
+        cursor = None
+        while True:
+            page = await self.db.get_user_cards_page(
+                user_id, limit=500, before=cursor, statuses=list(BUSY_STATUSES),
+                fields=["card_id", "type", "status", "primary_action"]
+            )
+            for card in page["cards"]:
+                span = event_span(card)
+                # Past events cannot conflict with anything we would suggest
+                if span is not None and span[1] > now:
+                    index.add(card["card_id"], *span)
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return index
+
+    def observe(self, card: Dict[str, Any]):
+        """Keep a loaded index in step with a created or changed card"""
+        index = self._indexes.get(card.get("user_id"))
+        if index is None:
+            return
+        span = event_span(card)
+        if span is None:
+            index.remove(card["card_id"])
+        else:
+            index.add(card["card_id"], *span)
+
+    async def working_hours(self, user_id: str) -> WorkingHours:
+        entry = await self.user_contexts.get(user_id)
+        return WorkingHours.from_preferences(entry["preferences"])
+
+    async def conflicts(self, user_id: str, start: Any, end: Any, exclude: Optional[str] = None) -> List[Dict[str, str]]:
+        start_s, end_s = to_seconds(start), to_seconds(end)
+        if start_s is None or end_s is None or end_s <= start_s:
+            raise ValueError("start and end must be ISO 8601 timestamps with end after start")
+        index = await self.index_for(user_id)
+        return [
+            {"card_id": event_id, "start_time": to_iso(s), "end_time": to_iso(e)}
+            for event_id, s, e in index.overlapping(start_s, end_s, exclude)
+        ]
+
+    async def free_slots(
+        self,
+        user_id: str,
+        duration_minutes: float,
+        count: int,
+        after: Any = None,
+        exclude: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        after_s = to_seconds(after if after is not None else datetime.utcnow())
+        if after_s is None:
+            raise ValueError("after must be an ISO 8601 timestamp")
+        index = await self.index_for(user_id)
+        hours = await self.working_hours(user_id)
+        with timed("scheduler", "free_slots"):
+            slots = find_free_slots(
+                index, hours, duration_minutes * 60, count, after_s,
+                after_s + self.horizon_seconds, self.step_seconds, exclude
+            )
+        return [{"start_time": to_iso(s), "end_time": to_iso(e)} for s, e in slots]
+
+    async def plan(self, user_id: str, cards: List[Dict], earlier: Optional[List[Dict]] = None) -> List[Dict]:
+        """Check each timed card against the calendar and fill its alternatives
+
+        Model-suggested alternatives are kept when they are free and inside
+        working hours, then topped up with the next free slots. Later cards
+        in the capture avoid earlier ones, including `earlier` cards planned
+        by previous calls and not stored yet. The index itself only gains
+        cards once they are stored: callers observe() them after the write.
+        Returns planned copies; the cards passed in are left untouched.
+        """
+        if not cards:
+            return cards
+        index = await self.index_for(user_id)
+        hours = await self.working_hours(user_id)
+        now = to_seconds(datetime.utcnow())
+
+        # Unstored cards held in the index for this call only
+        held: List[str] = []
+
+        def hold(card: Dict[str, Any]):
+            span = event_span(card)
+            card_id = card.get("card_id")
+            if span is not None and card_id and card_id not in index:
+                index.add(card_id, *span)
+                held.append(card_id)
+
+        planned = []
+        with timed("scheduler", "plan"):
+            try:
+                for card in earlier or []:
+                    hold(card)
+                for card in cards:
+                    planned.append(self._plan_card(card, index, hours, now))
+                    hold(planned[-1])
+            finally:
+                for card_id in held:
+                    index.remove(card_id)
+        return planned
+
+    def _plan_card(self, card: Dict, index: IntervalIndex, hours: WorkingHours, now: float) -> Dict:
+        # Cards may be shared with the response cache, so plan on copies
+        card = dict(card)
+        action = card.get("primary_action") or {}
+        start, end = to_seconds(action.get("start_time")), to_seconds(action.get("end_time"))
+        if start is None or end is None or end <= start:
+            return card
+        card_id = card.get("card_id")
+        # Whole seconds, so model times with fractions do not drift the slots
+        duration = max(1, round(end - start))
+
+        metadata = dict(card.get("metadata") or {})
+        clashes = index.overlapping(start, end, exclude=card_id)
+        metadata["conflicts"] = [event_id for event_id, _, _ in clashes[:5]]
+        card["metadata"] = metadata
+
+        alternatives = []
+        for alternative in card.get("alternatives") or []:
+            if not isinstance(alternative, dict):
+                continue
+            alt_start = to_seconds(alternative.get("start_time"))
+            alt_end = to_seconds(alternative.get("end_time"))
+            window = hours.window(alt_start) if alt_start is not None else None
+            if (
+                alt_end is not None and window is not None and alt_start > now
+                and window[0] <= alt_start and alt_end <= window[1]
+                and index.busy_until(alt_start, alt_end, card_id) is None
+            ):
+                alternatives.append(alternative)
+
+        wanted = self.alternatives - len(alternatives)
+        if wanted > 0:
+            taken = {to_seconds(a["start_time"]) for a in alternatives} | {start}
+            after = max(start, now)
+            for slot_start, slot_end in find_free_slots(
+                index, hours, duration, wanted + len(taken), after,
+                after + self.horizon_seconds, self.step_seconds, card_id
+            ):
+                if slot_start in taken:
+                    continue
+                alternatives.append({
+                    "start_time": to_iso(slot_start),
+                    "end_time": to_iso(slot_end),
+                    "reason": "Free in your calendar"
+                })
+                if len(alternatives) >= self.alternatives:
+                    break
+        card["alternatives"] = alternatives
+        return card
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self._indexes),
+            "events": sum(len(index) for index in self._indexes.values())
+        }
+
+    def _remember(self, user_id: str, index: IntervalIndex):
+        self._indexes[user_id] = index
+        self._indexes.move_to_end(user_id)
+        while len(self._indexes) > self.max_users:
+            self._indexes.popitem(last=False)
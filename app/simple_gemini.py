@@ -1,17 +1,20 @@
 # app/simple_gemini.py
 import json
+import logging
 import uuid
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 
+logger = logging.getLogger(__name__)
+
 class SimpleGeminiClient:
     """Simple client that simulates Gemini without API calls"""
     
     def __init__(self):
-        print("✅ Using Simple Gemini Client (No API calls needed)")
+        logger.info("Using Simple Gemini Client (No API calls needed)")
     
-    async def process_user_query(self, user_text: str, user_id: str) -> List[Dict]:
-        print(f"🤖 Processing: {user_text}")
+    async def process_user_query(self, user_text: str, user_id: str, context: str = "") -> List[Dict]:
+        logger.info("Processing: %s", user_text)
         
         # Simple rule-based card generation
         cards = []
@@ -100,10 +103,10 @@ class SimpleGeminiClient:
                 "user_id": user_id
             })
         
-        print(f"✅ Generated {len(cards)} test cards")
+        logger.info("Generated %s test cards", len(cards))
         return cards
     
-    async def process_card_action(self, card_id: str, action: str, modifications: Optional[Dict] = None) -> Dict:
+    async def process_card_action(self, card_id: str, action: str, modifications: Optional[Dict] = None, card: Optional[Dict] = None) -> Dict:
         return {
             "message": f"Action '{action}' completed successfully",
             "next_steps": ["Calendar updated", "Notifications sent"],
@@ -0,0 +1,644 @@
+# app/sql_storage.py
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, nullcontext
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import (
+    Column, DateTime, Float, Index, Integer, MetaData, PrimaryKeyConstraint, Table, Text,
+    and_, bindparam, delete, event, exists, func, or_, select, update
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+
+from app.codec import dumps, loads
+from app.database import (
+    CONNECTION_PRAGMAS, DatabaseManager, compact_sqlite, enable_sqlite_incremental_vacuum, sqlite_auto_vacuum_mode
+)
+from app.metrics import timed
+from app.storage import CARD_FIELDS, JSON_CARD_FIELDS, Storage, decode_cursor, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+# Stored like SQLite's CURRENT_TIMESTAMP, so a file written by either backend sorts the same
+Timestamp = DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite"
+)
+
+# Same tables, columns and indexes as DatabaseManager.init_db plus its migrations;
+# created from here on PostgreSQL, while SQLite files are set up by DatabaseManager
+metadata = MetaData()
+
+cards = Table(
+    "cards", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("card_id", Text, unique=True, nullable=False),
+    Column("type", Text, nullable=False),
+    Column("title", Text, nullable=False),
+    Column("description", Text),
+    Column("primary_action", Text),
+    Column("alternatives", Text),
+    Column("status", Text, server_default="pending"),
+    Column("user_id", Text),
+    Column("created_at", Timestamp, server_default=func.current_timestamp()),
+    Column("metadata", Text),
+    Index("idx_cards_user_created", "user_id", "created_at"),
+    Index("idx_cards_user_status", "user_id", "status", "created_at"),
+    Index("idx_cards_status_created", "status", "created_at"),
+    sqlite_autoincrement=True,
+)
+
+user_sessions = Table(
+    "user_sessions", metadata,
+    Column("session_id", Text, primary_key=True),
+    Column("user_id", Text, nullable=False),
+    Column("cards", Text),
+    Column("created_at", Timestamp, server_default=func.current_timestamp()),
+    Index("idx_sessions_created", "created_at"),
+)
+
+session_cards = Table(
+    "session_cards", metadata,
+    Column("session_id", Text, nullable=False),
+    Column("card_id", Text, nullable=False),
+    Column("position", Integer, nullable=False, server_default="0"),
+    PrimaryKeyConstraint("session_id", "card_id"),
+    Index("idx_session_cards_card", "card_id"),
+    sqlite_with_rowid=False,
+)
+
+user_preferences = Table(
+    "user_preferences", metadata,
+    Column("user_id", Text, primary_key=True),
+    Column("preferences", Text),
+    Column("gemini_context", Text),
+    Column("last_updated", Timestamp, server_default=func.current_timestamp()),
+)
+
+response_cache = Table(
+    "response_cache", metadata,
+    Column("cache_key", Text, primary_key=True),
+    Column("cards", Text, nullable=False),
+    Column("expires_at", Float, nullable=False),
+)
+
+cards_archive = Table(
+    "cards_archive", metadata,
+    Column("card_id", Text, primary_key=True),
+    Column("type", Text, nullable=False),
+    Column("title", Text, nullable=False),
+    Column("description", Text),
+    Column("primary_action", Text),
+    Column("alternatives", Text),
+    Column("metadata", Text),
+    Column("status", Text),
+    Column("user_id", Text),
+    Column("created_at", Timestamp),
+    Column("archived_at", Timestamp, server_default=func.current_timestamp()),
+)
+
+CARD_COLUMNS = (
+    "card_id", "type", "title", "description", "primary_action", "alternatives",
+    "metadata", "status", "user_id", "created_at",
+)
+EDITABLE_COLUMNS = ("type", "title", "description", "primary_action", "alternatives", "metadata", "status")
+
+def async_dsn(dsn: str) -> str:
+    """Add the async driver to plain sqlite:// and postgresql:// URLs"""
+    for prefix, driver in (
+        ("sqlite://", "sqlite+aiosqlite://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("postgres://", "postgresql+asyncpg://"),
+    ):
+        if dsn.startswith(prefix):
+            return driver + dsn[len(prefix):]
+    return dsn
+
+def _utcnow() -> datetime:
+    # Naive UTC, like SQLite's CURRENT_TIMESTAMP
+    return datetime.utcnow()
+
+def _format_timestamp(value: Any) -> Any:
+    # Whole seconds print exactly as SQLite stores them; PostgreSQL keeps microseconds
+    return value.isoformat(sep=" ") if isinstance(value, datetime) else value
+
+def _row_to_card(row) -> Dict[str, Any]:
+    card = dict(row._mapping)
+    for field, default in JSON_CARD_FIELDS.items():
+        if field in card:
+            card[field] = loads(card[field]) if card[field] else default()
+    if "created_at" in card:
+        card["created_at"] = _format_timestamp(card["created_at"])
+    return card
+
+class SQLAlchemyStorage(Storage):
+    """Async SQLAlchemy Core storage for SQLite (aiosqlite) or PostgreSQL (asyncpg)
+
+    Writes on SQLite are serialised in-process like DatabaseManager's single
+    writer; on PostgreSQL they run concurrently across the pool.
+    """
+
+    def __init__(self, dsn: str):
+        self.dsn = async_dsn(dsn)
+        self.pool_size = int(os.getenv("STORAGE_POOL_SIZE", "10"))
+        self.max_overflow = int(os.getenv("STORAGE_MAX_OVERFLOW", "10"))
+        self.pool_timeout = float(os.getenv("STORAGE_POOL_TIMEOUT_SECONDS", "10"))
+        self.pool_recycle = int(os.getenv("STORAGE_POOL_RECYCLE_SECONDS", "1800"))
+
+        self.engine: Optional[AsyncEngine] = None
+        self.is_sqlite = self.dsn.startswith("sqlite")
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+
+    async def connect(self):
+        async with self._open_lock:
+            if self.engine is not None:
+                return
+            self.engine = create_async_engine(
+                self.dsn,
+                pool_size=self.pool_size,
+                max_overflow=self.max_overflow,
+                pool_timeout=self.pool_timeout,
+                pool_recycle=self.pool_recycle,
+                # Drops connections the server closed while idle instead of failing a request
+                pool_pre_ping=True
+            )
+            if self.is_sqlite:
+                event.listen(self.engine.sync_engine, "connect", self._apply_pragmas)
+
+    @staticmethod
+    def _apply_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for pragma in CONNECTION_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+    async def close(self):
+        async with self._open_lock:
+            if self.engine is not None:
+                await self.engine.dispose()
+                self.engine = None
+
+    @asynccontextmanager
+    async def _write(self, operation: str = "write"):
+        """A transaction, committed on success; exclusive on SQLite"""
+        if self.engine is None:
+            await self.connect()
+        with timed("db", operation):
+            async with self._write_lock if self.is_sqlite else nullcontext():
+                async with self.engine.begin() as conn:
+                    yield conn
+
+    @asynccontextmanager
+    async def _read(self, operation: str = "read"):
+        if self.engine is None:
+            await self.connect()
+        with timed("db", operation):
+            async with self.engine.connect() as conn:
+                yield conn
+
+    def _insert(self, table: Table):
+        return (sqlite.insert if self.is_sqlite else postgresql.insert)(table)
+
+    def _upsert(self, table: Table, keys: List[str], columns: List[str]):
+        stmt = self._insert(table)
+        return stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={column: stmt.excluded[column] for column in columns}
+        )
+
+    async def init_db(self):
+        if self.engine is None:
+            await self.connect()
+        if self.is_sqlite:
+            # One schema history per SQLite file, whichever backend opens it:
+            # DatabaseManager's migrations also upgrade and backfill older files
+            migrator = DatabaseManager(self.engine.url.database, readers=1)
+            try:
+                await migrator.init_db()
+            finally:
+                await migrator.close()
+        else:
+            async with self._write("init_db") as conn:
+                await conn.run_sync(metadata.create_all)
+        logger.info("Storage initialized (%s)", self.engine.dialect.name)
+
+    async def ping(self):
+        async with self._read("ping") as conn:
+            await conn.execute(select(1))
+
+    # Cards
+
+    @staticmethod
+    def _card_row(card: Dict[str, Any], user_id: str, created_at: datetime) -> Dict[str, Any]:
+        return {
+            "card_id": card['card_id'],
+            "type": card['type'],
+            "title": card['title'],
+            "description": card.get('description', ''),
+            "primary_action": dumps(card.get('primary_action', {})),
+            "alternatives": dumps(card.get('alternatives', [])),
+            "metadata": dumps(card.get('metadata', {})),
+            "status": card.get('status', 'pending'),
+            "user_id": card.get('user_id', user_id),
+            "created_at": created_at
+        }
+
+    def _store_cards_statement(self):
+        # Replacing a card resets it, as INSERT OR REPLACE does in DatabaseManager
+        return self._upsert(cards, ["card_id"], [c for c in CARD_COLUMNS if c != "card_id"])
+
+    async def store_card(self, card_data: Dict[str, Any]) -> bool:
+        try:
+            async with self._write("store_card") as conn:
+                await conn.execute(
+                    self._store_cards_statement(),
+                    [self._card_row(card_data, 'default_user', _utcnow())]
+                )
+                return True
+        except Exception as e:
+            logger.error("Error storing card: %s", e)
+            return False
+
+    async def store_captures(self, captures: List[Tuple[str, str, List[Dict]]]) -> bool:
+        try:
+            now = _utcnow()
+            card_rows = [
+                self._card_row(card, user_id, now)
+                for _, user_id, capture_cards in captures for card in capture_cards
+            ]
+            async with self._write("store_captures") as conn:
+                if card_rows:
+                    await conn.execute(self._store_cards_statement(), card_rows)
+                await self._write_sessions(conn, captures, now)
+                return True
+        except Exception as e:
+            logger.error("Error storing capture: %s", e)
+            return False
+
+    async def get_card(self, card_id: str) -> Optional[Dict]:
+        try:
+            async with self._read("get_card") as conn:
+                result = await conn.execute(
+                    select(*(cards.c[c] for c in CARD_COLUMNS)).where(cards.c.card_id == card_id)
+                )
+                row = result.first()
+                return _row_to_card(row) if row is not None else None
+        except Exception as e:
+            logger.error("Error getting card: %s", e)
+            return None
+
+    async def get_cards(self, card_ids: List[str]) -> List[Dict]:
+        if not card_ids:
+            return []
+        try:
+            async with self._read("get_cards") as conn:
+                result = await conn.execute(
+                    select(*(cards.c[c] for c in CARD_COLUMNS)).where(cards.c.card_id.in_(list(card_ids)))
+                )
+                return [_row_to_card(row) for row in result]
+        except Exception as e:
+            logger.error("Error getting cards: %s", e)
+            return []
+
+    async def get_user_cards(self, user_id: str) -> List[Dict]:
+        try:
+            async with self._read("get_user_cards") as conn:
+                result = await conn.execute(
+                    select(*(cards.c[c] for c in CARD_FIELDS))
+                    .where(cards.c.user_id == user_id)
+                    .order_by(cards.c.created_at.desc())
+                )
+                return [_row_to_card(row) for row in result]
+        except Exception as e:
+            logger.error("Error getting user cards: %s", e)
+            return []
+
+    async def get_user_cards_page(
+        self,
+        user_id: str,
+        limit: int = 50,
+        before: Optional[str] = None,
+        statuses: Optional[List[str]] = None,
+        card_type: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        fields = [f for f in (fields or CARD_FIELDS) if f in CARD_FIELDS] or list(CARD_FIELDS)
+        columns = list(dict.fromkeys(fields + ["created_at"]))
+
+        query = select(cards.c.id, *(cards.c[c] for c in columns)).where(cards.c.user_id == user_id)
+        if statuses:
+            query = query.where(cards.c.status.in_(statuses))
+        if card_type:
+            query = query.where(cards.c.type == card_type)
+        if before:
+            created_at, row_id = decode_cursor(before)
+            try:
+                created_at = datetime.fromisoformat(created_at)
+            except ValueError:
+                raise ValueError("Invalid cursor")
+            query = query.where(or_(
+                cards.c.created_at < created_at,
+                and_(cards.c.created_at == created_at, cards.c.id < row_id)
+            ))
+        query = query.order_by(cards.c.created_at.desc(), cards.c.id.desc()).limit(limit + 1)
+
+        async with self._read("get_user_cards_page") as conn:
+            rows = (await conn.execute(query)).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(_format_timestamp(rows[-1].created_at), rows[-1].id)
+
+        page = []
+        for row in rows:
+            card = _row_to_card(row)
+            page.append({field: card[field] for field in fields})
+        return {"cards": page, "next_cursor": next_cursor}
+
+    async def update_card_status(self, card_id: str, status: str):
+        try:
+            async with self._write("update_card_status") as conn:
+                await conn.execute(update(cards).where(cards.c.card_id == card_id).values(status=status))
+                return True
+        except Exception as e:
+            logger.error("Error updating card status: %s", e)
+            return False
+
+    async def update_card(self, card: Dict[str, Any]) -> bool:
+        return await self._update_cards([card], "update_card")
+
+    async def update_cards(self, cards_to_update: List[Dict[str, Any]]) -> bool:
+        return await self._update_cards(cards_to_update, "update_cards")
+
+    async def _update_cards(self, cards_to_update: List[Dict[str, Any]], operation: str) -> bool:
+        if not cards_to_update:
+            return True
+        try:
+            rows = []
+            for card in cards_to_update:
+                row = self._card_row(card, card.get('user_id', ''), _utcnow())
+                rows.append({"target_id": card['card_id'], **{c: row[c] for c in EDITABLE_COLUMNS}})
+            async with self._write(operation) as conn:
+                await conn.execute(
+                    update(cards)
+                    .where(cards.c.card_id == bindparam("target_id"))
+                    .values({c: bindparam(c) for c in EDITABLE_COLUMNS}),
+                    rows
+                )
+                return True
+        except Exception as e:
+            logger.error("Error updating card: %s", e)
+            return False
+
+    async def modify_card(self, card_id: str, change: Callable[[Dict], Dict]) -> Optional[Dict]:
+        async with self._write("modify_card") as conn:
+            query = select(*(cards.c[c] for c in CARD_COLUMNS)).where(cards.c.card_id == card_id)
+            if self.is_sqlite:
+                # A no-op write first takes SQLite's write lock before the read
+                await conn.execute(
+                    update(cards).where(cards.c.card_id == card_id).values(card_id=cards.c.card_id)
+                )
+            else:
+                query = query.with_for_update()
+            row = (await conn.execute(query)).first()
+            if row is None:
+                return None
+            updated = change(_row_to_card(row))
+            values = self._card_row(updated, updated.get('user_id', ''), _utcnow())
+            await conn.execute(
+                update(cards)
+                .where(cards.c.card_id == card_id)
+                .values({c: values[c] for c in EDITABLE_COLUMNS})
+            )
+            return updated
+
+    # Sessions
+
+    async def _write_sessions(self, conn: AsyncConnection, captures: List[Tuple[str, str, List[Dict]]], now: datetime):
+        if not captures:
+            return
+        session_ids = [session_id for session_id, _, _ in captures]
+        await conn.execute(
+            self._upsert(user_sessions, ["session_id"], ["user_id"]),
+            [{"session_id": session_id, "user_id": user_id, "created_at": now} for session_id, user_id, _ in captures]
+        )
+        await conn.execute(delete(session_cards).where(session_cards.c.session_id.in_(session_ids)))
+        links = [
+            {"session_id": session_id, "card_id": card['card_id'], "position": position}
+            for session_id, _, capture_cards in captures
+            for position, card in enumerate(capture_cards)
+        ]
+        if links:
+            await conn.execute(self._upsert(session_cards, ["session_id", "card_id"], ["position"]), links)
+
+    async def store_session(self, session_id: str, user_id: str, cards_in_session: List[Dict]):
+        try:
+            async with self._write("store_session") as conn:
+                await self._write_sessions(conn, [(session_id, user_id, cards_in_session)], _utcnow())
+        except Exception as e:
+            logger.error("Error storing session: %s", e)
+
+    async def get_session_cards(self, session_id: str) -> List[Dict]:
+        try:
+            async with self._read("get_session_cards") as conn:
+                result = await conn.execute(
+                    select(*(cards.c[c] for c in CARD_FIELDS))
+                    .select_from(session_cards.join(cards, cards.c.card_id == session_cards.c.card_id))
+                    .where(session_cards.c.session_id == session_id)
+                    .order_by(session_cards.c.position)
+                )
+                return [_row_to_card(row) for row in result]
+        except Exception as e:
+            logger.error("Error getting session cards: %s", e)
+            return []
+
+    # User context and cached generations
+
+    async def get_user_context(self, user_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            async with self._read("get_user_context") as conn:
+                result = await conn.execute(
+                    select(user_preferences.c.preferences, user_preferences.c.gemini_context)
+                    .where(user_preferences.c.user_id == user_id)
+                )
+                row = result.first()
+                if row is None:
+                    return None
+                return {
+                    "preferences": loads(row.preferences) if row.preferences else {},
+                    "context": loads(row.gemini_context) if row.gemini_context else {}
+                }
+        except Exception as e:
+            logger.error("Error getting user context: %s", e)
+            return None
+
+    async def store_user_context(
+        self,
+        user_id: str,
+        preferences: Optional[Dict[str, Any]] = None,
+        context: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        try:
+            stmt = self._insert(user_preferences).values(
+                user_id=user_id,
+                preferences=dumps(preferences) if preferences is not None else None,
+                gemini_context=dumps(context) if context is not None else None,
+                last_updated=_utcnow()
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={
+                    "preferences": func.coalesce(stmt.excluded.preferences, user_preferences.c.preferences),
+                    "gemini_context": func.coalesce(stmt.excluded.gemini_context, user_preferences.c.gemini_context),
+                    "last_updated": stmt.excluded.last_updated
+                }
+            )
+            async with self._write("store_user_context") as conn:
+                await conn.execute(stmt)
+                return True
+        except Exception as e:
+            logger.error("Error storing user context: %s", e)
+            return False
+
+    async def append_user_history(
+        self,
+        user_id: str,
+        decision: Dict[str, Any],
+        max_history: int
+    ) -> Optional[List[Dict]]:
+        try:
+            async with self._write("append_user_history") as conn:
+                query = select(user_preferences.c.gemini_context).where(user_preferences.c.user_id == user_id)
+                if self.is_sqlite:
+                    # A no-op write first takes SQLite's write lock before the read
+                    await conn.execute(
+                        update(user_preferences)
+                        .where(user_preferences.c.user_id == user_id)
+                        .values(user_id=user_preferences.c.user_id)
+                    )
+                else:
+                    query = query.with_for_update()
+                row = (await conn.execute(query)).first()
+                context = loads(row.gemini_context) if row and row.gemini_context else {}
+                history = (context.get("history", []) + [decision])[-max_history:]
+                context["history"] = history
+                stmt = self._insert(user_preferences).values(
+                    user_id=user_id,
+                    gemini_context=dumps(context),
+                    last_updated=_utcnow()
+                )
+                await conn.execute(stmt.on_conflict_do_update(
+                    index_elements=["user_id"],
+                    set_={
+                        "gemini_context": stmt.excluded.gemini_context,
+                        "last_updated": stmt.excluded.last_updated
+                    }
+                ))
+                return history
+        except Exception as e:
+            logger.error("Error appending user history: %s", e)
+            return None
+
+    async def get_cached_response(self, cache_key: str) -> Optional[Tuple[float, List[Dict]]]:
+        try:
+            async with self._read("get_cached_response") as conn:
+                result = await conn.execute(
+                    select(response_cache.c.cards, response_cache.c.expires_at)
+                    .where(response_cache.c.cache_key == cache_key, response_cache.c.expires_at > time.time())
+                )
+                row = result.first()
+                if row is None:
+                    return None
+                return row.expires_at, loads(row.cards)
+        except Exception as e:
+            logger.error("Error reading response cache: %s", e)
+            return None
+
+    async def store_cached_response(self, cache_key: str, cards_to_cache: List[Dict], expires_at: float):
+        try:
+            async with self._write("store_cached_response") as conn:
+                await conn.execute(
+                    self._upsert(response_cache, ["cache_key"], ["cards", "expires_at"]),
+                    [{"cache_key": cache_key, "cards": dumps(cards_to_cache), "expires_at": expires_at}]
+                )
+                await conn.execute(delete(response_cache).where(response_cache.c.expires_at <= time.time()))
+        except Exception as e:
+            logger.error("Error storing response cache: %s", e)
+
+    # Maintenance: used by the retention job, errors are left to the caller
+
+    async def purge_cards(self, status: str, older_than_seconds: float, limit: int, archive: bool = False) -> int:
+        cutoff = _utcnow() - timedelta(seconds=older_than_seconds)
+        async with self._write("purge_cards") as conn:
+            result = await conn.execute(
+                select(cards.c.card_id)
+                .where(cards.c.status == status, cards.c.created_at < cutoff)
+                .order_by(cards.c.created_at)
+                .limit(limit)
+            )
+            card_ids = list(result.scalars())
+            if not card_ids:
+                return 0
+
+            if archive:
+                await conn.execute(delete(cards_archive).where(cards_archive.c.card_id.in_(card_ids)))
+                await conn.execute(cards_archive.insert().from_select(
+                    list(CARD_COLUMNS),
+                    select(*(cards.c[c] for c in CARD_COLUMNS)).where(cards.c.card_id.in_(card_ids))
+                ))
+            await conn.execute(delete(session_cards).where(session_cards.c.card_id.in_(card_ids)))
+            await conn.execute(delete(cards).where(cards.c.card_id.in_(card_ids)))
+            return len(card_ids)
+
+    async def purge_sessions(self, older_than_seconds: float, limit: int) -> int:
+        cutoff = _utcnow() - timedelta(seconds=older_than_seconds)
+        linked = exists().where(session_cards.c.session_id == user_sessions.c.session_id)
+        async with self._write("purge_sessions") as conn:
+            result = await conn.execute(
+                select(user_sessions.c.session_id)
+                .where(or_(user_sessions.c.created_at < cutoff, ~linked))
+                .limit(limit)
+            )
+            session_ids = list(result.scalars())
+            if not session_ids:
+                return 0
+
+            await conn.execute(delete(session_cards).where(session_cards.c.session_id.in_(session_ids)))
+            await conn.execute(delete(user_sessions).where(user_sessions.c.session_id.in_(session_ids)))
+            return len(session_ids)
+
+    async def compact(self, vacuum_pages: int = 0, checkpoint: str = "PASSIVE") -> Dict[str, Any]:
+        """SQLite: incremental vacuum and WAL checkpoint; PostgreSQL relies on autovacuum"""
+        if not self.is_sqlite:
+            return {}
+        async with self._sqlite_connection("compact") as db:
+            return await compact_sqlite(db, vacuum_pages, checkpoint)
+
+    async def auto_vacuum_mode(self) -> Optional[str]:
+        if not self.is_sqlite:
+            return None
+        async with self._sqlite_connection("auto_vacuum_mode") as db:
+            return await sqlite_auto_vacuum_mode(db)
+
+    async def enable_incremental_vacuum(self):
+        if not self.is_sqlite:
+            return
+        async with self._sqlite_connection("enable_incremental_vacuum") as db:
+            await enable_sqlite_incremental_vacuum(db)
+
+    @asynccontextmanager
+    async def _sqlite_connection(self, operation: str):
+        """The pooled aiosqlite connection itself, for PRAGMAs that must run outside a transaction"""
+        if self.engine is None:
+            await self.connect()
+        with timed("db", operation):
+            async with self._write_lock:
+                async with self.engine.connect() as conn:
+                    raw = await conn.get_raw_connection()
+                    yield raw.driver_connection
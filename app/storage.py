@@ -0,0 +1,170 @@
+# app/storage.py
+import base64
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Columns a card listing may project, and which of them hold JSON
+CARD_FIELDS = (
+    "card_id", "type", "title", "description", "primary_action",
+    "alternatives", "metadata", "status", "created_at",
+)
+JSON_CARD_FIELDS = {"primary_action": dict, "alternatives": list, "metadata": dict}
+
+def encode_cursor(created_at: str, row_id: int) -> str:
+    raw = f"{created_at}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Parse an opaque page cursor; raises ValueError if it is malformed"""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return created_at, int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+class Storage:
+    """Persistence for cards, sessions, user context and cached generations
+
+    Read and write methods log and return an empty result on failure;
+    get_user_cards_page raises ValueError for a bad cursor, and
+    modify_card and the maintenance methods (purge_*, compact) raise.
+    """
+
+    async def connect(self):
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+    async def init_db(self):
+        raise NotImplementedError
+
+    async def ping(self):
+        raise NotImplementedError
+
+    # Cards
+
+    async def store_card(self, card_data: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    async def store_capture(self, session_id: str, user_id: str, cards: List[Dict]) -> bool:
+        """Store a capture's cards and its session in a single transaction"""
+        return await self.store_captures([(session_id, user_id, cards)])
+
+    async def store_captures(self, captures: List[Tuple[str, str, List[Dict]]]) -> bool:
+        raise NotImplementedError
+
+    async def get_card(self, card_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def get_cards(self, card_ids: List[str]) -> List[Dict]:
+        """Several cards in one query; unknown ids are skipped"""
+        raise NotImplementedError
+
+    async def get_user_cards(self, user_id: str) -> List[Dict]:
+        raise NotImplementedError
+
+    async def get_user_cards_page(
+        self,
+        user_id: str,
+        limit: int = 50,
+        before: Optional[str] = None,
+        statuses: Optional[List[str]] = None,
+        card_type: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def update_card_status(self, card_id: str, status: str):
+        raise NotImplementedError
+
+    async def update_card(self, card: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    async def update_cards(self, cards: List[Dict[str, Any]]) -> bool:
+        """Persist several cards in a single transaction"""
+        raise NotImplementedError
+
+    async def modify_card(self, card_id: str, change: Callable[[Dict], Dict]) -> Optional[Dict]:
+        """Read a card, apply change to it and write the result in one transaction
+
+        The write lock is taken before the read, so a change made meanwhile
+        by another worker is never overwritten. Returns the written card, or
+        None if there is no such card; an exception from change rolls back.
+        """
+        raise NotImplementedError
+
+    # Sessions
+
+    async def store_session(self, session_id: str, user_id: str, cards: List[Dict]):
+        raise NotImplementedError
+
+    async def get_session_cards(self, session_id: str) -> List[Dict]:
+        raise NotImplementedError
+
+    # User context and cached generations
+
+    async def get_user_context(self, user_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def store_user_context(
+        self,
+        user_id: str,
+        preferences: Optional[Dict[str, Any]] = None,
+        context: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        raise NotImplementedError
+
+    async def append_user_history(
+        self,
+        user_id: str,
+        decision: Dict[str, Any],
+        max_history: int
+    ) -> Optional[List[Dict]]:
+        """Append a decision to the stored context history, keeping the last max_history
+
+        Read and written in one transaction under the write lock, so decisions
+        recorded by other workers are kept. Returns the new history, or None.
+        """
+        raise NotImplementedError
+
+    async def get_cached_response(self, cache_key: str) -> Optional[Tuple[float, List[Dict]]]:
+        raise NotImplementedError
+
+    async def store_cached_response(self, cache_key: str, cards: List[Dict], expires_at: float):
+        raise NotImplementedError
+
+    # Maintenance
+
+    async def purge_cards(self, status: str, older_than_seconds: float, limit: int, archive: bool = False) -> int:
+        raise NotImplementedError
+
+    async def purge_sessions(self, older_than_seconds: float, limit: int) -> int:
+        raise NotImplementedError
+
+    async def compact(self, vacuum_pages: int = 0, checkpoint: str = "PASSIVE") -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def auto_vacuum_mode(self) -> Optional[str]:
+        """SQLite auto_vacuum mode; None where it does not apply"""
+        return None
+
+    async def enable_incremental_vacuum(self):
+        pass
+
+def create_storage() -> Storage:
+    """Pick the backend from STORAGE_BACKEND (sqlite or sqlalchemy)
+
+    sqlite is the aiosqlite DatabaseManager on SERA_DB_PATH; sqlalchemy
+    connects to DATABASE_URL (SQLite or PostgreSQL) and defaults to the
+    same SQLite file.
+    """
+    backend = os.getenv("STORAGE_BACKEND", "sqlite").lower()
+    if backend == "sqlite":
+        from app.database import DatabaseManager
+        return DatabaseManager()
+    if backend == "sqlalchemy":
+        from app.sql_storage import SQLAlchemyStorage
+        dsn = os.getenv("DATABASE_URL") or f"sqlite:///{os.getenv('SERA_DB_PATH', 'sera.db')}"
+        return SQLAlchemyStorage(dsn)
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}'")
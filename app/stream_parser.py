@@ -0,0 +1,97 @@
+# app/stream_parser.py
+import json
+from typing import Any, Dict, List, Optional
+
+class CardStreamParser:
+    """Incrementally pulls complete card objects out of a streamed {"cards": [...]} reply"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.index = 0            # number of cards completed so far
+        self.errors = 0           # card objects that were not valid JSON
+        self._pos = 0             # next character of buffer to scan
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Consume a chunk; return partial/complete events it produced"""
+        self.buffer += chunk
+        events: List[Dict[str, Any]] = []
+        if self._done:
+            return events
+
+        if not self._in_array and not self._find_array():
+            return events
+
+        buffer = self.buffer
+        i = self._pos
+        while i < len(buffer):
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._start is not None:
+                    events.append(self._complete(buffer[self._start:i + 1]))
+                    self._start = None
+            elif char == "]" and self._depth == 0:
+                self._done = True
+                i += 1
+                break
+            i += 1
+        self._pos = i
+
+        if self._start is not None:
+            events.append({
+                "event": "partial",
+                "index": self.index,
+                "received": self._pos - self._start
+            })
+        return events
+
+    def _find_array(self) -> bool:
+        """Locate the opening bracket of the cards array"""
+        key = self.buffer.find('"cards"')
+        if key != -1:
+            bracket = self.buffer.find("[", key)
+        else:
+            # Tolerate a bare array, optionally inside a ```json fence
+            stripped = self.buffer.lstrip()
+            if stripped.startswith("```"):
+                newline = stripped.find("\n")
+                if newline == -1:
+                    return False
+                stripped = stripped[newline + 1:].lstrip()
+            if not stripped.startswith("["):
+                return False
+            bracket = self.buffer.find("[")
+        if bracket == -1:
+            return False
+        self._in_array = True
+        self._pos = bracket + 1
+        return True
+
+    def _complete(self, text: str) -> Dict[str, Any]:
+        try:
+            card = json.loads(text)
+        except json.JSONDecodeError:
+            self.errors += 1
+            return {"event": "invalid", "index": self.index}
+        event = {"event": "complete", "index": self.index, "card": card}
+        self.index += 1
+        return event
@@ -36,6 +36,8 @@ async def test_database():
     try:
         from app.database import DatabaseManager
         db = DatabaseManager()
+        await db.connect()
+        await db.init_db()
         
         # Test card storage
         test_card = {
@@ -48,7 +50,8 @@ async def test_database():
             "user_id": "test_user"
         }
         
-        success = db.store_card(test_card)
+        success = await db.store_card(test_card)
+        await db.close()
         print(f"✅ Database test: {'Passed' if success else 'Failed'}")
         return success
     except Exception as e:
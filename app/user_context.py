@@ -0,0 +1,210 @@
+# app/user_context.py
+import asyncio
+import hashlib
+import os
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from app.metrics import CACHE_REQUESTS, CONTEXT_TOKENS
+from app.models import UserPreference
+
+# Decisions worth learning from; snoozes and edits say little about taste
+RECORDED_STATUSES = ("accepted", "rejected")
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: ~4 characters per token"""
+    return (len(text) + 3) // 4
+
+def user_timezone(preferences: Dict[str, Any]) -> Optional[ZoneInfo]:
+    """The user's timezone preference, or None for UTC"""
+    name = preferences.get("timezone")
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+def _part_of_day(start_time: Optional[str]) -> Optional[str]:
+    try:
+        hour = datetime.fromisoformat(start_time).hour
+    except (TypeError, ValueError):
+        return None
+    if hour < 12:
+        return "morning"
+    return "afternoon" if hour < 17 else "evening"
+
+class UserContextStore:
+    """Per-user preferences plus a rolling summary of card decisions
+
+    Persisted in user_preferences (preferences / gemini_context), cached in
+    memory and rendered into a compact prompt block under a token budget.
+    Each worker caches its own copy, so entries expire after a short TTL to
+    pick up changes made through other workers.
+    """
+
+    def __init__(
+        self,
+        db,
+        max_entries: Optional[int] = None,
+        max_history: Optional[int] = None,
+        token_budget: Optional[int] = None,
+        ttl_seconds: Optional[float] = None
+    ):
+        self.db = db
+        self.max_entries = max_entries or int(os.getenv("USER_CONTEXT_CACHE_SIZE", "10000"))
+        self.max_history = max_history or int(os.getenv("USER_CONTEXT_HISTORY", "20"))
+        self.token_budget = token_budget or int(os.getenv("USER_CONTEXT_TOKEN_BUDGET", "200"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("USER_CONTEXT_TTL_SECONDS", "60"))
+
+        # user_id -> {"preferences": {...}, "history": [...], "prompt": rendered context or None,
+        #             "expires_at": monotonic deadline}
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Keeps this worker's cached histories in the order they were appended
+        self._lock = asyncio.Lock()
+
+        self.expirations = 0
+
+    async def get(self, user_id: str) -> Dict[str, Any]:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            if entry["expires_at"] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                CACHE_REQUESTS.inc(cache="user_context", result="hit")
+                return entry
+            self.invalidate(user_id)
+            self.expirations += 1
+
+        CACHE_REQUESTS.inc(cache="user_context", result="miss")
+        stored = await self.db.get_user_context(user_id) or {}
+        entry = {
+            "preferences": stored.get("preferences") or {},
+            "history": (stored.get("context") or {}).get("history", []),
+            "prompt": None
+        }
+        self._remember(user_id, entry)
+        return entry
+
+    async def get_preferences(self, user_id: str) -> UserPreference:
+        entry = await self.get(user_id)
+        return UserPreference(user_id=user_id, **entry["preferences"])
+
+    async def set_preferences(self, preferences: UserPreference) -> bool:
+        data = preferences.model_dump(exclude={"user_id"})
+        if not await self.db.store_user_context(preferences.user_id, preferences=data):
+            return False
+        self.invalidate(preferences.user_id)
+        return True
+
+    async def record_action(self, card: Dict[str, Any], status: str) -> bool:
+        """Fold an accepted/rejected card into the user's rolling history"""
+        user_id = card.get("user_id")
+        if status not in RECORDED_STATUSES or not user_id:
+            return False
+
+        decision = {
+            "status": status,
+            "type": card.get("type"),
+            "title": (card.get("title") or "")[:60],
+            "start_time": (card.get("primary_action") or {}).get("start_time")
+        }
+        async with self._lock:
+            # Appended in the database, not to the cached copy, which may miss
+            # decisions recorded by other workers
+            history = await self.db.append_user_history(user_id, decision, self.max_history)
+            if history is None:
+                self.invalidate(user_id)
+                return False
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry["history"] = history
+                entry["prompt"] = None
+        return True
+
+    def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
+
+    async def prompt_context(self, user_id: str) -> Dict[str, Any]:
+        """Rendered context for prompts: {"text", "tokens", "fingerprint"}"""
+        entry = await self.get(user_id)
+        if entry["prompt"] is None:
+            text = self.render(entry["preferences"], entry["history"])
+            entry["prompt"] = {
+                "text": text,
+                "tokens": estimate_tokens(text),
+                # Part of the response cache key: same text + same context = same cards
+                "fingerprint": hashlib.sha256(text.encode("utf-8")).hexdigest()[:16] if text else ""
+            }
+        CONTEXT_TOKENS.observe(entry["prompt"]["tokens"])
+        return entry["prompt"]
+
+    def render(self, preferences: Dict[str, Any], history: List[Dict[str, Any]]) -> str:
+        """Most useful lines first, stopping before the token budget is exceeded"""
+        lines = self._preference_lines(preferences) + self._summary_lines(history)
+        lines += [self._decision_line(decision) for decision in reversed(history)]
+
+        kept: List[str] = []
+        used = estimate_tokens("User context:")
+        for line in lines:
+            cost = estimate_tokens(line) + 1
+            if used + cost > self.token_budget:
+                break
+            kept.append(line)
+            used += cost
+        return "User context:\n" + "\n".join(kept) if kept else ""
+
+    @staticmethod
+    def _preference_lines(preferences: Dict[str, Any]) -> List[str]:
+        lines = []
+        if preferences.get("timezone"):
+            lines.append(f"- Timezone: {preferences['timezone']}")
+        if preferences.get("working_hours"):
+            hours = ", ".join(f"{k} {v}" for k, v in preferences["working_hours"].items())
+            lines.append(f"- Working hours: {hours}")
+        if preferences.get("preferred_meeting_times"):
+            lines.append(f"- Preferred meeting times: {', '.join(preferences['preferred_meeting_times'])}")
+        if preferences.get("scheduling_rules"):
+            rules = "; ".join(f"{k}: {v}" for k, v in preferences["scheduling_rules"].items())
+            lines.append(f"- Rules: {rules}")
+        if preferences.get("energy_patterns"):
+            energy = ", ".join(f"{k} {v}" for k, v in preferences["energy_patterns"].items())
+            lines.append(f"- Energy: {energy}")
+        return lines
+
+    @staticmethod
+    def _summary_lines(history: List[Dict[str, Any]]) -> List[str]:
+        if not history:
+            return []
+        decided = Counter(d["type"] for d in history)
+        accepted = Counter(d["type"] for d in history if d["status"] == "accepted")
+        rates = ", ".join(
+            f"{card_type} {accepted[card_type]}/{total}" for card_type, total in decided.most_common(4)
+        )
+        lines = [f"- Accepted by type: {rates}"]
+        parts = Counter(
+            part for part in (_part_of_day(d.get("start_time")) for d in history if d["status"] == "accepted")
+            if part
+        )
+        if parts:
+            lines.append(f"- Accepted times are mostly {parts.most_common(1)[0][0]}")
+        return lines
+
+    @staticmethod
+    def _decision_line(decision: Dict[str, Any]) -> str:
+        line = f'- {decision["status"]} {decision["type"]} "{decision["title"]}"'
+        if decision.get("start_time"):
+            line += f' at {decision["start_time"][:16]}'
+        return line
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "expirations": self.expirations}
+
+    def _remember(self, user_id: str, entry: Dict[str, Any]):
+        entry["expires_at"] = time.monotonic() + self.ttl_seconds
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
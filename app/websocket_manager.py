@@ -1,51 +1,264 @@
 from fastapi import WebSocket
-from typing import Dict, List
-import json
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+
+from app.codec import dumps
+from app.message_bus import BROADCAST_CHANNEL, LoopbackBus, MessageBus, user_channel
+from app.metrics import WS_DROPPED, timed
+
+logger = logging.getLogger(__name__)
+
+# What to do when a client's send queue is full
+SLOW_CONSUMER_POLICIES = ("drop", "coalesce", "disconnect")
+
+class _Connection:
+    """One socket with its own bounded send queue drained by a sender task"""
+
+    def __init__(self, websocket: WebSocket, user_id: str, manager: "ConnectionManager"):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.manager = manager
+        # (coalesce key, encoded frame)
+        self.queue: Deque[Tuple[Optional[str], str]] = deque()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def start(self):
+        self.task = asyncio.create_task(self._drain())
+
+    def enqueue(self, frame: str, key: Optional[str] = None) -> bool:
+        if self.closed:
+            return False
+        manager = self.manager
+
+        if len(self.queue) >= manager.max_queue:
+            manager.slow_consumer_events += 1
+            if manager.slow_consumer_policy == "disconnect":
+                manager.slow_disconnects += 1
+                WS_DROPPED.inc(reason="slow_disconnect")
+                asyncio.create_task(manager._close(self, code=1013))
+                return False
+            if manager.slow_consumer_policy == "drop":
+                manager.messages_dropped += 1
+                WS_DROPPED.inc(reason="queue_full")
+                return False
+            # coalesce: replace a queued update for the same thing, else drop the oldest
+            if key is not None:
+                for index, (queued_key, _) in enumerate(self.queue):
+                    if queued_key == key:
+                        # Superseded: drop the stale update, queue the latest last
+                        del self.queue[index]
+                        self.queue.append((key, frame))
+                        manager.messages_coalesced += 1
+                        self.wakeup.set()
+                        return True
+            self.queue.popleft()
+            manager.messages_dropped += 1
+            WS_DROPPED.inc(reason="queue_full")
+
+        self.queue.append((key, frame))
+        manager.max_queue_depth_seen = max(manager.max_queue_depth_seen, len(self.queue))
+        self.wakeup.set()
+        return True
+
+    async def _drain(self):
+        manager = self.manager
+        try:
+            while not self.closed:
+                await self.wakeup.wait()
+                while self.queue:
+                    _, frame = self.queue.popleft()
+                    started = time.perf_counter()
+                    with timed("ws", "send"):
+                        await asyncio.wait_for(
+                            self.websocket.send_text(frame), timeout=manager.send_timeout
+                        )
+                    manager._record_send(time.perf_counter() - started)
+                self.wakeup.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Dead or stuck connection: close it, so the client notices and reconnects
+            manager.send_failures += 1
+            WS_DROPPED.inc(reason="send_failed")
+            await manager._close(self, code=1011)
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.user_connections: Dict[str, List[str]] = {}
+    def __init__(self, bus: Optional[MessageBus] = None):
+        self.active_connections: Dict[int, _Connection] = {}
+        self.user_connections: Dict[str, List[int]] = {}
+
+        # Pushes go through the bus so any worker can reach any user's socket
+        self.bus = bus or LoopbackBus()
+        self._bus_started = False
+
+        self.max_queue = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+        self.send_timeout = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "5"))
+        self.slow_consumer_policy = os.getenv("WS_SLOW_CONSUMER_POLICY", "coalesce")
+        if self.slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"WS_SLOW_CONSUMER_POLICY must be one of {SLOW_CONSUMER_POLICIES}")
+
+        # Metrics
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.messages_coalesced = 0
+        self.slow_consumer_events = 0
+        self.slow_disconnects = 0
+        self.send_failures = 0
+        self.publish_failures = 0
+        self.max_queue_depth_seen = 0
+        self.send_seconds_total = 0.0
+        self.send_seconds_max = 0.0
+
+    async def start(self):
+        await self.bus.start(self._deliver)
+        await self.bus.subscribe(BROADCAST_CHANNEL)
+        self._bus_started = True
+
+    async def stop(self):
+        await self.close_all()
+        if self._bus_started:
+            await self.bus.stop()
+            self._bus_started = False
 
     async def connect(self, websocket: WebSocket, user_id: str):
+        if not self._bus_started:
+            await self.start()
         await websocket.accept()
+        connection = _Connection(websocket, user_id, self)
         connection_id = id(websocket)
-        self.active_connections[connection_id] = websocket
-        
+        self.active_connections[connection_id] = connection
+
         if user_id not in self.user_connections:
             self.user_connections[user_id] = []
+            await self.bus.subscribe(user_channel(user_id))
         self.user_connections[user_id].append(connection_id)
+        connection.start()
 
-    def disconnect(self, user_id: str):
-        if user_id in self.user_connections:
-            for connection_id in self.user_connections[user_id]:
-                self.active_connections.pop(connection_id, None)
-            del self.user_connections[user_id]
+    def disconnect(self, user_id: str, websocket: Optional[WebSocket] = None):
+        """Forget one socket, or every socket of the user when none is given"""
+        if websocket is not None:
+            connection = self.active_connections.get(id(websocket))
+            if connection is not None:
+                self._remove(connection)
+            return
+        for connection_id in list(self.user_connections.get(user_id, [])):
+            connection = self.active_connections.get(connection_id)
+            if connection is not None:
+                self._remove(connection)
 
     async def send_personal_message(self, message: dict, user_id: str):
-        if user_id in self.user_connections:
-            for connection_id in self.user_connections[user_id]:
-                websocket = self.active_connections.get(connection_id)
-                if websocket:
-                    try:
-                        await websocket.send_text(json.dumps(message))
-                    except Exception:
-                        # Remove dead connection
-                        self.user_connections[user_id].remove(connection_id)
-                        self.active_connections.pop(connection_id, None)
+        await self._publish(user_channel(user_id), message)
 
     async def broadcast(self, message: dict):
-        disconnected = []
-        for connection_id, websocket in self.active_connections.items():
+        await self._publish(BROADCAST_CHANNEL, message)
+
+    async def _publish(self, channel: str, message: dict):
+        """Best effort: a bus failure is logged and counted, never raised into the request"""
+        try:
+            if not self._bus_started:
+                await self.start()
+            with timed("ws", "publish"):
+                frame, key = self._encode(message)
+                # Envelope: coalesce key and frame, so receivers never re-parse the JSON
+                await self.bus.publish(channel, f"{key or ''}\n{frame}")
+        except Exception as e:
+            self.publish_failures += 1
+            WS_DROPPED.inc(reason="publish_failed")
+            logger.error("Message bus publish to %s failed: %s", channel, e)
+
+    async def _deliver(self, channel: str, payload: str):
+        """Queue a frame from the bus on the local sockets it is meant for"""
+        key, frame = payload.split("\n", 1)
+        if channel == BROADCAST_CHANNEL:
+            connections = list(self.active_connections.values())
+        else:
+            user_id = channel[len(user_channel("")):]
+            connections = [
+                self.active_connections.get(connection_id)
+                for connection_id in list(self.user_connections.get(user_id, ()))
+            ]
+        for connection in connections:
+            if connection:
+                connection.enqueue(frame, key or None)
+
+    async def reply(self, websocket: WebSocket, message: dict):
+        """Queue a message for one socket, keeping its frames in order"""
+        connection = self.active_connections.get(id(websocket))
+        if connection:
+            frame, key = self._encode(message)
+            connection.enqueue(frame, key)
+
+    async def close_all(self):
+        for connection in list(self.active_connections.values()):
+            self._remove(connection)
+
+    def stats(self) -> Dict[str, Any]:
+        queued = [len(c.queue) for c in self.active_connections.values()]
+        return {
+            "bus": type(self.bus).__name__,
+            "connections": len(self.active_connections),
+            "users": len(self.user_connections),
+            "queued_messages": sum(queued),
+            "max_queue_depth": max(queued, default=0),
+            "max_queue_depth_seen": self.max_queue_depth_seen,
+            "messages_sent": self.messages_sent,
+            "messages_dropped": self.messages_dropped,
+            "messages_coalesced": self.messages_coalesced,
+            "slow_consumer_events": self.slow_consumer_events,
+            "slow_disconnects": self.slow_disconnects,
+            "send_failures": self.send_failures,
+            "publish_failures": self.publish_failures,
+            "avg_send_ms": round(self.send_seconds_total / self.messages_sent * 1000, 3) if self.messages_sent else 0.0,
+            "max_send_ms": round(self.send_seconds_max * 1000, 3)
+        }
+
+    @staticmethod
+    def _encode(message: dict) -> Tuple[str, Optional[str]]:
+        """Serialize once per message; updates to the same card may coalesce"""
+        key = None
+        if message.get("card_id"):
+            key = f"{message.get('type')}:{message['card_id']}"
+        return dumps(message), key
+
+    def _record_send(self, seconds: float):
+        self.messages_sent += 1
+        self.send_seconds_total += seconds
+        self.send_seconds_max = max(self.send_seconds_max, seconds)
+
+    def _remove(self, connection: _Connection):
+        connection.closed = True
+        connection.queue.clear()
+        if connection.task is not None and connection.task is not asyncio.current_task():
+            connection.task.cancel()
+
+        connection_id = id(connection.websocket)
+        self.active_connections.pop(connection_id, None)
+        connections = self.user_connections.get(connection.user_id)
+        if connections and connection_id in connections:
+            connections.remove(connection_id)
+            if not connections:
+                del self.user_connections[connection.user_id]
+                if self._bus_started:
+                    asyncio.create_task(self._unsubscribe(connection.user_id))
+
+    async def _unsubscribe(self, user_id: str):
+        # The user may have reconnected while this was scheduled
+        if user_id not in self.user_connections:
             try:
-                await websocket.send_text(json.dumps(message))
-            except Exception:
-                disconnected.append(connection_id)
-        
-        # Clean up disconnected
-        for connection_id in disconnected:
-            self.active_connections.pop(connection_id, None)
-            # Remove from user_connections
-            for user_id, connections in self.user_connections.items():
-                if connection_id in connections:
-                    connections.remove(connection_id)
\ No newline at end of file
+                await self.bus.unsubscribe(user_channel(user_id))
+            except Exception as e:
+                logger.error("Message bus unsubscribe failed: %s", e)
+
+    async def _close(self, connection: _Connection, code: int = 1000):
+        self._remove(connection)
+        try:
+            # A stuck peer must not hold the closing task either
+            await asyncio.wait_for(connection.websocket.close(code=code), timeout=self.send_timeout)
+        except Exception:
+            pass